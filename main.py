@@ -13,6 +13,7 @@ import json
 import asyncio
 import threading
 from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
 from typing import Dict, Any
 from pathlib import Path
 import time
@@ -33,21 +34,36 @@ sys.path.extend([
 from param import get_enable_param, get_plugin_param
 from concurrency import set_recent_tid, reset_recent_tid, get_recent_tid
 
-from cost import increase_active_period, reset_active_period
+from cost import increase_active_period, reset_active_period, get_cost_stats
 from create_concurrency import create_background
 from create import create
 from debug import debug
 from debug_simple import get_initial_error_info
-from preview import preview
+from preview import preview, preview_progressive, get_preview_table
+from sample import get_sample
 from format import format_output, prepare_sql, format_modification
 from log import log
+from db_api import get_lane_count
+from query import Fingerprint, reset_profile, get_profile, get_fingerprint
+from cache import get_cache_stats
+from load import get_load
+from sample_table import maintain_sample_table
+from create_column import start_load_column_usage
+from deadline import (
+    start_deadline,
+    finish_stage,
+    mark_first_preview,
+    mark_superseded,
+    finish_deadline,
+    get_deadline_stats,
+)
 
 # -----------------------------------------------------------------------------
 # Global State
 # -----------------------------------------------------------------------------
 
-sql_to_preview: Dict[str, Dict[str, str]] = {
-    get_plugin_param()["cursor_identifier"]: {
+sql_to_preview: Dict[Fingerprint, Dict[str, str]] = {
+    get_fingerprint(get_plugin_param()["cursor_identifier"]): {
         "modification": "",
         "preview": "",
     }
@@ -65,39 +81,84 @@ async def main_inner(self, prepare_result: Dict[str, Any]) -> None:
         prepare_result: Result of SQL query preparation
     """
     global sql_to_preview
-    if prepare_result["sql"] in sql_to_preview:
+    sql_key = get_fingerprint(prepare_result["sql"])
+    if sql_key in sql_to_preview:
         print("exist", sql_to_preview)
-        self.send_json_response({"modification": format_modification(sql_to_preview[prepare_result["sql"]]["modification"])})
+        self.send_json_response(
+            {
+                "type": "modification",
+                "modification": format_modification(sql_to_preview[sql_key]["modification"]),
+            }
+        )
         return
 
+    start_deadline()
     try:
         set_recent_tid(prepare_result["priority"], prepare_result["sql"], "llm")
         
-        if prepare_result["sql"] in sql_to_preview:
+        if sql_key in sql_to_preview:
             return
         
         modification = await debug(prepare_result["sql"])
+        finish_stage("debug")
         
         if get_recent_tid("llm") == threading.get_ident():
             if modification is not None:
                 print("debug", modification)
-                self.send_json_response({"modification": format_modification(modification)})
+                self.send_json_response(
+                    {"type": "modification", "modification": format_modification(modification)}
+                )
             else:
-                self.send_json_response({"error_info": get_initial_error_info()})
+                self.send_json_response(
+                    {"type": "error", "error_info": get_initial_error_info()}
+                )
     finally:
         reset_recent_tid("llm")
     try:
         set_recent_tid(prepare_result["priority"], modification, "db")
         
-        if prepare_result["sql"] in sql_to_preview:
+        if sql_key in sql_to_preview:
             return
         
         rewrite = await create(modification)
-        preview_result = await preview(rewrite)
+        finish_stage("create")
+
+        def send_preview(event: Dict[str, Any]) -> None:
+            """
+            Push a preview as soon as it is ready, without waiting for the
+            final response. A preview is marked sampled if it, or a
+            temporary table it reads, is sampled.
+            """
+            mark_first_preview()
+            event = {
+                "type": "preview",
+                "modification": format_modification(modification),
+                "complete": False,
+                "show": True,
+                "sampled": get_sample(),
+                "ratio": None,
+                "error": None,
+                "final": True,
+            } | event
+            exact = event["final"] and not event["sampled"] and event["ratio"] in (None, 1.0)
+            event["phase"] = "exact" if exact else "sampled"
+            self.send_json_response(event)
+
+        if get_enable_param()["progressive"]:
+            preview_result = await preview_progressive(rewrite, send_preview)
+        else:
+            preview_result = await preview(rewrite)
+            if preview_result is not None and get_recent_tid("db") == threading.get_ident():
+                send_preview({"preview": preview_result, "table": get_preview_table()})
+        finish_stage("preview")
     finally:
+        if get_recent_tid("db") != threading.get_ident():
+            mark_superseded()
         reset_recent_tid("db")
+        # Forget the structured preview of this thread, it was sent already
+        get_preview_table()
     if preview_result is not None:
-        sql_to_preview[prepare_result["sql"]] = {
+        sql_to_preview[sql_key] = {
             "modification": modification,
             "preview": preview_result,
         }
@@ -122,28 +183,69 @@ class Handler(BaseHTTPRequestHandler):
             .get("content", "")
             .replace("\r\n", "\n")
         )
+        self.version = json.loads(raw_data).get("version")
         
         prepare_result = prepare_sql(input_sql)
         print("prepare_result", prepare_result)
         if prepare_result is not None:
             log("input.txt", prepare_result, is_dict=True)
             start_time = time.time()
+            reset_profile()
             asyncio.run(main_inner(self, prepare_result))
+            finish_deadline()
             result = format_output(prepare_result, sql_to_preview)
             latency = f"{time.time() - start_time:.2f}"
             log("record.txt", {"latency": latency, "input": input_sql, "output": result}, is_dict=True)
+            log("profile.txt", {"input": input_sql} | get_profile(), is_dict=True)
         else:
             result = format_output(prepare_result, sql_to_preview)
-        self.send_json_response(result)
+        self.send_json_response({"type": "complete"} | result)
+
+    def do_GET(self) -> None:
+        """
+        Return runtime statistics as JSON.
+
+        Example:
+            >>> curl "http://localhost:5000/stats?password=plugin_password"
+            {"cache": {"format": {"count": 12, "hit": 30, ...}, ...}, "load": {...}, "cost": {...}, "deadline": {...}}
+        """
+        url = urlparse(self.path)
+        password = parse_qs(url.query).get("password", [""])[0]
+        if url.path != "/stats" or password != get_plugin_param()["plugin_password"]:
+            self.send_error(404)
+            return
+
+        body = json.dumps(
+            {
+                "cache": get_cache_stats(),
+                "load": get_load(),
+                "cost": get_cost_stats(),
+                "deadline": get_deadline_stats(),
+            }
+        ).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
             
     def send_json_response(self, data: Dict[str, Any]) -> None:
-        """Send JSON response to client."""
+        """
+        Send an event to the client.
+
+        Each event has a "type" (modification, error, preview or complete),
+        a sequence number within the response, and the document version the
+        client sent with the request, so that the client can drop events of
+        an older version or that arrive out of order.
+        """
         if not hasattr(self, 'headers_sent'):
             self.send_response(200)
             self.send_header("Content-Type", "text/event-stream")
             self.send_header("Cache-Control", "no-cache")
             self.end_headers()
             self.headers_sent = True
+        self.seq = getattr(self, "seq", 0) + 1
+        data = {"seq": self.seq, "version": getattr(self, "version", None)} | data
         message = f"data: {json.dumps(data)}\n\n"
         self.wfile.write(message.encode("utf-8"))
         self.wfile.flush()
@@ -166,10 +268,19 @@ def SpeQL() -> None:
     )
 
     if get_enable_param()["background_thread"]:
-        threading.Thread(
-            target=lambda: asyncio.run(create_background()), 
-            daemon=True
-        ).start()
+        # Each background worker creates tables on a lane of its own
+        worker_count = min(plugin_params["background_worker_count"], get_lane_count())
+        for _ in range(max(worker_count, 1)):
+            threading.Thread(
+                target=lambda: asyncio.run(create_background()), 
+                daemon=True
+            ).start()
+
+    if get_enable_param()["sample_table"]:
+        threading.Thread(target=maintain_sample_table, daemon=True).start()
+
+    # Column usage of earlier runs, for ranking the columns of get_powerset
+    start_load_column_usage()
 
     server.serve_forever()
 # -----------------------------------------------------------------------------
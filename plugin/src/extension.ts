@@ -23,6 +23,9 @@ let previewHistory: Array<{ modCode: string; info: string }> = [];
 let debugHistoryIndex = -1;
 let debugHistory: Array<{ modCode: string; info: string }> = [];
 let isControlGroup = true;
+// Version of the latest request, and the last event seen of it
+let requestVersion = 0;
+let lastEventSeq = 0;
 
 function debounce(func: Function, wait: number) {
   let timeout: NodeJS.Timeout | undefined;
@@ -410,10 +413,13 @@ export function activate(context: vscode.ExtensionContext) {
     try {
       ipStatusBarItem.text = "SpeQL $(sync~spin)";
       lastSentContent = currentContent;
+      requestVersion += 1;
+      lastEventSeq = 0;
+      const version = requestVersion;
       const resp = await fetch(`http://${IP}`, {
         method: "POST",
         headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ content: currentContent }),
+        body: JSON.stringify({ content: currentContent, version: version }),
       });
 
       if (!resp.ok) {
@@ -461,7 +467,15 @@ export function activate(context: vscode.ExtensionContext) {
   };
 
   const handleResponse = (data: any, prefix: string, suffix: string) => {
-    if (!("complete" in data)) {
+    // Drop events of an older request, or that arrive out of order
+    if (data.version !== undefined && data.version !== null) {
+      if (data.version < requestVersion || data.seq <= lastEventSeq) {
+        return;
+      }
+      lastEventSeq = data.seq;
+    }
+
+    if (data.type == "modification" || data.type == "error") {
       lastUserInput = prefix + suffix;
       if ("modification" in data) {
         lastDebugModification = data.modification || "";
@@ -501,7 +515,7 @@ export function activate(context: vscode.ExtensionContext) {
       }
     }
 
-    if (data.complete) {
+    if (data.type == "complete") {
       if (data.show && !data.modification) {
         ipStatusBarItem.text = "SpeQL $(alert)";
       } else {
@@ -509,19 +523,43 @@ export function activate(context: vscode.ExtensionContext) {
       }
     }
 
-    if (data.show) {
+    if (data.type == "preview" && data.phase == "exact") {
+      ipStatusBarItem.text = "SpeQL $(check)";
+    } else if (data.type == "preview" && typeof data.ratio == "number") {
+      // Sampled preview: show how much of the data it is based on
+      const ratio = Math.round(data.ratio * 1000) / 10;
+      const error =
+        data.error === null || data.error === undefined
+          ? ""
+          : ` ±${Math.round(data.error * 1000) / 10}%`;
+      ipStatusBarItem.text = `SpeQL $(sync~spin) ${ratio}%${error}`;
+    }
+
+    if ((data.type == "preview" || data.type == "complete") && data.show) {
       lastUserInput = prefix + suffix;
       lastModification = data.modification || "";
       lastPreview = data.preview || "";
+      const isRefinement =
+        previewHistory.length > 0 &&
+        lastModification.trim() ==
+          previewHistory[previewHistory.length - 1].modCode.trim() &&
+        lastPreview != previewHistory[previewHistory.length - 1].info;
+      if (isRefinement) {
+        // A refined preview of the same query replaces the previous one
+        previewHistory[previewHistory.length - 1].info = lastPreview;
+      }
       if (
+        isRefinement ||
         previewHistory.length == 0 ||
         lastModification.trim() !=
           previewHistory[previewHistory.length - 1].modCode.trim()
       ) {
-        previewHistory.push({
-          modCode: lastModification,
-          info: lastPreview,
-        });
+        if (!isRefinement) {
+          previewHistory.push({
+            modCode: lastModification,
+            info: lastPreview,
+          });
+        }
 
         if (previewHistoryIndex == previewHistory.length - 2) {
           previewHistoryIndex = previewHistory.length - 1;
@@ -18,12 +18,13 @@ Key Features:
 """
 
 import sys
+import asyncio
 import threading
 import redshift_connector
 import re
 import sqlglot
 from pathlib import Path
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 
 # -----------------------------------------------------------------------------
 # Path Configuration
@@ -49,22 +50,39 @@ from param import get_plugin_param, get_dialect_param, get_enable_param
 from format import format
 from concurrency import (
     get_recent_tid,
+    check_recent_tid,
     set_background_create,
     get_execute_cursor_lock,
     get_priority,
 )
-from parse import get_parse, get_optimize
-from sample import reset_sample
+from parse import get_parse, get_optimize, replace_table_sql
+from query import Fingerprint, get_query, get_fingerprint, get_text_fingerprint
+from sample import reset_sample, set_sample
 from create_rewrite import rewrite, get_powerset, resolve_alias_conflict
 from param import get_max_iteration, get_test_param, get_db_param
 from log import log, append_test_info
-from sample import sample_script
-from create_execute import execute, drop_warm_up
+from sample import get_sample_script
+from load import get_sample_shift
+from cost import get_sample_time, add_warehouse_time
+from create_execute import (
+    execute,
+    drop_warm_up,
+    get_create_statement,
+    get_create_lock,
+    get_explain_cost,
+)
+from latency import get_initial_sample_time, update_latency
+from db_api import get_lane_count
 from extract import extract
-from create_struct import temporary_table_pool
+from create_struct import temporary_table_pool, cte_dict
 from dialect import support_rewrite
 from create_concurrency import cancel_running_query
-from create_rewrite import get_agg_func
+from create_rewrite import get_agg_func, split_window, merge_window
+from create_column import update_session_column_usage
+
+from sqlglot import exp
+
+SET_OPERATION = (exp.Union, exp.Intersect, exp.Except)
 
 
 # -----------------------------------------------------------------------------
@@ -72,6 +90,32 @@ from create_rewrite import get_agg_func
 # -----------------------------------------------------------------------------
 
 
+def get_create_ratio(create_script: str, sampling_ratio: float) -> Optional[float]:
+    """
+    Return the fraction of the rows of the data that a temporary table holds
+    (see TemporaryTablePool.get_ratio): the ratio it was sampled with, times
+    that of the temporary tables it reads.
+
+    Returns:
+        Optional[float]: None if the table aggregates, groups or deduplicates
+        a sample. Its rows are then not a sample of rows, and a query over it
+        cannot scale them.
+    """
+    try:
+        parsed = get_query(create_script, get_dialect_param()["endpoint"]).parse
+    except Exception:
+        return None if sampling_ratio < 1.0 else 1.0
+    ratio = temporary_table_pool.get_ratio(
+        f'"{table.name}"' for table in parsed.find_all(exp.Table)
+    )
+    if ratio is None:
+        return None
+    ratio *= sampling_ratio
+    if ratio < 1.0 and parsed.find(exp.AggFunc, exp.Group, exp.Distinct) is not None:
+        return None
+    return ratio
+
+
 async def rewrite_and_execute_inner(
     create_script: str, query_script: str
 ) -> Dict[str, Optional[str]]:
@@ -116,7 +160,7 @@ async def rewrite_and_execute_inner(
         if create_script == query_script:
 
             try:
-                get_parse(query_script).args.get("from").args.get("this")
+                get_query(query_script).parse.args.get("from").args.get("this")
                 select_list = extract(query_script)["select"]
                 select_list = [
                     f'{select_list[i]["alias"]} AS {select_list[i]["alias"]}'
@@ -163,23 +207,35 @@ async def rewrite_and_execute_inner(
         else 1
     )
 
-    for retry_count in range(max_iteration):
-        if get_recent_tid("db") != threading.get_ident():
+    check["name"] = temporary_table_pool.reserve_name(create_script)
+
+    # Start at the sample predicted to meet the latency target, see latency
+    full_cost = get_explain_cost(create_script) if max_iteration > 1 else None
+    initial_retry = get_initial_sample_time("create", full_cost, max_iteration - 1)
+
+    for retry_count in range(initial_retry, max_iteration):
+        if not check_recent_tid("db"):
             break
+        sampling_ratio = 1.0
         try:
-            sample_create_script = sample_script(create_script, retry_count)
-
-            with get_execute_cursor_lock():
+            # Sample harder when the budget runs low or the warehouse is saturated
+            sample_time = get_sample_time(retry_count) if max_iteration > 1 else 0
+            if sample_time > 0:
+                sample_time += get_sample_shift()
+            # An aggregated sample keeps its raw sums, see get_create_ratio
+            sample_create_script, sampling_ratio = get_sample_script(create_script, sample_time)
+
+            with get_create_lock():
                 if get_test_param()["warm_up"]:
                     # Warm up the query
                     create_metrics_warm_up = await execute(
-                        f"CREATE TEMPORARY TABLE {check['name']} AS {sample_create_script}",
+                        get_create_statement(check["name"], sample_create_script),
                         warm_up=True,
                     )
 
                     drop_warm_up(check["name"])
                 create_metrics = await execute(
-                    f"CREATE TEMPORARY TABLE {check['name']} AS {sample_create_script}",
+                    get_create_statement(check["name"], sample_create_script),
                     warm_up=False,
                 )
 
@@ -204,10 +260,13 @@ async def rewrite_and_execute_inner(
                         },
                     )
 
+            add_warehouse_time("create", create_metrics["elapsed_time"])
+            update_latency("create", full_cost, create_metrics["elapsed_time"], sampling_ratio)
             temporary_table_pool.update(
                 create_script,
-                is_sample=bool(retry_count),
+                is_sample=sampling_ratio < 1.0,
                 create_metrics=create_metrics,
+                ratio=get_create_ratio(create_script, sampling_ratio),
             )
 
             return {
@@ -227,6 +286,12 @@ async def rewrite_and_execute_inner(
                     "planning_time": -1,
                     "create_size": 0,
                 }
+                add_warehouse_time("create", create_metrics["elapsed_time"])
+                if check_recent_tid("db"):
+                    # A timeout, not a cancellation by newer input
+                    update_latency(
+                        "create", full_cost, create_metrics["elapsed_time"], sampling_ratio
+                    )
                 if get_test_param()["warm_up"]:
                     append_test_info(
                         "create",
@@ -287,6 +352,275 @@ async def rewrite_and_execute(script, metadata) -> Dict[str, Optional[str]]:
         return await rewrite_and_execute_inner(script, script)
 
 
+# -----------------------------------------------------------------------------
+# Main Query and Set Operation
+# -----------------------------------------------------------------------------
+
+
+async def rewrite_and_execute_main_query(script: str, urgent: bool) -> Optional[str]:
+    """
+    Rewrite a main query (or a branch of a set operation) and create a temporary
+    table for it if it has joins, filters, or grouping.
+
+    Args:
+        script: The (MainQuery) SQL query
+        urgent: Whether the user is waiting for the result
+
+    Returns:
+        Formatted and rewritten SQL query, or None if processing fails
+    """
+    """
+    Materialize the pre-window part of a query with window functions, and evaluate
+    the window functions over it.
+    """
+    split = split_window(script)
+    if split is not None:
+        inner_script = await rewrite_and_execute_main_query(split["inner"], urgent)
+        if inner_script is None:
+            return None
+        return merge_window(split["outer"], inner_script)
+
+    try:
+        get_query(script).parse.args.get("from").args.get("this")
+        extract_script = extract(script)
+        Pass = (
+            bool(extract_script["join"])
+            or bool(extract_script["where"])
+            or bool(extract_script["group"])
+        )
+
+    except Exception:
+        Pass = False
+
+    if not Pass:
+        return script
+
+    rewrite = await rewrite_and_execute(
+        format(script),
+        metadata={"is_main_query": True, "urgent": urgent},
+    )
+    return format(rewrite["script"]) if rewrite["script"] is not None else None
+
+
+async def rewrite_and_execute_set_operation(script: str, urgent: bool) -> Optional[str]:
+    """
+    Rewrite a set operation (UNION / INTERSECT / EXCEPT) branch by branch.
+
+    Each branch is a speculative unit of its own: it is rewritten and materialized
+    like a main query, and the set operation is composed over the rewritten branches.
+    When the user edits one branch, the other branches hit their existing temporary
+    tables, so only the edited branch is re-executed.
+
+    Args:
+        script: The set operation SQL query
+        urgent: Whether the user is waiting for the result
+
+    Returns:
+        Formatted and rewritten SQL query, or None if processing fails
+
+    Example:
+        >>> await rewrite_and_execute_set_operation(
+            'SELECT ... FROM "t1" AS "t1" WHERE ... UNION SELECT ... FROM "t2" AS "t2" WHERE ...',
+            urgent=False,
+        )
+        'SELECT ... FROM "SPEQL_TEMP_TABLE_1" AS ... UNION SELECT ... FROM "SPEQL_TEMP_TABLE_2" AS ...'
+    """
+    parsed = get_parse(script)
+
+    for arg in ["this", "expression"]:
+        branch = parsed.args.get(arg)
+
+        """
+        A branch with its own ORDER BY or LIMIT is wrapped in parentheses.
+
+        Example:
+            >>> (SELECT ... ORDER BY ... LIMIT 10) UNION SELECT ...
+        """
+        if isinstance(branch, exp.Subquery):
+            branch = branch.this
+
+        if isinstance(branch, SET_OPERATION):
+            rewrite_script = await rewrite_and_execute_set_operation(
+                format(branch.sql()), urgent
+            )
+        elif isinstance(branch, exp.Select):
+            rewrite_script = await rewrite_and_execute_main_query(
+                format(branch.sql()), urgent
+            )
+        else:
+            continue
+
+        if rewrite_script is None:
+            return None
+
+        branch.replace(get_parse(rewrite_script))
+
+    return format(parsed.sql())
+
+
+# -----------------------------------------------------------------------------
+# CTE Fingerprint
+# -----------------------------------------------------------------------------
+
+
+def get_cte_fingerprint(
+    cte: exp.CTE, cte_script: str, fingerprint_dict: Dict[str, Fingerprint]
+) -> Fingerprint:
+    """
+    Fingerprint a CTE together with every CTE it depends on.
+
+    The fingerprint covers the CTE text and the fingerprints of the earlier
+    CTEs it reads from, which in turn cover their own upstream CTEs. An edit
+    therefore changes the fingerprint of the edited CTE and of the CTEs
+    downstream of it, and nothing else.
+
+    Args:
+        cte: The CTE expression
+        cte_script: The CTE body before temporary table substitution
+        fingerprint_dict: Fingerprints of the earlier CTEs, keyed by CTE name
+
+    Returns:
+        Fingerprint: The fingerprint of the CTE
+    """
+    upstream = sorted(
+        {
+            fingerprint_dict[table.name]
+            for table in cte.this.find_all(exp.Table)
+            if table.name in fingerprint_dict
+        }
+    )
+    return get_text_fingerprint(
+        get_fingerprint(cte_script, comments=False) + "".join(upstream)
+    )
+
+
+# -----------------------------------------------------------------------------
+# CTE Creation
+# -----------------------------------------------------------------------------
+
+
+async def create_cte(
+    cte_info_list: List[Dict],
+    cte_info: Dict,
+    upstream_list: List[Dict[str, Optional[str]]],
+    urgent: bool,
+) -> Dict[str, Optional[str]]:
+    """
+    Rewrite a CTE and create a temporary table for it.
+
+    Args:
+        cte_info_list: All CTEs of the query. See create_inner().
+        cte_info: The CTE, its script, fingerprint and upstream CTEs
+        upstream_list: Results of the upstream CTEs, in the order of cte_info["upstream"]
+        urgent: Whether the user is waiting for the result
+
+    Returns:
+        Same as rewrite_and_execute(). Both values are None if processing fails.
+    """
+    if any(
+        upstream["name"] is None and upstream["script"] is None
+        for upstream in upstream_list
+    ):
+        return {"name": None, "script": None}
+
+    cte_script = cte_info["script"]
+
+    """
+    If neither the CTE nor any CTE upstream of it changed, and its temporary
+    table has not been evicted or replaced by a table of the same name,
+    reuse the table without rewriting.
+    """
+    cte_table = cte_dict.get(cte_info["fingerprint"])
+    if (
+        cte_table is not None
+        and temporary_table_pool.get_version(cte_table["name"]) == cte_table["version"]
+        and temporary_table_pool.check_name(cte_table["name"])
+    ):
+        if cte_table["is_sample"]:
+            # As rewrite() does for a sampled temporary table
+            set_sample()
+        return {"name": cte_table["name"], "script": cte_script}
+
+    alias_to_name = {
+        cte_info_list[index]["cte"].alias_or_name: upstream["name"]
+        for index, upstream in zip(cte_info["upstream"], upstream_list)
+        if upstream["name"] is not None
+    }
+    if alias_to_name:
+        cte_script = replace_table_sql(cte_info["cte"].this, alias_to_name)
+
+    cte_script = format(cte_script)
+
+    rewrite = await rewrite_and_execute(
+        cte_script,
+        metadata={
+            "is_main_query": False,
+            "urgent": urgent,
+        },
+    )
+    if get_test_param()["output_cte"]:
+        append_test_info("cte", cte_script)
+
+    if get_test_param()["output_rewrite_cte"]:
+        append_test_info(
+            "rewrite_cte", {"script": cte_script, "rewrite": rewrite["script"]}
+        )
+
+    if rewrite["name"] is not None:
+        table = temporary_table_pool.get_table(rewrite["name"])
+        if table is not None:
+            cte_dict[cte_info["fingerprint"]] = {
+                "name": table["name"],
+                "version": table["version"],
+                "is_sample": table["is_sample"],
+            }
+
+    return rewrite
+
+
+async def create_cte_dag(
+    cte_info_list: List[Dict], urgent: bool
+) -> List[Dict[str, Optional[str]]]:
+    """
+    Create the temporary tables of the CTEs as a DAG.
+
+    Each CTE starts as soon as the CTEs it depends on are done, so independent
+    CTEs are created concurrently, at most one per database lane.
+
+    Args:
+        cte_info_list: CTEs in definition order. See create_inner().
+        urgent: Whether the user is waiting for the result
+
+    Returns:
+        List[Dict[str, Optional[str]]]: The result of create_cte() for each CTE,
+        in definition order
+
+    Example:
+        >>> # WITH a AS (...), b AS (...), c AS (SELECT ... FROM a JOIN b ...)
+        >>> # a and b are created in parallel, c is created after both
+    """
+    semaphore = asyncio.Semaphore(get_lane_count())
+    task_list: List[asyncio.Task] = []
+
+    async def create_cte_after(
+        cte_info: Dict, upstream_task_list: List[asyncio.Task]
+    ) -> Dict[str, Optional[str]]:
+        upstream_list = await asyncio.gather(*upstream_task_list)
+        async with semaphore:
+            return await create_cte(cte_info_list, cte_info, upstream_list, urgent)
+
+    for cte_info in cte_info_list:
+        task_list.append(
+            asyncio.ensure_future(
+                create_cte_after(
+                    cte_info, [task_list[index] for index in cte_info["upstream"]]
+                )
+            )
+        )
+
+    return await asyncio.gather(*task_list)
+
+
 # -----------------------------------------------------------------------------
 # Create Inner
 # -----------------------------------------------------------------------------
@@ -312,18 +646,22 @@ async def create_inner(sql: str) -> Optional[str]:
     with get_execute_cursor_lock():
         temporary_table_pool.lru_evict()
 
-    scope = build_scope(get_parse(sql))
+    scope = build_scope(get_query(sql).parse)
 
-    alias_to_name_list = []
+    alias_to_name: Dict[str, str] = {}
     remaining_cte_list = []
+    fingerprint_dict: Dict[str, Fingerprint] = {}
 
-    main_query_script = scope.expression.sql()
     urgent = True if get_priority("db") > 1 else False
 
     if urgent:
         cancel_running_query()
 
-    for cte in scope.ctes:
+    cte_info_list = []
+    name_to_index: Dict[str, int] = {}
+    script_to_index: Dict[Fingerprint, int] = {}
+
+    for index, cte in enumerate(scope.ctes):
         """
         Extract CTE script from CTE definition
 
@@ -331,66 +669,72 @@ async def create_inner(sql: str) -> Optional[str]:
         >>> cte AS (SELECT * FROM "table")
         >>> cte_script = SELECT * FROM "table"
         """
-        cte_script = re.search(
-            r"^(\"\w+\")\s+AS\s*\((.*?)\)$", cte.sql(), re.IGNORECASE
-        ).group(2)
-
-        for alias_map in alias_to_name_list:
-            cte_script = re.sub(
-                rf"(?<!\.){re.escape(alias_map['alias'])}",
-                f" {alias_map['name']}",
-                cte_script,
-            )
+        cte_script = cte.this.sql()
 
-        cte_script = format(cte_script)
+        cte_fingerprint = get_cte_fingerprint(cte, cte_script, fingerprint_dict)
+        fingerprint_dict[cte.alias_or_name] = cte_fingerprint
 
-        rewrite = await rewrite_and_execute(
-            cte_script,
-            metadata={
-                "is_main_query": False,
-                "urgent": urgent,
-            },
+        """
+        A CTE depends on the earlier CTEs it reads from. A CTE with the same
+        text as an earlier one also waits for it, so that the second one hits
+        the temporary table of the first instead of creating it again.
+        """
+        upstream = {
+            name_to_index[table.name]
+            for table in cte.this.find_all(exp.Table)
+            if table.name in name_to_index
+        }
+        script_key = get_fingerprint(cte_script, comments=False)
+        if script_key in script_to_index:
+            upstream.add(script_to_index[script_key])
+        script_to_index.setdefault(script_key, index)
+        name_to_index[cte.alias_or_name] = index
+
+        cte_info_list.append(
+            {
+                "cte": cte,
+                "script": cte_script,
+                "fingerprint": cte_fingerprint,
+                "upstream": sorted(upstream),
+            }
         )
-        if get_test_param()["output_cte"]:
-            append_test_info("cte", cte_script)
 
-        if get_test_param()["output_rewrite_cte"]:
-            append_test_info(
-                "rewrite_cte", {"script": cte_script, "rewrite": rewrite["script"]}
+    if urgent or get_lane_count() == 1:
+        rewrite_list = []
+        for cte_info in cte_info_list:
+            rewrite_list.append(
+                await create_cte(
+                    cte_info_list,
+                    cte_info,
+                    [rewrite_list[index] for index in cte_info["upstream"]],
+                    urgent,
+                )
             )
+            if rewrite_list[-1]["name"] is None and rewrite_list[-1]["script"] is None:
+                return None
+    else:
+        rewrite_list = await create_cte_dag(cte_info_list, urgent)
 
+    for cte_info, rewrite in zip(cte_info_list, rewrite_list):
         if rewrite["name"] is not None:
-            alias_to_name_list.append(
-                {"alias": f'"{cte.alias_or_name}"', "name": rewrite["name"]}
+            alias_to_name[cte_info["cte"].alias_or_name] = rewrite["name"]
+        elif rewrite["script"] is not None:
+            remaining_cte_list.append(
+                f"{cte_info['cte'].alias_or_name} AS ({rewrite['script']})"
             )
-
         else:
-            if rewrite["script"] is not None:
-                remaining_cte_list.append(
-                    f"{cte.alias_or_name} AS ({rewrite['script']})"
-                )
-
-            else:
-                return None
-
-    for cte in scope.ctes:
-        main_query_script = main_query_script.replace(cte.sql(), "")
-
-    if main_query_script.lower().startswith("with"):
-        main_query_script = main_query_script[len("with") :].strip()
-
-    while main_query_script.startswith(","):
-        main_query_script = main_query_script[1:].strip()
-
+            return None
 
-    for alias_map in alias_to_name_list:
-        main_query_script = format(
-            re.sub(
-                rf"(?<!\.){re.escape(alias_map['alias'])}",
-                f" {alias_map['name']}",
-                main_query_script,
-            )
-        )
+    """
+    The main query is the query without its WITH clause. The remaining CTEs
+    are added back below.
+    """
+    main_query = scope.expression.copy()
+    main_query.set("with", None)
+    if alias_to_name:
+        main_query_script = format(replace_table_sql(main_query, alias_to_name))
+    else:
+        main_query_script = main_query.sql()
 
     if remaining_cte_list != []:
         main_query_script = format(
@@ -406,45 +750,36 @@ async def create_inner(sql: str) -> Optional[str]:
                 {"script": main_query_script, "rewrite": main_query_script},
             )
 
-    elif main_query_script.lower().startswith("select"):
+    elif isinstance(get_query(main_query_script).parse, SET_OPERATION):
         if get_test_param()["output_main_query"]:
             append_test_info("main_query", main_query_script)
 
-        try:
-            get_parse(main_query_script).args.get("from").args.get("this")
-            Pass = (
-                extract(main_query_script)["join"] != []
-                or extract(main_query_script)["where"] != []
-                or extract(main_query_script)["group"] != []
+        rewrite_script = await rewrite_and_execute_set_operation(
+            main_query_script, urgent
+        )
+        if get_test_param()["output_rewrite_main_query"]:
+            append_test_info(
+                "rewrite_main_query",
+                {"script": main_query_script, "rewrite": rewrite_script},
             )
 
-        except Exception:
-            Pass = False
-
-        if Pass:
-            import time
-            t = time.time()
-            rewrite = await rewrite_and_execute(
-                format(main_query_script),
-                metadata={"is_main_query": True, "urgent": urgent},
-            )
-            print(f"rewrite_and_execute: {time.time() - t:.2f}")
-            if get_test_param()["output_rewrite_main_query"]:
-                append_test_info(
-                    "rewrite_main_query",
-                    {"script": main_query_script, "rewrite": rewrite["script"]},
-                )
+        main_query_script = rewrite_script
+
+    elif main_query_script.lower().startswith("select"):
+        if get_test_param()["output_main_query"]:
+            append_test_info("main_query", main_query_script)
 
-            main_query_script = (
-                format(rewrite["script"]) if rewrite["script"] is not None else None
+        rewrite_script = await rewrite_and_execute_main_query(
+            main_query_script, urgent
+        )
+        if get_test_param()["output_rewrite_main_query"]:
+            append_test_info(
+                "rewrite_main_query",
+                {"script": main_query_script, "rewrite": rewrite_script},
             )
 
-        else:
-            if get_test_param()["output_rewrite_main_query"]:
-                append_test_info(
-                    "rewrite_main_query",
-                    {"script": main_query_script, "rewrite": main_query_script},
-                )
+        main_query_script = rewrite_script
+
     else:
         # Should not reach here
         log("error.txt", f"Should not reach here. Create script: {sql}")
@@ -484,27 +819,20 @@ async def create(sql: str) -> Optional[str]:
     mem_sql = format(remove_comment(format(mem_sql)))
 
     reset_sample()
+    update_session_column_usage(mem_sql)
 
     """
     Check if the query is a SELECT statement. If not, return None.
     """
     try:
-        if (
-            not isinstance(get_parse(mem_sql), sqlglot.exp.Select)
-            and not isinstance(get_parse(mem_sql), sqlglot.exp.Union)
-            and not isinstance(get_parse(mem_sql), sqlglot.exp.Intersect)
-        ):
+        if not isinstance(get_query(mem_sql).parse, (sqlglot.exp.Select, *SET_OPERATION)):
             return None
     except Exception:
         log("error.txt", f"Failed to parse query: {mem_sql}\nsql: {sql}")
         return None
 
     try:
-        sql = sqlglot.transpile(
-            sql,
-            read=get_dialect_param()["input"],
-            write=get_dialect_param()["endpoint"],
-        )[0]
+        sql = get_query(sql).transpile(get_dialect_param()["endpoint"])
     except Exception:
         """
         Remove the cursor identifier from the query and try to transpile it again.
@@ -512,13 +840,11 @@ async def create(sql: str) -> Optional[str]:
         will not be able to parse the query. Possibly due to a bug in sqlglot.
         """
         try:
-            sql = sqlglot.transpile(
+            sql = get_query(
                 sql.replace(get_plugin_param()["cursor_identifier"], "")
                 + " "
-                + get_plugin_param()["cursor_identifier"],
-                read=get_dialect_param()["input"],
-                write=get_dialect_param()["endpoint"],
-            )[0]
+                + get_plugin_param()["cursor_identifier"]
+            ).transpile(get_dialect_param()["endpoint"])
         except Exception:
             """
             If a query can be addressed by the DB endpoint but cannot be parsed by sqlglot,
@@ -537,9 +863,15 @@ async def create(sql: str) -> Optional[str]:
         """
         sql = sql + f" /* {cursor_id} */"
 
-    scope_list = traverse_scope(get_parse(sql))
+    scope_list = traverse_scope(get_query(sql).parse)
+    """
+    Skip the branches of a set operation. The set operation itself is processed
+    instead, and create_inner materializes each branch independently.
+    """
     scope_list = [
-        scope for scope in scope_list if f"/* {cursor_id} */" in scope.expression.sql()
+        scope
+        for scope in scope_list
+        if f"/* {cursor_id} */" in scope.expression.sql() and not scope.is_union
     ]
 
     if not scope_list:
@@ -0,0 +1,247 @@
+# Copyright (c) 2025 Haoyu Li
+# Released under the MIT License.
+# See LICENSE file in the project root for details.
+
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Create Column Module
+====================
+
+This module ranks the columns a user is likely to add to a query next, so that
+get_powerset() materializes them in advance and follow-up edits hit the
+temporary table.
+
+Key Features:
+    - Column usage counts mined from the historical dataset, the logs of
+      earlier runs and the queries of the current session
+    - Ranking of the columns of a table, boosted by the LLM middle speculation
+    - Column count and row width budget for the extra columns
+"""
+
+import sys
+import os
+import re
+import json
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional
+
+# -----------------------------------------------------------------------------
+# Path Configuration
+# -----------------------------------------------------------------------------
+
+root_dir = str(Path(__file__).parent.parent)
+sys.path.extend(
+    [
+        root_dir,
+        str(Path(root_dir) / "src"),
+        str(Path(root_dir) / "util"),
+    ]
+)
+
+# -----------------------------------------------------------------------------
+# Local Imports
+# -----------------------------------------------------------------------------
+
+from param import get_plugin_param, get_vector_db_param
+from schema import get_schema
+from log import log
+from query import get_fingerprint
+from cache import BoundedCache
+
+# -----------------------------------------------------------------------------
+# Global Variables
+# -----------------------------------------------------------------------------
+
+"""
+Weights of one use of a column. The queries of the current session say the
+most about the next edit, the logs of earlier runs come from the same user,
+and the dataset only from the same workload.
+"""
+DATASET_WEIGHT = 1.0
+LOG_WEIGHT = 2.0
+SESSION_WEIGHT = 8.0
+
+"""
+A column in the LLM middle speculation ranks above any column from the
+history alone.
+"""
+MIDDLE_WEIGHT = 1000.0
+
+# Maps a table name to the weighted use count of each of its columns
+column_usage: Dict[str, Dict[str, float]] = {}
+column_usage_lock = threading.Lock()
+is_loaded = False
+
+# Session queries already counted, so that repeated requests count once
+session_query_dict = BoundedCache("column_usage")
+
+# -----------------------------------------------------------------------------
+# Column Usage
+# -----------------------------------------------------------------------------
+
+
+def update_column_usage(
+    sql: str,
+    weight: float = SESSION_WEIGHT,
+    usage_dict: Optional[Dict[str, Dict[str, float]]] = None,
+) -> None:
+    """
+    Count the columns used by a query. A column is used if its name and the
+    name of its table both appear in the query.
+
+    Args:
+        sql: SQL query
+        weight: Weight of one use
+        usage_dict: Counts to update. Defaults to column_usage, in which case
+            the caller must hold column_usage_lock.
+    """
+    if usage_dict is None:
+        usage_dict = column_usage
+    word_set = set(re.findall(r"\w+", sql.upper()))
+    for table_name in word_set & get_schema().keys():
+        for col in word_set & get_schema()[table_name].keys():
+            usage = usage_dict.setdefault(table_name, {})
+            usage[col] = usage.get(col, 0.0) + weight
+
+
+def update_session_column_usage(sql: str) -> None:
+    """Count the columns used by a query of the current session, once per query."""
+    sql_key = get_fingerprint(sql, comments=False)
+    if session_query_dict.get(sql_key) is not None:
+        return
+    session_query_dict[sql_key] = True
+    with column_usage_lock:
+        update_column_usage(sql, SESSION_WEIGHT)
+
+
+def load_column_usage() -> None:
+    """
+    Mine the column usage of the historical dataset and of the inputs logged
+    by earlier runs (log/*/record.txt), and add it to the session usage.
+    Reading every file takes long, so it runs in the thread started by
+    start_load_column_usage(), off the request path.
+    """
+    usage_dict: Dict[str, Dict[str, float]] = {}
+
+    dataset_path = get_vector_db_param()["dataset_path"]
+    if os.path.isdir(dataset_path):
+        for file_name in os.listdir(dataset_path):
+            if file_name.endswith(".sql"):
+                with open(f"{dataset_path}/{file_name}", "r") as file:
+                    update_column_usage(file.read().split(";")[0], DATASET_WEIGHT, usage_dict)
+
+    log_dir = Path(root_dir) / "log"
+    for record_path in log_dir.glob("*/record.txt"):
+        try:
+            with open(record_path, "r") as file:
+                for line in file:
+                    update_column_usage(json.loads(line)["input"], LOG_WEIGHT, usage_dict)
+        except Exception as e:
+            log("error.txt", f"Cannot read {record_path}: {e}")
+
+    with column_usage_lock:
+        for table_name, usage in usage_dict.items():
+            session_usage = column_usage.setdefault(table_name, {})
+            for col, count in usage.items():
+                session_usage[col] = session_usage.get(col, 0.0) + count
+
+
+def start_load_column_usage() -> None:
+    """
+    Start load_column_usage() in a background thread, once. Until it is
+    done, columns are ranked by the usage of the current session alone.
+
+    Example:
+        >>> start_load_column_usage()  # At startup, see main.py
+    """
+    global is_loaded
+
+    with column_usage_lock:
+        if is_loaded:
+            return
+        is_loaded = True
+    threading.Thread(target=load_column_usage, daemon=True).start()
+
+# -----------------------------------------------------------------------------
+# Column Ranking
+# -----------------------------------------------------------------------------
+
+
+def get_type_width(column_type: str) -> int:
+    """
+    Estimate the bytes a value of a column type takes in a row.
+
+    Example:
+        >>> get_type_width("integer"), get_type_width("character varying(50)")
+        (4, 50)
+    """
+    length = re.search(r"\((\d+)", column_type)
+    if column_type.startswith("char") and length is not None:
+        return int(length.group(1))
+    if column_type in ("smallint", "boolean"):
+        return 2
+    if column_type in ("integer", "date", "real"):
+        return 4
+    return 8
+
+
+def rank_column(table_name: str, middle: Optional[str] = None) -> List[str]:
+    """
+    Rank the columns of a table by how likely the user is to add them next.
+
+    Args:
+        table_name: Table name, not quoted
+        middle: The middle speculated by the LLM, if it has arrived
+
+    Returns:
+        List[str]: Columns with any use or mentioned in the middle, most
+        likely first
+    """
+    # Started at startup by the server, and here for the test scripts
+    start_load_column_usage()
+
+    with column_usage_lock:
+        score = dict(column_usage.get(table_name, {}))
+    if middle:
+        for col in get_schema().get(table_name, {}):
+            if col in middle:
+                score[col] = score.get(col, 0.0) + MIDDLE_WEIGHT
+
+    return sorted(score, key=lambda col: -score[col])
+
+
+def select_column(
+    table_name: str, column_list: List[str], middle: Optional[str] = None
+) -> List[str]:
+    """
+    Take columns in rank order while they fit in the budget of
+    --plugin-powerset-column-count columns and --plugin-powerset-width bytes
+    per row. A column that does not fit is skipped, so a narrower column
+    further down the ranking may still be taken.
+
+    Columns in the LLM middle speculation are always taken, as before the
+    usage model existed, but they use up the budget of the other columns.
+
+    Args:
+        table_name: Table name, not quoted
+        column_list: Candidate columns, most likely first
+        middle: The middle speculated by the LLM, if it has arrived
+
+    Returns:
+        List[str]: The columns to add, in rank order
+    """
+    width = 0
+    selected = []
+    for col in column_list:
+        col_width = get_type_width(get_schema()[table_name][col])
+        if not (middle and col in middle) and (
+            len(selected) >= get_plugin_param()["powerset_column_count"]
+            or width + col_width > get_plugin_param()["powerset_width"]
+        ):
+            continue
+        width += col_width
+        selected.append(col)
+    return selected
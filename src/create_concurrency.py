@@ -18,8 +18,10 @@ Key Features:
 """
 
 import sys
+import asyncio
 import threading
 from pathlib import Path
+from typing import Any, Dict
 
 # -----------------------------------------------------------------------------
 # Path Configuration
@@ -38,16 +40,21 @@ sys.path.extend(
 # Local Imports
 # -----------------------------------------------------------------------------
 
-from db_api import get_cursor, get_execute_session_id
+from db_api import get_cursor, get_execute_session_id, get_lane_session_id_list
+from param import get_enable_param, get_load_param
 from parse import get_optimize
 from log import log
+from load import get_background_worker_limit, get_background_delay
+from cost import is_over_budget, is_degraded
 from concurrency import (
     get_recent_tid,
     get_background_create,
+    push_background_create,
     wait_background_create_event,
     clear_background_create_event,
     get_background_tid,
     set_background_tid,
+    get_background_worker_index,
     get_explain_cursor_lock,
 )
 
@@ -62,8 +69,8 @@ def cancel_running_query() -> None:
     Cancels any running queries associated with the current session.
 
     This function acquires a lock to safely access the explain cursor,
-    identifies running queries for the current session, and attempts to
-    cancel them.
+    identifies running queries for the execute session and the lane sessions,
+    and attempts to cancel them.
 
     Returns:
         None
@@ -84,11 +91,12 @@ SELECT session_id, query_text FROM sys_query_history WHERE status='running';
 """
         )
         running_query_list = get_cursor()["explain"].fetchall()
+        session_id_set = {get_execute_session_id(), *get_lane_session_id_list()}
 
         for item in running_query_list:
-            if item[0] == get_execute_session_id():
+            if item[0] in session_id_set:
                 try:
-                    get_cursor()["explain"].execute(f"CANCEL {get_execute_session_id()};")
+                    get_cursor()["explain"].execute(f"CANCEL {item[0]};")
                 except Exception as e:
                     # Query may have completed between listing and cancellation attempt
                     log("error.txt", f"Failed to cancel query: {e}")
@@ -115,11 +123,24 @@ async def create_background() -> None:
     resources to create temporary tables. When new user input is received,
     this function should be cancelled and wait for the next create event.
 
+    Several workers may run this function, one per thread, at most one per
+    database lane. They share the background job queue (see
+    set_background_create), which serves the job with the highest utility
+    plus aging first.
+
+    The workers yield to the warehouse load (see load): all of them run
+    while the cluster is idle, one under normal load, and none while it is
+    saturated, backing off exponentially until it is not. They stop once the
+    warehouse budget of the session is spent (see cost).
+
     Steps:
         1. Register background thread identification
         2. Wait for create events
-        3. Process and execute the creation operation
-        4. Go back to step 2
+        3. While idle, wait for the warehouse load to allow this worker,
+           then take the best job from the queue and execute it
+        4. For a query the user sent, queue its lattice candidates
+           (see create_lattice)
+        5. Go back to step 2 when the queue is empty
 
     Returns:
         None
@@ -136,26 +157,72 @@ async def create_background() -> None:
         # Wait for create events and create temporary tables
     """
     set_background_tid(threading.get_ident())
+    worker_index = get_background_worker_index()
 
     while True:
         wait_background_create_event()
-        clear_background_create_event()
 
-        if get_recent_tid("db") != get_background_tid():
-            continue
+        while get_recent_tid("db") == get_background_tid():
+            # No speculative tables once the warehouse budget is spent
+            if is_over_budget("warehouse"):
+                clear_background_create_event()
+                break
 
-        sql = get_background_create()
+            worker_limit = get_background_worker_limit()
+            delay = get_background_delay()
+            if worker_index >= worker_limit:
+                await asyncio.sleep(delay or get_load_param()["interval"])
+                continue
+
+            job = get_background_create()
+            if job is None:
+                clear_background_create_event()
+                break
 
-        if sql is not None:
             try:
-                # Check if the SQL is valid, and transform it to a formatted SQL
-                sql = get_optimize(sql)
+                await create_background_job(job)
             except Exception as e:
-                # This happens when the SQL is invalid. It probably means the
-                # sqlglot optimizer cannot optimize the SQL. Possibly a bug.
                 log("error.txt", f"{str(e)}")
-                continue
 
-            from create import create_inner
 
-            await create_inner(sql)
+async def create_background_job(job: Dict[str, Any]) -> None:
+    """
+    Execute one background job.
+
+    Args:
+        job: The job from get_background_create()
+    """
+    try:
+        # Check if the SQL is valid, and transform it to a formatted SQL
+        sql = get_optimize(job["sql"])
+    except Exception as e:
+        # This happens when the SQL is invalid. It probably means the
+        # sqlglot optimizer cannot optimize the SQL. Possibly a bug.
+        log("error.txt", f"{str(e)}")
+        return
+
+    from create import create_inner
+
+    await create_inner(sql)
+
+    if (
+        job["kind"] != "query"
+        or not get_enable_param()["lattice"]
+        or is_degraded("warehouse")
+    ):
+        return
+
+    from create_lattice import get_lattice
+
+    """
+    The candidates rank below the query itself. The best one gets the utility
+    of its reuse probability, and the others in proportion to their score.
+    """
+    candidate_list = get_lattice(sql)
+    for candidate in candidate_list:
+        log("lattice.txt", candidate, is_dict=True)
+        push_background_create(
+            candidate["sql"],
+            utility=candidate_list[0]["reuse"] * candidate["score"] / candidate_list[0]["score"],
+            kind="lattice",
+        )
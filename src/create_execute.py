@@ -22,8 +22,11 @@ Key Features:
 import sys
 import re
 import json
+import asyncio
+import redshift_connector
+from contextlib import nullcontext
 from pathlib import Path
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, ContextManager
 
 # -----------------------------------------------------------------------------
 # Path Configuration
@@ -42,9 +45,45 @@ sys.path.extend(
 # Local Imports
 # -----------------------------------------------------------------------------
 
-from db_api import get_cursor
+from db_api import get_cursor, get_lane_count, get_lane_schema, acquire_lane, release_lane
+from concurrency import get_execute_cursor_lock, get_explain_cursor_lock
 from log import log
 from schema import get_schema
+from param import get_dialect_param
+
+
+# -----------------------------------------------------------------------------
+# Create Statement
+# -----------------------------------------------------------------------------
+
+
+def get_create_statement(name: str, script: str) -> str:
+    """
+    Returns the statement that materializes a script as a table.
+
+    With a single lane the table is a temporary table of the execute session.
+    With more lanes it is a regular table in the lane schema, so that the other
+    sessions can read it. execute() drops a table of the same name left over
+    from before TemporaryTablePool.reset().
+
+    Example:
+        >>> get_create_statement('"SPEQL_TEMP_TABLE_1"', "SELECT 1")
+        'CREATE TEMPORARY TABLE "SPEQL_TEMP_TABLE_1" AS SELECT 1'
+    """
+    if get_lane_count() == 1:
+        return f"CREATE TEMPORARY TABLE {name} AS {script}"
+    return f"CREATE TABLE {get_lane_schema()}.{name} AS {script}"
+
+
+def get_create_lock() -> ContextManager:
+    """
+    Returns the lock to hold while creating a table. With a single lane the
+    table is created on the execute cursor. With more lanes every create takes
+    a lane of its own, so no lock is needed.
+    """
+    if get_lane_count() == 1:
+        return get_execute_cursor_lock()
+    return nullcontext()
 
 
 # -----------------------------------------------------------------------------
@@ -63,6 +102,9 @@ async def execute(create_script: str, warm_up: bool = False) -> Optional[Dict[st
     4. Records table size information
     5. Updates schema information
 
+    With more than one lane, the statement runs on a free lane in a worker
+    thread, so that independent tables are created in parallel.
+
     Args:
         create_script (str): The CREATE TABLE SQL statement to execute
 
@@ -74,22 +116,41 @@ async def execute(create_script: str, warm_up: bool = False) -> Optional[Dict[st
         >>> size = await execute(create_sql)
         >>> print(f"Created table size: {size}MB")
     """
+    if get_lane_count() == 1:
+        return execute_inner(create_script, warm_up, get_cursor()["execute"])
+
+    def execute_lane() -> Optional[Dict[str, Any]]:
+        cursor = acquire_lane()
+        try:
+            return execute_inner(create_script, warm_up, cursor)
+        finally:
+            release_lane(cursor)
+
+    return await asyncio.to_thread(execute_lane)
 
-    get_cursor()["execute"].execute(create_script)
 
-    table_name = (
-        re.search(r"CREATE TEMPORARY TABLE (\"\w+\")", create_script, re.IGNORECASE)
-        .group(1)
-        .lower()
-        .replace('"', "")
+def execute_inner(
+    create_script: str, warm_up: bool, cursor: redshift_connector.Cursor
+) -> Optional[Dict[str, Any]]:
+    """Runs execute() on the given cursor."""
+
+    match = re.search(
+        r"CREATE (TEMPORARY )?TABLE ((?:\w+\.)?(\"\w+\"))", create_script, re.IGNORECASE
     )
+    table_name = match.group(3).lower().replace('"', "")
+
+    if match.group(1) is None:
+        # Regular tables outlive reset(), which restarts the table names
+        cursor.execute(f"DROP TABLE IF EXISTS {match.group(2)} CASCADE;")
+
+    cursor.execute(create_script)
 
-    get_cursor()["execute"].execute("""
+    cursor.execute("""
 select elapsed_time, execution_time, compile_time, planning_time from sys_query_history 
 where query_id = pg_last_query_id()
 """)
     
-    result = get_cursor()["execute"].fetchone()
+    result = cursor.fetchone()
     metrics = {
         "elapsed_time": result[0] / 1000000,
         "execution_time": result[1] / 1000000,
@@ -97,13 +158,13 @@ where query_id = pg_last_query_id()
         "planning_time": result[3] / 1000000,
     }
 
-    get_cursor()["execute"].execute(
+    cursor.execute(
         f"""
 SELECT "size" AS "size" FROM SVV_TABLE_INFO WHERE "table" = \'{table_name}\'
 """
     )
     try:
-        size = get_cursor()["execute"].fetchone()[0]
+        size = cursor.fetchone()[0]
     except Exception:
         # If we cannot get the size from an empty table
         size = 0
@@ -113,13 +174,13 @@ SELECT "size" AS "size" FROM SVV_TABLE_INFO WHERE "table" = \'{table_name}\'
     if warm_up:
         return metrics
     
-    get_cursor()["execute"].execute(
+    cursor.execute(
         f"""
 SELECT tablename, "column", "type" FROM pg_table_def WHERE tablename = \'{table_name}\'
 """
     )
     try:
-        schema_diff = get_cursor()["execute"].fetchall()
+        schema_diff = cursor.fetchall()
     except Exception:
         # This should not happen
         raise Exception("Cannot get schema diff")
@@ -132,13 +193,47 @@ SELECT tablename, "column", "type" FROM pg_table_def WHERE tablename = \'{table_
     return metrics
 
 
+# -----------------------------------------------------------------------------
+# Explain Cost
+# -----------------------------------------------------------------------------
+
+
+def get_explain_cost(script: str) -> Optional[float]:
+    """
+    Returns the total cost the planner estimates for a query, without running it.
+
+    Example:
+        >>> # XN HashAggregate  (cost=1000034794.71..1000034794.76 rows=20 width=44)
+        >>> get_explain_cost('SELECT ... FROM "store_sales" ...')
+        1000034794.76
+
+    Returns:
+        Optional[float]: The cost of the top plan node, or None if the query
+        cannot be explained. Always None on Snowflake, whose EXPLAIN reports
+        partitions and bytes but no cost, so that no round trip is spent.
+    """
+    if get_dialect_param()["endpoint"] != "redshift":
+        return None
+    try:
+        with get_explain_cursor_lock():
+            get_cursor()["explain"].execute(f"EXPLAIN {script}")
+            plan = get_cursor()["explain"].fetchall()
+        return float(re.search(r"cost=[\d.]+\.\.([\d.]+)", plan[0][0]).group(1))
+    except Exception as e:
+        log("error.txt", f"Cannot explain {script}: {e}")
+        return None
+
+
 # -----------------------------------------------------------------------------
 # Drop Table Execute
 # -----------------------------------------------------------------------------
 
 
 def drop_warm_up(table_name: str) -> None:
+    # With a single lane the caller already holds the lock from get_create_lock()
+    lock = nullcontext() if get_lane_count() == 1 else get_execute_cursor_lock()
     try:
-        get_cursor()["execute"].execute(f"DROP TABLE IF EXISTS {table_name} CASCADE;")
+        with lock:
+            get_cursor()["execute"].execute(f"DROP TABLE IF EXISTS {table_name} CASCADE;")
     except Exception as e:
         log("error.txt", f"Cannot drop table {table_name}: {e}")
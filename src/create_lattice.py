@@ -0,0 +1,230 @@
+# Copyright (c) 2025 Haoyu Li
+# Released under the MIT License.
+# See LICENSE file in the project root for details.
+
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Create Lattice Module
+=====================
+
+This module derives a small lattice of generalized queries from the current
+query. The background thread materializes them during idle time, so that the
+user's next edit usually lands on a temporary table that is already built.
+
+Key Features:
+    - Candidates that drop the last predicate, drop the last join, or coarsen
+      the GROUP BY of the main query
+    - Candidates ranked by predicted reuse probability divided by the
+      estimated cost (EXPLAIN)
+"""
+
+import sys
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+from sqlglot import exp
+
+# -----------------------------------------------------------------------------
+# Path Configuration
+# -----------------------------------------------------------------------------
+
+root_dir = str(Path(__file__).parent.parent)
+sys.path.extend(
+    [
+        root_dir,
+        str(Path(root_dir) / "src"),
+        str(Path(root_dir) / "util"),
+    ]
+)
+
+# -----------------------------------------------------------------------------
+# Local Imports
+# -----------------------------------------------------------------------------
+
+from param import get_plugin_param
+from format import format
+from query import get_query
+from create_execute import get_explain_cost
+
+# -----------------------------------------------------------------------------
+# Global Variables
+# -----------------------------------------------------------------------------
+
+"""
+Probability that the next edit of the user can be answered from a candidate.
+The last predicate is the one most often being edited, and a finer GROUP BY
+is more often refined again than a join is removed.
+"""
+REUSE_PROBABILITY = {
+    "drop_predicate": 0.5,
+    "coarsen_group": 0.3,
+    "drop_join": 0.2,
+}
+
+# -----------------------------------------------------------------------------
+# Candidate Generation
+# -----------------------------------------------------------------------------
+
+
+def get_conjunct_list(condition: Optional[exp.Expression]) -> List[exp.Expression]:
+    """Split a condition into its AND-ed predicates."""
+    if condition is None:
+        return []
+    if isinstance(condition, exp.And):
+        return list(condition.flatten())
+    return [condition]
+
+
+def set_conjunct_list(select: exp.Select, arg: str, conjunct_list: List[exp.Expression]) -> None:
+    """Set the WHERE or HAVING clause to the AND of the predicates, or remove it."""
+    if not conjunct_list:
+        select.set(arg, None)
+    else:
+        clause = exp.Where if arg == "where" else exp.Having
+        select.set(arg, clause(this=exp.and_(*conjunct_list)))
+
+
+def drop_predicate(select: exp.Select) -> Optional[exp.Select]:
+    """
+    Drop the last predicate of the WHERE clause.
+
+    Example:
+        >>> # SELECT ... WHERE "t"."a" > 0 AND "t"."b" = 1
+        >>> # SELECT ... WHERE "t"."a" > 0
+    """
+    where = select.args.get("where")
+    conjunct_list = get_conjunct_list(where.this if where else None)
+    if not conjunct_list:
+        return None
+    set_conjunct_list(select, "where", conjunct_list[:-1])
+    return select
+
+
+def drop_join(select: exp.Select) -> Optional[exp.Select]:
+    """
+    Drop the last join, together with the columns and predicates that refer
+    to the joined table.
+
+    Example:
+        >>> # SELECT "t"."a", "s"."b" FROM "t" AS "t" JOIN "s" AS "s" ON ... WHERE "s"."c" = 1
+        >>> # SELECT "t"."a" FROM "t" AS "t"
+    """
+    join_list = select.args.get("joins")
+    if not join_list:
+        return None
+    alias = join_list[-1].this.alias_or_name
+    select.set("joins", join_list[:-1] or None)
+
+    def refers(node: exp.Expression) -> bool:
+        return any(column.table == alias for column in node.find_all(exp.Column))
+
+    select.set("expressions", [e for e in select.expressions if not refers(e)])
+    if not select.expressions:
+        return None
+
+    for arg in ["where", "having"]:
+        clause = select.args.get(arg)
+        set_conjunct_list(
+            select,
+            arg,
+            [c for c in get_conjunct_list(clause.this if clause else None) if not refers(c)],
+        )
+
+    group = select.args.get("group")
+    if group is not None:
+        group_list = [e for e in group.expressions if not refers(e)]
+        select.set("group", exp.Group(expressions=group_list) if group_list else None)
+
+    return select
+
+
+def coarsen_group(select: exp.Select) -> Optional[exp.Select]:
+    """
+    Drop the last GROUP BY column, together with the selected columns that
+    are not aggregated and refer to it.
+
+    Example:
+        >>> # SELECT "t"."a", "t"."b", SUM("t"."c") FROM ... GROUP BY "t"."a", "t"."b"
+        >>> # SELECT "t"."a", SUM("t"."c") FROM ... GROUP BY "t"."a"
+    """
+    group = select.args.get("group")
+    if group is None or not group.expressions:
+        return None
+    last = group.expressions[-1]
+
+    select.set(
+        "expressions",
+        [
+            e
+            for e in select.expressions
+            if e.find(exp.AggFunc) is not None
+            or not any(node == last for node in e.walk())
+        ],
+    )
+    if not select.expressions:
+        return None
+
+    group_list = group.expressions[:-1]
+    select.set("group", exp.Group(expressions=group_list) if group_list else None)
+    return select
+
+
+LATTICE_TRANSFORM: Dict[str, Callable[[exp.Select], Optional[exp.Select]]] = {
+    "drop_predicate": drop_predicate,
+    "coarsen_group": coarsen_group,
+    "drop_join": drop_join,
+}
+
+# -----------------------------------------------------------------------------
+# Lattice
+# -----------------------------------------------------------------------------
+
+
+def get_lattice(sql: str) -> List[Dict[str, Any]]:
+    """
+    Derive the candidates of a query and rank them by predicted reuse
+    probability divided by estimated cost.
+
+    Args:
+        sql: Optimized SQL query, as passed to create_inner()
+
+    Returns:
+        List[Dict[str, Any]]: At most --plugin-lattice-count candidates, best first.
+            Each has "kind", "sql", "reuse", "cost" and "score".
+    """
+    parsed = get_query(sql).parse
+    if not isinstance(parsed, exp.Select):
+        return []
+
+    candidate_list = []
+    sql_set = {format(parsed.sql())}
+    for kind, transform in LATTICE_TRANSFORM.items():
+        select = parsed.copy()
+        # The temporary table does not keep the order, see get_powerset()
+        select.set("order", None)
+        select.set("limit", None)
+        select = transform(select)
+        if select is None:
+            continue
+
+        candidate_sql = format(select.sql())
+        if candidate_sql in sql_set:
+            continue
+        sql_set.add(candidate_sql)
+
+        cost = get_explain_cost(candidate_sql)
+        if cost is None:
+            continue
+        candidate_list.append(
+            {
+                "kind": kind,
+                "sql": candidate_sql,
+                "reuse": REUSE_PROBABILITY[kind],
+                "cost": cost,
+                "score": REUSE_PROBABILITY[kind] / max(cost, 1.0),
+            }
+        )
+
+    candidate_list.sort(key=lambda candidate: -candidate["score"])
+    return candidate_list[: get_plugin_param()["lattice_count"]]
@@ -16,12 +16,15 @@ Key Features:
     - SQL query rewriting
     - Get powerset of a main query
     - Resolve alias conflict of a main query
+    - Split window functions from a main query
 """
 
 import sys
 import re
+import time
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple
+from sqlglot import exp
 
 # -----------------------------------------------------------------------------
 # Path Configuration
@@ -41,20 +44,32 @@ sys.path.extend(
 # -----------------------------------------------------------------------------
 
 from format import format_clause, format
+from parse import get_parse
+from query import get_query, get_fingerprint, record_profile
+from cache import BoundedCache
 from sample import set_sample
-from concurrency import get_speculate_middle
+from concurrency import get_speculate_middle, is_background_thread
+from param import get_plugin_param, get_dialect_param
 from schema import get_schema
-from extract import extract
+from extract import extract, ClauseItem
 from dialect import support_rewrite
 from create_struct import temporary_table_pool
 from log import log
+from create_column import rank_column, select_column
+from deadline import is_behind_deadline, get_stage_budget
 
 # -----------------------------------------------------------------------------
 # Global Variables
 # -----------------------------------------------------------------------------
 
-agg_func_dict: Dict[str, List[Optional[str]]] = {}
-rewrite_clause_dict: Dict[Tuple[str, str, str], list] = {}
+WINDOW_TABLE = '"SPEQL_WINDOW"'
+
+agg_func_dict = BoundedCache("agg_func")
+"""
+Keyed by (origin, target, clause_type). The number of pairs grows
+quadratically with the number of queries, so the bound matters most here.
+"""
+rewrite_clause_dict = BoundedCache("rewrite_clause")
 
 # -----------------------------------------------------------------------------
 # Get Aggregate Function
@@ -83,8 +98,10 @@ def get_agg_func(sql: str) -> Optional[List[Optional[str]]]:
     """
     global agg_func_dict
 
-    if sql in agg_func_dict:
-        return agg_func_dict[sql].copy()
+    sql_key = get_fingerprint(sql)
+    cached_agg_func = agg_func_dict.get(sql_key)
+    if cached_agg_func is not None:
+        return cached_agg_func.copy()
 
     extract_sql = extract(sql)
     agg_func: List[Optional[str]] = []
@@ -124,8 +141,8 @@ def get_agg_func(sql: str) -> Optional[List[Optional[str]]]:
         else:
             return None
 
-    agg_func_dict[sql] = agg_func.copy()
-    return agg_func_dict[sql]
+    agg_func_dict[sql_key] = agg_func.copy()
+    return agg_func
 
 
 # -----------------------------------------------------------------------------
@@ -203,8 +220,10 @@ def rewrite_clause_inner(origin: str, target: str, clause_type: str) -> dict:
     """
     global rewrite_clause_dict
 
-    if (origin, target, clause_type) in rewrite_clause_dict:
-        return rewrite_clause_dict[(origin, target, clause_type)]
+    clause_key = (get_fingerprint(origin), get_fingerprint(target), clause_type)
+    cached_value = rewrite_clause_dict.get(clause_key)
+    if cached_value is not None:
+        return cached_value
 
     extract_origin = extract(origin)
     extract_target = extract(target)
@@ -242,9 +261,9 @@ def rewrite_clause_inner(origin: str, target: str, clause_type: str) -> dict:
 
         if from_condition:
             check = temporary_table_pool.check(origin, update_lru=False)
-            from_value = [{"name": check["name"], "alias": check["name"]}]
+            from_value = (ClauseItem(name=check["name"], alias=check["name"]),)
         else:
-            from_value = []
+            from_value = ()
 
         return_value = {"condition": from_condition, "value": from_value}
 
@@ -276,12 +295,7 @@ def rewrite_clause_inner(origin: str, target: str, clause_type: str) -> dict:
             # If there is a Group By in rewritten target
             {'condition': True, 'value': [{'name': '"count("tmp_tb"."col1")', 'alias': 'col1'}]}
         """
-        select_condition = True
-
-        for select_item in extract_target["select"]:
-            if select_item not in extract_origin["select"]:
-                select_condition = False
-                break
+        select_condition = extract_origin.select_set.issuperset(extract_target.select)
 
         from_clause = rewrite_clause_inner(origin, target, "from")
         group_clause = rewrite_clause_inner(origin, target, "group")
@@ -292,8 +306,8 @@ def rewrite_clause_inner(origin: str, target: str, clause_type: str) -> dict:
             for i in range(len(extract_target["select"])):
                 if agg_func and agg_func[i] is not None and group_clause["value"]:
                     select.append(
-                        {
-                            "name": format(
+                        ClauseItem(
+                            name=format(
                                 agg_func[i]
                                 + "("
                                 + from_clause["value"][0]["alias"]
@@ -301,22 +315,22 @@ def rewrite_clause_inner(origin: str, target: str, clause_type: str) -> dict:
                                 + extract_target["select"][i]["alias"]
                                 + ")"
                             ),
-                            "alias": extract_target["select"][i]["alias"],
-                        }
+                            alias=extract_target["select"][i]["alias"],
+                        )
                     )
                 else:
                     select.append(
-                        {
-                            "name": format(
+                        ClauseItem(
+                            name=format(
                                 from_clause["value"][0]["alias"]
                                 + "."
                                 + extract_target["select"][i]["alias"]
                             ),
-                            "alias": extract_target["select"][i]["alias"],
-                        }
+                            alias=extract_target["select"][i]["alias"],
+                        )
                     )
 
-        return_value = {"condition": select_condition, "value": select}
+        return_value = {"condition": select_condition, "value": tuple(select)}
 
     elif clause_type == "join":
         """
@@ -358,89 +372,41 @@ def rewrite_clause_inner(origin: str, target: str, clause_type: str) -> dict:
         """
 
         join_condition = True
-        join = [
-            {
-                "table": {
-                    "name": extract_target["join"][i]["table"]["name"],
-                    "alias": extract_target["join"][i]["table"]["alias"],
-                },
-                "type": extract_target["join"][i]["type"],
-                "condition": [],
-            }
-            for i in range(len(extract_target["join"]))
-        ]
+        """
+        The conditions of each target join that are not covered by the
+        matching origin join. Join conditions are a conjunction, so the
+        coverage is a subset test rather than an ordered scan.
+        """
+        remaining = [list(item.condition) for item in extract_target.join]
 
         outer_origin_ptr = 0
         mem_join_ptr = 0
-        for outer_target_ptr in range(len(extract_target["join"])):
-
-            if outer_origin_ptr == len(extract_origin["join"]):
-                for inner_target_ptr in range(
-                    len(extract_target["join"][outer_target_ptr]["condition"])
-                ):
-                    join[outer_target_ptr]["condition"].append(
-                        extract_target["join"][outer_target_ptr]["condition"][
-                            inner_target_ptr
-                        ]
-                    )
+        for outer_target_ptr, target_join in enumerate(extract_target.join):
 
-            elif (
-                extract_target["join"][outer_target_ptr]["table"]
-                != extract_origin["join"][outer_origin_ptr]["table"]
+            if (
+                outer_origin_ptr == len(extract_origin.join)
+                or target_join.table != extract_origin.join[outer_origin_ptr].table
             ):
-                for inner_target_ptr in range(
-                    len(extract_target["join"][outer_target_ptr]["condition"])
-                ):
-                    join[outer_target_ptr]["condition"].append(
-                        extract_target["join"][outer_target_ptr]["condition"][
-                            inner_target_ptr
-                        ]
-                    )
-
-            else:
-                inner_origin_ptr = 0
-                for inner_target_ptr in range(
-                    len(extract_target["join"][outer_target_ptr]["condition"])
-                ):
-                    if inner_origin_ptr == len(
-                        extract_origin["join"][outer_origin_ptr]["condition"]
-                    ):
-                        join[outer_target_ptr]["condition"].append(
-                            extract_target["join"][outer_target_ptr]["condition"][
-                                inner_target_ptr
-                            ]
-                        )
+                continue
 
-                    elif (
-                        extract_target["join"][outer_target_ptr]["condition"][
-                            inner_target_ptr
-                        ]
-                        != extract_origin["join"][outer_origin_ptr]["condition"][
-                            inner_origin_ptr
-                        ]
-                    ):
-                        join[outer_target_ptr]["condition"].append(
-                            extract_target["join"][outer_target_ptr]["condition"][
-                                inner_target_ptr
-                            ]
-                        )
+            origin_join = extract_origin.join[outer_origin_ptr]
+            if not origin_join.condition_set <= target_join.condition_set:
+                join_condition = False
 
-                    else:
-                        inner_origin_ptr += 1
-
-                if inner_origin_ptr != len(
-                    extract_origin["join"][outer_origin_ptr]["condition"]
-                ):
-                    join_condition = False
+            remaining[outer_target_ptr] = [
+                cond
+                for cond in target_join.condition
+                if cond not in origin_join.condition_set
+            ]
 
-                outer_origin_ptr += 1
-                if outer_origin_ptr == len(extract_origin["join"]):
-                    mem_join_ptr = outer_target_ptr + 1
+            outer_origin_ptr += 1
+            if outer_origin_ptr == len(extract_origin.join):
+                mem_join_ptr = outer_target_ptr + 1
 
         """
         Original join condition is not included in the target sql.
         """
-        if outer_origin_ptr != len(extract_origin["join"]):
+        if outer_origin_ptr != len(extract_origin.join):
             join_condition = False
 
         else:
@@ -448,55 +414,50 @@ def rewrite_clause_inner(origin: str, target: str, clause_type: str) -> dict:
             Cannot rewrite the internal left/right/full/cross join condition.
             """
             for outer_join_ptr in range(mem_join_ptr):
-                if join[outer_join_ptr]["condition"] != []:
+                if remaining[outer_join_ptr]:
                     for outer_join_ptr_2 in range(outer_join_ptr, mem_join_ptr):
-                        if join[outer_join_ptr_2]["type"] != "INNER":
+                        if extract_target.join[outer_join_ptr_2].type != "INNER":
                             join_condition = False
 
             if join_condition:
 
                 from_clause = rewrite_clause_inner(origin, target, "from")
+                origin_alias = extract_origin.from_[0].alias
+                origin_select_alias = {item.alias for item in extract_origin.select}
 
-                for outer_join_ptr in range(len(join)):
-                    if join[outer_join_ptr]["type"] != "CROSS":
-                        for inner_join_ptr in range(
-                            len(join[outer_join_ptr]["condition"])
-                        ):
-                            match = match_table_and_column(
-                                join[outer_join_ptr]["condition"][inner_join_ptr],
-                                extract_origin["from"][0]["alias"],
-                            )
+                for outer_join_ptr, target_join in enumerate(extract_target.join):
+                    if target_join.type != "CROSS":
+                        for inner_join_ptr, cond in enumerate(remaining[outer_join_ptr]):
+                            match = match_table_and_column(cond, origin_alias)
                             """
                             Cannot refer to columns or tables that are not defined in the rewritten sql.
                             """
                             for table in match["table"]:
                                 if (
-                                    table != extract_origin["from"][0]["alias"]
-                                    and table != join[outer_join_ptr]["table"]["alias"]
+                                    table != origin_alias
+                                    and table != target_join.table.alias
                                 ):
                                     join_condition = False
                             for column in match["column"]:
-                                if column not in [
-                                    item["alias"] for item in extract_origin["select"]
-                                ]:
+                                if column not in origin_select_alias:
                                     join_condition = False
                             """
                             Rewrite the join condition with the new table alias.
                             """
-                            rewritten_condition = re.sub(
-                                rf'(?<!\.){re.escape(extract_origin["from"][0]["alias"])}\.',
+                            remaining[outer_join_ptr][inner_join_ptr] = re.sub(
+                                rf'(?<!\.){re.escape(origin_alias)}\.',
                                 f"{from_clause['value'][0]['alias']}.",
-                                join[outer_join_ptr]["condition"][inner_join_ptr],
+                                cond,
                             )
 
-                            join[outer_join_ptr]["condition"][
-                                inner_join_ptr
-                            ] = rewritten_condition
-
         if join_condition:
-            join = [item for item in join if item["condition"]]
+            join = tuple(
+                target_join.replace(condition=remaining[i])
+                for i, target_join in enumerate(extract_target.join)
+                if remaining[i]
+            )
         else:
-            join = []
+            join = ()
 
         return_value = {"condition": join_condition, "value": join}
 
@@ -517,21 +478,23 @@ def rewrite_clause_inner(origin: str, target: str, clause_type: str) -> dict:
             >>> target = "WHERE A AND B"
             # Rewrittion should be ... FROM origin WHERE B
         """
-        origin_ptr = 0
-        condition = True
+        """
+        The target must contain every origin condition. Conditions are a
+        conjunction, so this is a subset test on the precomputed sets.
+        """
+        origin_set = getattr(extract_origin, f"{clause_type}_set")
+        condition = origin_set <= getattr(extract_target, f"{clause_type}_set")
         value = []
         from_clause = rewrite_clause_inner(origin, target, "from")
+        origin_select_alias = {item.alias for item in extract_origin.select}
 
-        for target_ptr in range(len(extract_target[clause_type])):
-            need_processing = (
-                origin_ptr == len(extract_origin[clause_type])
-                or extract_target[clause_type][target_ptr]
-                != extract_origin[clause_type][origin_ptr]
-            )
+        for target_item in extract_target[clause_type]:
+            if not condition:
+                break
 
-            if need_processing:
+            if target_item not in origin_set:
                 match = match_table_and_column(
-                    extract_target[clause_type][target_ptr],
+                    target_item,
                     extract_origin["from"][0]["alias"],
                 )
 
@@ -540,9 +503,7 @@ def rewrite_clause_inner(origin: str, target: str, clause_type: str) -> dict:
                         condition = False
 
                 for column in match["column"]:
-                    if column not in [
-                        item["alias"] for item in extract_origin["select"]
-                    ]:
+                    if column not in origin_select_alias:
                         condition = False
 
                 if not condition:
@@ -556,7 +517,7 @@ def rewrite_clause_inner(origin: str, target: str, clause_type: str) -> dict:
                     # In origin: '"table"."col1 = ..." -> '"tmp_tb"."col1 = ..."
                 """
 
-                rewritten_condition = extract_target[clause_type][target_ptr]
+                rewritten_condition = target_item
 
                 for item in extract_origin["select"]:
                     """
@@ -570,7 +531,7 @@ def rewrite_clause_inner(origin: str, target: str, clause_type: str) -> dict:
                             item["name"],
                             re.IGNORECASE,
                         )
-                        and item["name"] in extract_target[clause_type][target_ptr]
+                        and item["name"] in target_item
                     ):
                         rewritten_condition = re.sub(
                             item["name"],
@@ -598,16 +559,10 @@ def rewrite_clause_inner(origin: str, target: str, clause_type: str) -> dict:
                 )
                 value.append(rewritten_condition)
 
-            else:
-                origin_ptr = min(origin_ptr + 1, len(extract_origin[clause_type]))
-
-        if origin_ptr != len(extract_origin[clause_type]):
-            condition = False
-
         if condition:
-            value = [item for item in value if item is not None]
+            value = tuple(item for item in value if item is not None)
         else:
-            value = []
+            value = ()
 
         return_value = {"condition": condition, "value": value}
 
@@ -626,9 +581,9 @@ def rewrite_clause_inner(origin: str, target: str, clause_type: str) -> dict:
         where_clause = rewrite_clause_inner(origin, target, "where")
         join_clause = rewrite_clause_inner(origin, target, "join")
 
-        has_no_filter = where_clause["value"] == [] and join_clause["value"] == []
-        group_match = extract_target["group"] == extract_origin["group"]
-        target_has_no_group = extract_target["group"] == []
+        has_no_filter = not where_clause["value"] and not join_clause["value"]
+        group_match = extract_target.group == extract_origin.group
+        target_has_no_group = not extract_target.group
 
         if (has_no_filter and group_match) or (
             target_has_no_group and (has_no_filter != group_match)
@@ -637,7 +592,7 @@ def rewrite_clause_inner(origin: str, target: str, clause_type: str) -> dict:
         elif not has_no_filter and not group_match and target_has_no_group:
             group_condition, group = False, []
         else:
-            group_condition, group = True, extract_target["group"].copy()
+            group_condition, group = True, list(extract_target.group)
 
             agg_func = get_agg_func(target)
             if not agg_func:
@@ -663,13 +618,13 @@ def rewrite_clause_inner(origin: str, target: str, clause_type: str) -> dict:
                 if not re.search(r"\s+" + re.escape(item) + r"\s+", combine_string):
                     group_condition = False
 
-                if item not in extract_origin["group"]:
+                if item not in extract_origin.group_set:
                     group_condition = False
 
-            where_and_join_conditions = where_clause["value"]
+            where_and_join_conditions = list(where_clause["value"])
             for item in join_clause["value"]:
                 if item["type"] != "CROSS":
-                    where_and_join_conditions += item["condition"]
+                    where_and_join_conditions.extend(item["condition"])
 
             for condition in where_and_join_conditions:
                 is_valid = False
@@ -733,7 +688,7 @@ def rewrite_clause_inner(origin: str, target: str, clause_type: str) -> dict:
         if not group_condition:
             group = []
 
-        return_value = {"condition": group_condition, "value": group}
+        return_value = {"condition": group_condition, "value": tuple(group)}
 
     elif clause_type == "order":
         """
@@ -754,7 +709,7 @@ def rewrite_clause_inner(origin: str, target: str, clause_type: str) -> dict:
         order = []
 
         if extract_origin["order"]:
-            return {"condition": False, "value": []}
+            return {"condition": False, "value": ()}
 
         for item in extract_target["order"]:
             pattern_schema_table_column = (
@@ -820,9 +775,9 @@ def rewrite_clause_inner(origin: str, target: str, clause_type: str) -> dict:
                     order_condition = False
 
         if not order_condition:
-            order = []
+            order = ()
         else:
-            order = [item for item in order if item is not None]
+            order = tuple(item for item in order if item is not None)
 
         return_value = {"condition": order_condition, "value": order}
 
@@ -854,9 +809,9 @@ def rewrite_clause_inner(origin: str, target: str, clause_type: str) -> dict:
             r"^\d+$", extract_target["limit"][0]
         ):
             log("error.txt", f"Invalid LIMIT value in target query")
-            return {"condition": False, "value": []}
+            return {"condition": False, "value": ()}
 
-        limit = extract_target["limit"].copy() if limit_condition else []
+        limit = extract_target.limit if limit_condition else ()
         return_value = {"condition": limit_condition, "value": limit}
 
     elif clause_type == "distinct":
@@ -877,11 +832,11 @@ def rewrite_clause_inner(origin: str, target: str, clause_type: str) -> dict:
             {'condition': True, 'value': ['DISTINCT']}
         """
         distinct_condition = extract_origin["distinct"] == extract_target["distinct"]
-        distinct = extract_target["distinct"].copy() if distinct_condition else []
+        distinct = extract_target.distinct if distinct_condition else ()
         return_value = {"condition": distinct_condition, "value": distinct}
 
-    rewrite_clause_dict[(origin, target, clause_type)] = return_value.copy()
-    return rewrite_clause_dict[(origin, target, clause_type)]
+    rewrite_clause_dict[clause_key] = return_value.copy()
+    return return_value
 
 
 def rewrite_clause(origin: str, target: str) -> str:
@@ -929,6 +884,7 @@ def rewrite(original_script_list: List[str], target_script: str) -> str:
         Rewritten SQL script if successful, otherwise returns target script
     """
 
+    start_time = time.perf_counter()
     rewrite = target_script
     is_sample = False
     for item in original_script_list:
@@ -941,6 +897,7 @@ def rewrite(original_script_list: List[str], target_script: str) -> str:
             if is_sample:
                 set_sample()
             break
+    record_profile("rewrite", time.perf_counter() - start_time)
     return rewrite
 
 
@@ -955,28 +912,46 @@ async def get_powerset(script: str) -> str:
     that are not already present in the SELECT or GROUP BY clauses.
     2. Remove ORDER BY and LIMIT clauses.
 
+    The columns are ranked by the column usage model (see create_column) and
+    taken within the width budget. Columns in the middle speculated by the LLM
+    rank first. If the middle has not arrived within --plugin-middle-timeout,
+    wait for the LLM. If the middle arrives later, while its request is still
+    running, the background workers get it as a string (see
+    set_speculate_middle) and create the wider table. A request that is
+    already behind its deadline plan (see deadline) adds no column.
+
     Args:
         script: The (MainQuery) SQL query
 
     Returns:
         Modified SQL query with additional columns added to SELECT and GROUP BY clauses
     """
-    extract_script = extract(script)
+    extract_script = extract(script).replace(order=(), limit=())
 
-    extract_script["order"] = []
-    extract_script["limit"] = []
-
-    middle = await get_speculate_middle()
     table_name = extract_script["from"][0]["name"][1:-1]
-    alternative_columns = list(get_schema()[table_name].keys())
+
+    # Behind the deadline of the request, the table is not widened at all
+    widen = not is_behind_deadline("create")
+    # Nor does the wait for the middle query outlast the create budget
+    middle_timeout = get_plugin_param()["middle_timeout"]
+    create_budget = get_stage_budget("create")
+    if create_budget is not None:
+        middle_timeout = min(middle_timeout, max(create_budget, 0))
+    middle = (
+        await get_speculate_middle(
+            timeout=None if is_background_thread() else middle_timeout
+        )
+        if widen
+        else None
+    )
 
     columns_to_add = []
     agg_funcs = get_agg_func(script)
 
-    if agg_funcs is not None and (
+    if widen and agg_funcs is not None and (
         agg_funcs == [None] * len(agg_funcs) or extract_script["group"]
     ):
-        for col in alternative_columns:
+        for col in rank_column(table_name, middle):
             should_add = True
 
             # Skip if column already in SELECT
@@ -991,26 +966,28 @@ async def get_powerset(script: str) -> str:
                     should_add = False
                     break
 
-            # Skip if column not in middle result
-            if col not in middle:
-                should_add = False
-
             if should_add:
                 columns_to_add.append(col)
 
-    extract_script["select"].extend(
-        [
-            {
-                "name": f'{extract_script["from"][0]["alias"]}."{col}"',
-                "alias": f'"{col}"',
-            }
+        columns_to_add = select_column(table_name, columns_to_add, middle)
+
+    extract_script = extract_script.replace(
+        select=extract_script.select
+        + tuple(
+            ClauseItem(
+                name=f'{extract_script["from"][0]["alias"]}."{col}"',
+                alias=f'"{col}"',
+            )
             for col in columns_to_add
-        ]
+        )
     )
 
     if extract_script["group"]:
-        extract_script["group"].extend(
-            [f'{extract_script["from"][0]["alias"]}."{col}"' for col in columns_to_add]
+        extract_script = extract_script.replace(
+            group=extract_script.group
+            + tuple(
+                f'{extract_script["from"][0]["alias"]}."{col}"' for col in columns_to_add
+            )
         )
 
     return format_clause(extract_script)
@@ -1038,15 +1015,16 @@ def resolve_alias_conflict(script: str) -> str:
     if not support_rewrite(script):
         return format(script)
 
-    select = extract(script)["select"]
-    distinct = extract(script)["distinct"]
+    extract_script = extract(script)
+    select = list(extract_script.select)
+    distinct = extract_script.distinct
     alias_set = set()
 
     for i in range(len(select)):
         if select[i]["alias"] not in alias_set:
             alias_set.add(select[i]["alias"])
         else:
-            select[i]["alias"] = f'"{select[i]["alias"][1:-1]}_COL_{i}"'
+            select[i] = select[i].replace(alias=f'"{select[i]["alias"][1:-1]}_COL_{i}"')
             alias_set.add(select[i]["alias"])
 
     format_select = ", ".join(
@@ -1057,3 +1035,226 @@ def resolve_alias_conflict(script: str) -> str:
     formatted_script = f"SELECT {distinct[0] if distinct else ''} {format_select} {script[from_clause_start:]}"
 
     return format(formatted_script)
+
+
+# -----------------------------------------------------------------------------
+# Split Window
+# -----------------------------------------------------------------------------
+
+
+def is_grouping(node: exp.Expression) -> bool:
+    """Return whether a node is a GROUPING(...) call of a ROLLUP, CUBE or GROUPING SETS."""
+    return isinstance(node, exp.Anonymous) and node.name.upper() == "GROUPING"
+
+
+def get_group_list(group: Optional[exp.Group]) -> Optional[List[exp.Expression]]:
+    """
+    Return the grouping expressions of a GROUP BY clause, including those of
+    ROLLUP, CUBE and GROUPING SETS.
+
+    Returns:
+        Optional[List[exp.Expression]]: None if the clause groups by position,
+        which cannot be matched against the SELECT list of the inner query
+    """
+    if group is None:
+        return []
+    group_list = list(group.expressions)
+    for arg in ["rollup", "cube", "grouping_sets"]:
+        for item in group.args.get(arg) or []:
+            for node in item.expressions:
+                group_list.extend(node.expressions if isinstance(node, exp.Tuple) else [node])
+    if any(isinstance(node, exp.Literal) for node in group_list):
+        return None
+    return group_list
+
+
+def split_window(script: str) -> Optional[Dict[str, str]]:
+    """
+    Split a main query with window functions into the pre-window SPJ(G) part and
+    the window part evaluated over it.
+
+    The inner query keeps FROM, JOIN, WHERE, GROUP BY and HAVING, and selects every
+    grouping expression, aggregate and GROUPING() call that the window part needs,
+    each as a whole. The outer query evaluates the window functions, ORDER BY, and
+    LIMIT over WINDOW_TABLE, which merge_window replaces with the (rewritten) inner
+    query. Iterating on ranking or running-total expressions then reuses the
+    temporary table of the inner query.
+
+    Args:
+        script: The (MainQuery) SQL query, in the endpoint dialect
+
+    Returns:
+        Dictionary containing 'inner' and 'outer' scripts, or None if the query has
+        no window functions or cannot be split
+
+    Example:
+        >>> split_window(
+            'SELECT "t"."a" AS "a", RANK() OVER (ORDER BY SUM("t"."x")) AS "r" '
+            'FROM "t" AS "t" GROUP BY "t"."a"'
+        )
+        {
+            'inner': 'SELECT "T"."A" AS "A", SUM ( "T"."X" ) AS "SUM_X" FROM "T" AS "T" GROUP BY "T"."A"',
+            'outer': 'SELECT "SPEQL_WINDOW"."A" AS "A", RANK ( ) OVER ( ORDER BY "SPEQL_WINDOW"."SUM_X" ) AS "R" '
+                     'FROM "SPEQL_WINDOW" AS "SPEQL_WINDOW"'
+        }
+    """
+    dialect = get_dialect_param()["endpoint"]
+    try:
+        parsed = get_query(script, dialect).copy()
+    except Exception:
+        return None
+
+    if not isinstance(parsed, exp.Select) or parsed.find(exp.Window) is None:
+        return None
+
+    """
+    Only handle window functions at the top level of a plain SPJ(G) query.
+    """
+    if parsed.args.get("with") or parsed.find(exp.Subquery) is not None:
+        return None
+
+    if any(window.parent_select is not parsed for window in parsed.find_all(exp.Window)):
+        return None
+
+    group_list = get_group_list(parsed.args.get("group"))
+    if group_list is None:
+        return None
+    group_key_set = {node.sql() for node in group_list}
+
+    output_alias_set = {item.alias_or_name.upper() for item in parsed.expressions}
+    hoist_dict: Dict[str, Tuple[exp.Expression, str]] = {}
+    hoist_alias_set = set()
+    unsplittable_list: List[exp.Expression] = []
+
+    def hoist(node: exp.Expression) -> exp.Expression:
+        """
+        Move a column, grouping expression or aggregate into the inner query and
+        refer to it by alias. The alias is derived from the expression so that it
+        stays the same when the user only edits the window part.
+
+        Example:
+            >>> '"t"."a"' -> '"A"'
+            >>> 'SUM("t"."x")' -> '"SUM_X"'
+            >>> '"t"."a" + 1' -> '"ADD_A"'
+        """
+        key = node.sql()
+        if key not in hoist_dict:
+            if isinstance(node, exp.Column):
+                alias = node.name.upper()
+            else:
+                name = node.name if isinstance(node, exp.Anonymous) else node.key
+                alias = "_".join(
+                    [name.upper()]
+                    + [column.name.upper() for column in node.find_all(exp.Column)]
+                )
+            suffix, index = alias, 1
+            while alias in hoist_alias_set:
+                alias = f"{suffix}_{index}"
+                index += 1
+            hoist_alias_set.add(alias)
+            hoist_dict[key] = (node.copy(), alias)
+
+        return exp.column(hoist_dict[key][1], table=WINDOW_TABLE[1:-1], quoted=True)
+
+    def split(node: exp.Expression) -> exp.Expression:
+        """
+        Keep window nodes and the window function itself; hoist the grouping
+        expressions, aggregates and columns outside or inside of them. Hoisted
+        nodes are not traversed again. In a grouped query, a column that is not
+        part of a hoisted node cannot be selected by the inner query.
+        """
+        if isinstance(node, exp.Window):
+            return node
+        if isinstance(node.parent, exp.Window) and node.arg_key == "this":
+            return node
+        if isinstance(node, exp.Column) and not node.table:
+            if node.name.upper() in output_alias_set:
+                return node
+        if (
+            isinstance(node, exp.AggFunc)
+            or is_grouping(node)
+            or (group_key_set and node.sql() in group_key_set)
+        ):
+            return hoist(node)
+        if isinstance(node, exp.Column):
+            if group_key_set:
+                unsplittable_list.append(node)
+                return node
+            return hoist(node)
+        return node
+
+    try:
+        outer_select = [item.transform(split) for item in parsed.expressions]
+        outer_order = (
+            parsed.args["order"].transform(split) if parsed.args.get("order") else None
+        )
+        outer_qualify = (
+            parsed.args["qualify"].transform(split)
+            if parsed.args.get("qualify")
+            else None
+        )
+    except Exception as e:
+        log("error.txt", f"Cannot split window: {e}. Script: {script}")
+        return None
+
+    if not hoist_dict or unsplittable_list:
+        return None
+
+    inner = parsed.copy()
+    inner.set(
+        "expressions",
+        [node.as_(alias, quoted=True) for node, alias in hoist_dict.values()],
+    )
+    for arg in ["order", "limit", "offset", "distinct", "qualify"]:
+        inner.set(arg, None)
+
+    window_name = WINDOW_TABLE[1:-1]
+    outer = exp.Select(
+        expressions=outer_select,
+        distinct=parsed.args.get("distinct"),
+        order=outer_order,
+        qualify=outer_qualify,
+        limit=parsed.args.get("limit"),
+    ).from_(
+        exp.Table(
+            this=exp.to_identifier(window_name, quoted=True),
+            alias=exp.TableAlias(this=exp.to_identifier(window_name, quoted=True)),
+        )
+    )
+
+    return {
+        "inner": format(inner.sql(dialect=dialect)),
+        "outer": format(outer.sql(dialect=dialect)),
+    }
+
+
+def merge_window(outer_script: str, inner_script: str) -> str:
+    """
+    Replace WINDOW_TABLE in the outer query of split_window with the inner query.
+
+    Args:
+        outer_script: The outer query of split_window
+        inner_script: The (rewritten) inner query
+
+    Returns:
+        str: The formatted query, in the endpoint dialect
+
+    Example:
+        >>> merge_window(
+            'SELECT "SPEQL_WINDOW"."A" AS "A" FROM "SPEQL_WINDOW" AS "SPEQL_WINDOW"',
+            'SELECT "T"."A" AS "A" FROM "SPEQL_TEMP_TABLE_1"'
+        )
+        'SELECT "SPEQL_WINDOW"."A" AS "A" FROM ( SELECT "T"."A" AS "A" FROM "SPEQL_TEMP_TABLE_1" ) AS "SPEQL_WINDOW"'
+    """
+    dialect = get_dialect_param()["endpoint"]
+    window_name = WINDOW_TABLE[1:-1]
+    merged = get_query(outer_script, dialect).copy()
+    for table in list(merged.find_all(exp.Table)):
+        if table.name.upper() == window_name and not table.args.get("db"):
+            table.replace(
+                exp.Subquery(
+                    this=get_query(inner_script, dialect).copy(),
+                    alias=exp.TableAlias(this=exp.to_identifier(window_name, quoted=True)),
+                )
+            )
+    return format(merged.sql(dialect=dialect))
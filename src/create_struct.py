@@ -20,7 +20,9 @@ Key Components:
 """
 
 import sys
+import threading
 from pathlib import Path
+from typing import Iterable, Optional
 
 # -----------------------------------------------------------------------------
 # Path Configuration
@@ -42,6 +44,20 @@ sys.path.extend(
 from param import get_plugin_param, get_system_name
 from db_api import get_cursor
 from log import log
+from query import get_fingerprint
+from preview_cache import invalidate_preview, reset_preview_cache
+from cache import BoundedCache
+
+# -----------------------------------------------------------------------------
+# Global Variables
+# -----------------------------------------------------------------------------
+
+"""
+Maps a CTE fingerprint to the temporary table that materializes the CTE (see
+create_cte): {"name", "version", "is_sample"}. The version tells a table
+apart from a later table of the same name, e.g. after reset().
+"""
+cte_dict = BoundedCache("cte")
 
 # -----------------------------------------------------------------------------
 # Temporary Table Pool
@@ -53,17 +69,30 @@ class TemporaryTablePool:
     Manages a pool of temporary tables with LRU eviction strategy.
 
     This pool maintains the mapping from the script to the table name, the LRU
-    list, and metadata (size, sample status).
+    list, and metadata (size, sample status). Scripts are identified by their
+    canonical fingerprint, so formatting or comment differences still hit.
     """
 
     def __init__(self) -> None:
         """Initialize an empty table pool with tracking structures."""
-        # Maps scripts to table name
+        # Maps script fingerprints to table name, the script itself and metadata
         self.script_to_name = {}
         # Counter for unique table names, is incremented when creating a new table
         self.index = 0
         # Tracks table access order. The item in lru is the same as the key in script_to_name
         self.lru = []
+        # Maps script fingerprints to names reserved for tables being created
+        self.reserved = {}
+        # Background workers and the request thread use the pool concurrently.
+        # Every method that reads or writes lru or script_to_name holds it.
+        self.lock = threading.RLock()
+        # Counter for table versions, is never reset, so that a table created
+        # again under a reused name gets a new version (see preview_cache)
+        self.version = 0
+
+    def get_key(self, script: str) -> str:
+        """Return the key of a script in script_to_name."""
+        return get_fingerprint(script, comments=False)
 
     def lru_evict(self) -> None:
         """
@@ -79,43 +108,45 @@ class TemporaryTablePool:
             >>> TemporaryTablePool.lru_evict()
             # Evicts least recently used tables if size/count limits are exceeded
         """
-        iterator = -1
-        size = sum(
-            [self.script_to_name[script]["size"] for script in self.script_to_name]
-        )
-
-        while (
-            len(self.lru) > get_plugin_param()["temporary_table_count"]
-            or size > get_plugin_param()["temporary_table_size"]
-        ):
-            if iterator == -len(self.lru) - 1:
-                log(
-                    "error.txt",
-                    f"Error: Cannot drop any temporary table",
-                )
-                break
-
-            try:
-                # Attempt to drop the least recently used table
-                table_name = self.script_to_name[self.lru[iterator]]["name"]
-                get_cursor()["execute"].execute(f"DROP TABLE IF EXISTS {table_name}")
-
-                log(
-                    "mem_mgmt.txt",
-                    {"type": "drop", "name": table_name, "size": self.script_to_name[self.lru[iterator]]['size']},
-                    is_dict=True,
-                )
-
-                # Update tracking structures
-                size -= self.script_to_name[self.lru[iterator]]["size"]
-                del self.script_to_name[self.lru[iterator]]
-                self.lru.pop(iterator)
-
-                iterator = -1
-
-            except Exception as e:
-                # If other temporary tables depend on this table, it will not be dropped
-                iterator -= 1
+        with self.lock:
+            iterator = -1
+            size = sum(
+                [self.script_to_name[script]["size"] for script in self.script_to_name]
+            )
+
+            while (
+                len(self.lru) > get_plugin_param()["temporary_table_count"]
+                or size > get_plugin_param()["temporary_table_size"]
+            ):
+                if iterator == -len(self.lru) - 1:
+                    log(
+                        "error.txt",
+                        f"Error: Cannot drop any temporary table",
+                    )
+                    break
+
+                try:
+                    # Attempt to drop the least recently used table
+                    table_name = self.script_to_name[self.lru[iterator]]["name"]
+                    get_cursor()["execute"].execute(f"DROP TABLE IF EXISTS {table_name}")
+
+                    log(
+                        "mem_mgmt.txt",
+                        {"type": "drop", "name": table_name, "size": self.script_to_name[self.lru[iterator]]['size']},
+                        is_dict=True,
+                    )
+
+                    # Update tracking structures
+                    invalidate_preview(table_name)
+                    size -= self.script_to_name[self.lru[iterator]]["size"]
+                    del self.script_to_name[self.lru[iterator]]
+                    self.lru.pop(iterator)
+
+                    iterator = -1
+
+                except Exception as e:
+                    # If other temporary tables depend on this table, it will not be dropped
+                    iterator -= 1
 
     def check(self, script, update_lru=True) -> dict:
         """
@@ -149,21 +180,64 @@ class TemporaryTablePool:
             {'name': '"SpeQL_temp_table_2"', 'is_new': True}
 
         """
-        if script in self.script_to_name:
-            if update_lru:
-                # Move accessed table to front of LRU list
-                for i in range(len(self.lru)):
-                    if self.lru[i] == script:
+        key = self.get_key(script)
+        with self.lock:
+            if key in self.script_to_name:
+                if update_lru:
+                    # Move accessed table to front of LRU list
+                    for i in range(len(self.lru)):
+                        if self.lru[i] == key:
+                            self.lru = [self.lru[i]] + self.lru[:i] + self.lru[i + 1 :]
+                            break
+                return {"name": self.script_to_name[key]["name"], "is_new": False}
+            elif key in self.reserved:
+                return {"name": self.reserved[key], "is_new": True}
+            else:
+                return {
+                    "name": f'"{get_system_name().upper()}_TEMP_TABLE_{self.index + 1}"',
+                    "is_new": True,
+                }
+
+    def reserve_name(self, script) -> str:
+        """
+        Reserve the name of the table to be created for a script, so that
+        tables created concurrently do not get the same name. update() takes
+        over the reserved name.
+
+        Args:
+            script (str): Script identifier
+
+        Returns:
+            str: The reserved table name
+        """
+        key = self.get_key(script)
+        with self.lock:
+            if key not in self.reserved:
+                self.index += 1
+                self.reserved[key] = f'"{get_system_name().upper()}_TEMP_TABLE_{self.index}"'
+            return self.reserved[key]
+
+    def check_name(self, name, update_lru=True) -> bool:
+        """
+        Check if a temporary table is still in the pool, e.g. it has not been
+        evicted since its name was remembered elsewhere.
+
+        Args:
+            name (str): Name of the temporary table
+            update_lru (bool): If True, moves the table to front of LRU list.
+
+        Returns:
+            bool: Whether the table is in the pool
+        """
+        with self.lock:
+            for i in range(len(self.lru)):
+                if self.script_to_name[self.lru[i]]["name"] == name:
+                    if update_lru:
                         self.lru = [self.lru[i]] + self.lru[:i] + self.lru[i + 1 :]
-                        break
-            return {"name": self.script_to_name[script]["name"], "is_new": False}
-        else:
-            return {
-                "name": f'"{get_system_name().upper()}_TEMP_TABLE_{self.index + 1}"',
-                "is_new": True,
-            }
+                    return True
+            return False
 
-    def update(self, script, is_sample, create_metrics) -> None:
+    def update(self, script, is_sample, create_metrics, ratio=1.0) -> None:
         """
         Register a new temporary table in the pool. The caller must ensure that
         the script has not been registered in the pool.
@@ -173,22 +247,39 @@ class TemporaryTablePool:
             is_sample (bool): Whether table contains sampled data. This may happen
             when the table is created from a sampled table due to timeout.
             create_metrics (dict): Metrics of the create operation
+            ratio (Optional[float]): Fraction of the rows of the data that the
+            table holds, 1.0 if it is exact, or None if it aggregates a sample
+            (see get_ratio)
 
         Returns:
             None
 
         """
-        self.index += 1
-        assert script not in self.script_to_name, "Script already registered"
-
-        name = f'"{get_system_name().upper()}_TEMP_TABLE_{self.index}"'
+        key = self.get_key(script)
+
+        with self.lock:
+            assert key not in self.script_to_name, "Script already registered"
+
+            name = self.reserved.pop(key, None)
+            if name is None:
+                self.index += 1
+                name = f'"{get_system_name().upper()}_TEMP_TABLE_{self.index}"'
+
+            # Register new table
+            self.version += 1
+            self.script_to_name[key] = {
+                "name": name,
+                "script": script,
+                "is_sample": is_sample,
+                "ratio": ratio,
+                "size": create_metrics["create_size"],
+                "version": self.version,
+            }
+            # Update tracking lists
+            self.lru = [key] + self.lru
 
-        # Register new table
-        self.script_to_name[script] = {
-            "name": name,
-            "is_sample": is_sample,
-            "size": create_metrics["create_size"],
-        }
+        # Previews cached against an earlier table of the same name are stale
+        invalidate_preview(name)
 
         log(
             "mem_mgmt.txt",
@@ -196,9 +287,6 @@ class TemporaryTablePool:
             is_dict=True,
         )
 
-        # Update tracking lists
-        self.lru = [script] + self.lru
-
     def reset(self) -> None:
         """
         Reset the temporary table pool. For testing use when you want to run multiple queries
@@ -207,21 +295,25 @@ class TemporaryTablePool:
         Warning: You still need to run clear_debug_simple_message() to clear the debug message
         if you are using LLM debugging module.
         """
-        for script in self.lru:
-            try:
-
-                get_cursor()["execute"].execute(
-                    f"DROP TABLE IF EXISTS {self.script_to_name[script]['name']} CASCADE;"
-                )
-            except Exception as e:
-                log(
-                    "error.txt",
-                    f"Error: Cannot drop table {script}: {e}",
-                )
-
-        self.script_to_name = {}
-        self.index = 0
-        self.lru = []
+        with self.lock:
+            for key in self.lru:
+                try:
+
+                    get_cursor()["execute"].execute(
+                        f"DROP TABLE IF EXISTS {self.script_to_name[key]['name']} CASCADE;"
+                    )
+                except Exception as e:
+                    log(
+                        "error.txt",
+                        f"Error: Cannot drop table {self.script_to_name[key]['script']}: {e}",
+                    )
+
+            self.script_to_name = {}
+            self.index = 0
+            self.lru = []
+            self.reserved = {}
+            cte_dict.clear()
+            reset_preview_cache()
 
     def get_is_sample(self, script) -> bool:
         """
@@ -234,15 +326,83 @@ class TemporaryTablePool:
         Returns:
             bool: Whether the table contains sampled data
         """
-        assert script in self.script_to_name, "Script not registered"
-        return self.script_to_name[script]["is_sample"]
+        key = self.get_key(script)
+        with self.lock:
+            assert key in self.script_to_name, "Script not registered"
+            return self.script_to_name[key]["is_sample"]
+
+    def get_table(self, name) -> Optional[dict]:
+        """
+        Return the metadata of a temporary table by name.
+
+        Args:
+            name (str): Name of the temporary table
+
+        Returns:
+            Optional[dict]: {"name", "script", "is_sample", "ratio", "size", "version"},
+            or None if the table is not in the pool
+        """
+        with self.lock:
+            for key in self.lru:
+                if self.script_to_name[key]["name"] == name:
+                    return dict(self.script_to_name[key])
+            return None
+
+    def get_version(self, name) -> Optional[int]:
+        """
+        Return the version of a temporary table, which changes whenever a
+        table is created under its name.
+
+        Args:
+            name (str): Name of the temporary table
+
+        Returns:
+            Optional[int]: None if the table is not in the pool
+        """
+        table = self.get_table(name)
+        return None if table is None else table["version"]
+
+    def get_ratio(self, name_list: Iterable[str]) -> Optional[float]:
+        """
+        Return the fraction of the rows of the data that a query over some
+        tables reads, so that its aggregates can be scaled (see
+        scale_aggregate). Tables that are not in the pool are exact.
+
+        Args:
+            name_list (Iterable[str]): Names of the tables the query reads
+
+        Returns:
+            Optional[float]: The product of the ratios of the tables, or None
+            if a table holds aggregates of a sample, which cannot be scaled
+
+        Example:
+            >>> # "SPEQL_TEMP_TABLE_1" sampled at 0.25, "T" a base table
+            >>> temporary_table_pool.get_ratio(['"SPEQL_TEMP_TABLE_1"', '"T"'])
+            0.25
+        """
+        ratio = 1.0
+        with self.lock:
+            name_to_ratio = {
+                table["name"]: table["ratio"] for table in self.script_to_name.values()
+            }
+        for name in name_list:
+            if name not in name_to_ratio:
+                continue
+            if name_to_ratio[name] is None:
+                return None
+            ratio *= name_to_ratio[name]
+        return ratio
 
     def get_query_cache_list(self) -> list:
         """
         Return the current query cache list. At most get_plugin_param()["query_cache_count"] items.
         SpeQL will use the query cache to rewrite the query.
         """
-        return self.lru[: get_plugin_param()["query_cache_count"]]
+        with self.lock:
+            return [
+                self.script_to_name[key]["script"]
+                for key in self.lru[: get_plugin_param()["query_cache_count"]]
+            ]
 
 
 # -----------------------------------------------------------------------------
@@ -14,10 +14,11 @@ Sample the query if the query takes too long.
 
 import sys
 import re
+import time
 import threading
 import redshift_connector
 from pathlib import Path
-from typing import Optional, Any, Dict
+from typing import Optional, Any, Callable, Dict, Hashable, List, Tuple
 import sqlglot
 
 # -----------------------------------------------------------------------------
@@ -37,7 +38,7 @@ sys.path.extend(
 # Local Imports
 # -----------------------------------------------------------------------------
 
-from format import format_preview, format
+from format import format_preview_table, format
 from sqlglot import exp
 from concurrency import get_recent_tid, get_execute_cursor_lock
 from param import (
@@ -48,10 +49,42 @@ from param import (
     get_dialect_param,
     get_max_iteration,
 )
-from db_api import get_cursor
+from db_api import get_cursor, fetch_column
 from log import log, append_test_info
-from sample import sample_script
+from sample import get_sample_script, get_relative_error
+from sample import set_sample, reset_sample, get_sample
+from cost import get_sample_time, add_warehouse_time
+from latency import get_initial_sample_time, update_latency, predict_latency
+from create_execute import get_explain_cost
 from parse import get_parse
+from query import get_query
+from create_struct import temporary_table_pool
+from preview_cache import get_cached_preview, set_cached_preview
+
+# -----------------------------------------------------------------------------
+# Global Variables
+# -----------------------------------------------------------------------------
+
+# Maps a request thread to the structured form of its latest preview
+preview_table: Dict[int, Dict[str, Any]] = {}
+
+# -----------------------------------------------------------------------------
+# Structured Preview
+# -----------------------------------------------------------------------------
+
+
+def set_preview_table(table: Dict[str, Any]) -> None:
+    """Record the structured preview of the current thread."""
+    preview_table[threading.get_ident()] = table
+
+
+def get_preview_table() -> Optional[Dict[str, Any]]:
+    """
+    Return and forget the structured preview of the current thread, see
+    format_preview_table.
+    """
+    return preview_table.pop(threading.get_ident(), None)
+
 
 # -----------------------------------------------------------------------------
 # SQL Processing
@@ -78,6 +111,7 @@ def reset_limit(sql: Optional[str]) -> Optional[str]:
         not isinstance(parsed, sqlglot.exp.Select)
         and not isinstance(parsed, sqlglot.exp.Union)
         and not isinstance(parsed, sqlglot.exp.Intersect)
+        and not isinstance(parsed, sqlglot.exp.Except)
     ):
         return None
 
@@ -93,15 +127,42 @@ def reset_limit(sql: Optional[str]) -> Optional[str]:
             limit = str(get_plugin_param()["preview"] + 1)
         limit_clause.set("expression", exp.Literal.number(limit))
 
-    sql = sqlglot.transpile(
-        parsed.sql(),
-        read=get_dialect_param()["input"],
-        write=get_dialect_param()["endpoint"],
-    )[0]
+    """
+    Generate the endpoint dialect from the modified AST directly instead of
+    printing it and transpiling the text again.
+    """
+    sql = parsed.sql(dialect=get_dialect_param()["endpoint"])
 
     return format(sql)
 
 
+def get_preview_key(sql: str) -> Tuple[Hashable, List[str]]:
+    """
+    Return the key of a preview statement in the preview cache: its canonical
+    fingerprint and the version of each temporary table it reads.
+
+    Args:
+        sql: Preview statement, in the endpoint dialect
+
+    Returns:
+        Tuple[Hashable, List[str]]: Key, and the temporary tables it reads
+
+    Example:
+        >>> get_preview_key('SELECT * FROM "SPEQL_TEMP_TABLE_3" LIMIT 11')
+        (('9f0c...', (('"SPEQL_TEMP_TABLE_3"', 7),)), ['"SPEQL_TEMP_TABLE_3"'])
+    """
+    query = get_query(sql, get_dialect_param()["endpoint"])
+    table_list = sorted({f'"{table.name}"' for table in query.parse.find_all(exp.Table)})
+    version_list = tuple(
+        (table_name, temporary_table_pool.get_version(table_name))
+        for table_name in table_list
+    )
+    return (
+        (query.fingerprint(False), version_list),
+        [table_name for table_name, version in version_list if version is not None],
+    )
+
+
 # -----------------------------------------------------------------------------
 # Query Execution
 # -----------------------------------------------------------------------------
@@ -111,7 +172,10 @@ async def query(sql: str) -> Optional[Any]:
 
     get_cursor()["execute"].execute(sql)
 
-    preview_result = format_preview(get_cursor()["execute"].fetchall())
+    # By column, as Arrow arrays where the connector supports it
+    column_list, value_list = fetch_column(get_cursor()["execute"])
+    preview_result, table = format_preview_table(value_list, column_list)
+    error = get_relative_error(value_list, column_list)
 
     try:
         get_cursor()["execute"].execute(
@@ -136,9 +200,10 @@ where query_id = pg_last_query_id()
             "planning_time": -1,
         }
         
+    add_warehouse_time("preview", metrics["elapsed_time"])
     log("preview.txt", {"preview": preview_result, "script": sql, "metrics": metrics}, is_dict=True)
 
-    return {"preview": preview_result, "metrics": metrics}
+    return {"preview": preview_result, "table": table, "metrics": metrics, "error": error}
 
 
 # -----------------------------------------------------------------------------
@@ -162,16 +227,41 @@ async def preview(sql: str) -> Optional[Any]:
     if sql is None or get_recent_tid("db") != threading.get_ident():
         return None
 
+    # The same statement against the same temporary tables, see preview_cache
+    key, table_list = get_preview_key(sql)
+    cached = get_cached_preview(key)
+    if cached is not None:
+        log("preview.txt", {"preview": cached["preview"], "script": sql, "cache": True}, is_dict=True)
+        set_preview_table(cached["table"])
+        return cached["preview"]
+
+    # Scale the aggregates over sampled temporary tables as well
+    table_ratio = temporary_table_pool.get_ratio(table_list)
+
     max_attempts = get_max_iteration() if get_enable_param()["sample"] else 1
-    for retry_time in range(max_attempts):
+
+    # Start at the sample predicted to meet the latency target, see latency
+    full_cost = get_explain_cost(sql) if max_attempts > 1 else None
+    initial_retry = get_initial_sample_time("preview", full_cost, max_attempts - 1)
+
+    for retry_time in range(initial_retry, max_attempts):
         if get_recent_tid("db") != threading.get_ident():
             break
+        sampling_ratio = 1.0
         try:
             with get_execute_cursor_lock():
-                sample_sql = sample_script(sql, retry_time)
+                sample_time = get_sample_time(retry_time) if max_attempts > 1 else 0
+                sample_sql, sampling_ratio = get_sample_script(
+                    sql, sample_time, scale=True, table_ratio=table_ratio
+                )
+                if sampling_ratio < 1.0:
+                    set_sample()
                 if get_test_param()["warm_up"]:
                     result_warm_up = await query(sample_sql)
                 result = await query(sample_sql)
+                update_latency(
+                    "preview", full_cost, result["metrics"]["elapsed_time"], sampling_ratio
+                )
                 if get_test_param()["output_query"]:
                     if get_test_param()["warm_up"]:
                         append_test_info(
@@ -195,6 +285,11 @@ async def preview(sql: str) -> Optional[Any]:
                             },
                         )
 
+                if sampling_ratio == 1.0:
+                    set_cached_preview(
+                        key, table_list, {"preview": result["preview"], "table": result["table"]}
+                    )
+                set_preview_table(result["table"])
                 return result["preview"]
 
         except redshift_connector.error.ProgrammingError as e:
@@ -205,6 +300,10 @@ async def preview(sql: str) -> Optional[Any]:
                     "compile_time": -1,
                     "planning_time": -1,
                 }
+                add_warehouse_time("preview", metrics["elapsed_time"])
+                if get_recent_tid("db") == threading.get_ident():
+                    # A timeout, not a cancellation by newer input
+                    update_latency("preview", full_cost, metrics["elapsed_time"], sampling_ratio)
                 if get_test_param()["output_query"]:
                     if get_test_param()["warm_up"]:
                         append_test_info(
@@ -235,3 +334,143 @@ async def preview(sql: str) -> Optional[Any]:
             break
 
     return None
+
+
+# -----------------------------------------------------------------------------
+# Progressive Preview Generation
+# -----------------------------------------------------------------------------
+
+
+def get_progressive_ladder(full_cost: Optional[float]) -> List[int]:
+    """
+    Return the halvings of the sampling ratio of each step of a progressive
+    preview, from a sample small enough for --plugin-latency-target down to
+    the exact result. Each step reads 2^--plugin-progressive-step times as
+    many rows as the previous one.
+
+    Example:
+        >>> # Nothing predicted yet, --plugin-progressive-start 6, step 2
+        >>> get_progressive_ladder(None)
+        [6, 4, 2, 0]
+    """
+    start = get_plugin_param()["progressive_start"]
+    if predict_latency("preview", full_cost) is not None:
+        start = get_initial_sample_time("preview", full_cost, start)
+    step = max(get_plugin_param()["progressive_step"], 1)
+    return list(range(start, 0, -step)) + [0]
+
+
+async def preview_progressive(
+    sql: str, on_preview: Callable[[Dict[str, Any]], None]
+) -> Optional[Any]:
+    """
+    Generates a preview from a tiny sample first, then refines it at larger
+    sampling ratios up to the exact result (online aggregation).
+
+    Each preview is passed to on_preview as soon as it is ready, with its
+    sampling ratio and the largest relative confidence interval of its
+    aggregates (see get_relative_error). Refinement stops when a newer
+    input arrives, when a step times out, or when the next step is predicted
+    not to finish within --plugin-progressive-budget seconds.
+
+    Args:
+        sql: SQL query to preview
+        on_preview: Called with {"preview", "table", "ratio", "error", "final"}
+
+    Returns:
+        Optional[Any]: The most refined preview, or None if no step succeeds
+    """
+    sql = reset_limit(sql)
+
+    if sql is None or get_recent_tid("db") != threading.get_ident():
+        return None
+
+    key, table_list = get_preview_key(sql)
+    # The temporary tables may be sampled, see TemporaryTablePool.get_ratio
+    table_ratio = temporary_table_pool.get_ratio(table_list)
+    cached = get_cached_preview(key)
+    if cached is not None:
+        log("preview.txt", {"preview": cached["preview"], "script": sql, "cache": True}, is_dict=True)
+        set_preview_table(cached["table"])
+        on_preview(
+            {
+                "preview": cached["preview"],
+                "table": cached["table"],
+                "ratio": table_ratio,
+                "error": None,
+                "final": True,
+            }
+        )
+        return cached["preview"]
+
+    full_cost = get_explain_cost(sql)
+    deadline = time.time() + get_plugin_param()["progressive_budget"]
+    was_sample = get_sample()
+    preview_result = None
+
+    for sample_time in get_progressive_ladder(full_cost):
+        if get_recent_tid("db") != threading.get_ident():
+            break
+        sample_sql, ratio = get_sample_script(
+            sql, sample_time, scale=True, table_ratio=table_ratio
+        )
+        if sample_time > 0 and ratio == 1.0:
+            # The query cannot be sampled, go straight to the exact result
+            continue
+        predicted = predict_latency("preview", full_cost)
+        if (
+            preview_result is not None
+            and predicted is not None
+            and predicted * ratio > deadline - time.time()
+        ):
+            break
+        try:
+            with get_execute_cursor_lock():
+                if sample_time > 0:
+                    set_sample()
+                elif not was_sample:
+                    # The exact result is only marked if the tables are sampled
+                    reset_sample()
+                result = await query(sample_sql)
+                update_latency(
+                    "preview", full_cost, result["metrics"]["elapsed_time"], ratio
+                )
+            if get_test_param()["output_query"]:
+                append_test_info(
+                    "query",
+                    {
+                        "query": sql,
+                        "preview": result["preview"],
+                        "retry_time": sample_time,
+                        "query_metrics": result["metrics"],
+                    },
+                )
+        except redshift_connector.error.ProgrammingError as e:
+            if isinstance(e.args[0], dict) and e.args[0].get("C") == "57014":
+                add_warehouse_time("preview", get_db_param()["timeout"])
+            else:
+                log("error.txt", f"{str(e)}")
+            break
+        except Exception as e:
+            log("error.txt", f"{str(e)}")
+            break
+
+        preview_result = result["preview"]
+        set_preview_table(result["table"])
+        if sample_time == 0:
+            set_cached_preview(
+                key, table_list, {"preview": preview_result, "table": result["table"]}
+            )
+        if get_recent_tid("db") == threading.get_ident():
+            on_preview(
+                {
+                    "preview": preview_result,
+                    "table": result["table"],
+                    # None if the values are not scaled estimates
+                    "ratio": None if table_ratio is None else ratio * table_ratio,
+                    "error": result["error"],
+                    "final": sample_time == 0,
+                }
+            )
+
+    return preview_result
@@ -15,6 +15,7 @@ from param import get_plugin_param
 from concurrency import set_recent_tid, reset_recent_tid
 from format import prepare_sql, format, format_output
 from preview import preview
+from query import get_fingerprint
 
 
 async def test_format_output(test_data):
@@ -25,7 +26,7 @@ async def test_format_output(test_data):
     assert preview_result is not None
 
     sql_to_preview = {
-        prepare_sql_result["sql"]: {
+        get_fingerprint(prepare_sql_result["sql"]): {
             "modification": prepare_sql_result["sql"],
             "rewrite": rewrite,
             "preview": preview_result,
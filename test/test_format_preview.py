@@ -0,0 +1,143 @@
+import sys, time, datetime
+from decimal import Decimal
+from pathlib import Path
+
+root_dir = str(Path(__file__).parent.parent)
+sys.path.extend(
+    [
+        root_dir,
+        str(Path(root_dir) / "src"),
+        str(Path(root_dir) / "util"),
+    ]
+)
+
+try:
+    import pandas as pd
+except ImportError:
+    # Only the baseline of the benchmark needs pandas
+    pd = None
+
+from param import get_plugin_param
+from parse import parse_preview
+from format import format_preview_table
+
+
+def get_row_list(row_count, column_count):
+    """Rows of a wide preview, with the types Redshift returns."""
+    kind_list = [
+        lambda i, j: i * j,
+        lambda i, j: Decimal(f"{i * j}.{j:02d}"),
+        lambda i, j: datetime.date(2000, 1 + j % 12, 1 + i % 28),
+        lambda i, j: f"customer_{i}_{j}",
+        lambda i, j: None if i % 3 == 0 else i / (j + 1),
+    ]
+    return [
+        tuple(kind_list[j % len(kind_list)](i, j) for j in range(column_count))
+        for i in range(row_count)
+    ]
+
+
+def format_preview_baseline(row_list, column_list):
+    """The former path: str(row), regex, ast.literal_eval, then pandas."""
+    preview_lines = (
+        pd.DataFrame([parse_preview(str(row)) for row in row_list], columns=column_list)
+        .to_string()
+        .split("\n")
+    )
+    truncated_preview = []
+    char_count = 0
+    for i, line in enumerate(preview_lines):
+        if (
+            i == get_plugin_param()["preview"]
+            or char_count + len(line) > get_plugin_param()["preview_char"]
+        ):
+            truncated_preview.append("...")
+            break
+        truncated_preview.append(line)
+        char_count += len(line)
+    return "\n".join(truncated_preview)
+
+
+def format_preview_typed(row_list, column_list):
+    """The typed path, transposing the rows as fetch_column does on Redshift."""
+    return format_preview_table(list(zip(*row_list)), column_list)
+
+
+def benchmark(name, function, row_list, column_list, repeat):
+    start_time = time.perf_counter()
+    for _ in range(repeat):
+        result = function(row_list, column_list)
+    elapsed_time = (time.perf_counter() - start_time) / repeat
+    print(f"{name}: {elapsed_time * 1000:.3f} ms")
+    return result
+
+
+def check_format_preview_table():
+    """Offline checks of the text and the structured preview."""
+    # Confidence intervals are merged into the cells of their values
+    text, table = format_preview_table([(1,), (Decimal("2.5"),), (0.1,)], ["a", "s", "s_ci95"])
+    assert text.split("\n")[:2] == ["   a          s", "0  1  2.5 ± 0.1"], text
+    assert [column["name"] for column in table["columns"]] == ["a", "s"], table
+    assert table["rows"] == [[1, 2.5]], table
+    assert table["ci95"] == {"s": [0.1]}, table
+    assert not table["truncated"], table
+
+    # None, Decimal and date cells are typed and formatted
+    value_list = [
+        (None, 2),
+        (Decimal("12.50"), Decimal("3")),
+        (datetime.date(2000, 1, 2), None),
+        ("x\ny", "z"),
+    ]
+    text, table = format_preview_table(value_list, ["i", "d", "t", "s"])
+    assert text.split("\n")[1].split() == ["0", "None", "12.50", "2000-01-02", "x\\ny"], text
+    assert [column["type"] for column in table["columns"]] == ["number", "number", "date", "string"]
+    assert table["rows"] == [[None, 12.5, "2000-01-02", "x\ny"], [2, 3, None, "z"]], table
+
+    # Rows beyond --plugin-preview are cut, the header counts as a row
+    row_count = get_plugin_param()["preview"] + 1
+    text, table = format_preview_table([list(range(row_count))], ["n"])
+    assert table["truncated"], table
+    assert len(table["rows"]) == get_plugin_param()["preview"] - 1, table
+    assert text.split("\n")[-1] == "...", text
+
+    # Lines beyond --plugin-preview-char are cut
+    width = get_plugin_param()["preview_char"] // 2
+    text, table = format_preview_table([["x" * width] * 4], ["s"])
+    assert table["truncated"], table
+    assert sum(len(line) for line in text.split("\n")[:-1]) <= get_plugin_param()["preview_char"]
+    assert text.split("\n")[-1] == "...", text
+
+    # An empty result keeps its header
+    text, table = format_preview_table([[], []], ["a", "b"])
+    assert text == "   a  b", text
+    assert table["rows"] == [] and not table["truncated"], table
+    assert [column["type"] for column in table["columns"]] == ["null", "null"], table
+
+    print("\033[32mformat_preview_table passed\033[0m")
+
+
+input = [
+    {"column_count": 10, "repeat": 200},
+    {"column_count": 100, "repeat": 50},
+    {"column_count": 400, "repeat": 10},
+]
+
+if __name__ == "__main__":
+    check_format_preview_table()
+    if pd is None:
+        print("pandas is not installed, the baseline is skipped")
+
+    for item in input:
+        # The preview statement fetches --plugin-preview + 1 rows
+        row_list = get_row_list(get_plugin_param()["preview"] + 1, item["column_count"])
+        column_list = [f"c{j}" for j in range(item["column_count"])]
+
+        print(f"\033[33m---{item['column_count']} Columns---\033[0m")
+        if pd is not None:
+            benchmark("baseline", format_preview_baseline, row_list, column_list, item["repeat"])
+        text, table = benchmark(
+            "typed", format_preview_typed, row_list, column_list, item["repeat"]
+        )
+        print(text.split("\n")[0][:120])
+        print(table["columns"][:5])
@@ -0,0 +1,156 @@
+import sys, re, time
+from pathlib import Path
+
+root_dir = str(Path(__file__).parent.parent)
+sys.path.extend(
+    [
+        root_dir,
+        str(Path(root_dir) / "src"),
+        str(Path(root_dir) / "util"),
+    ]
+)
+
+from sqlglot import parse_one
+from parse import replace_table, replace_table_sql
+
+
+def replace_table_regex(sql, alias_to_name):
+    """The text substitution used by create_inner() before replace_table()."""
+    for alias, name in alias_to_name.items():
+        quoted_alias = f'"{alias}"'
+        sql = re.sub(rf"(?<!\.){re.escape(quoted_alias)}", f" {name}", sql)
+    return sql
+
+
+def normalize(sql):
+    return parse_one(sql).sql()
+
+
+input = [
+    {
+        # Table, alias and column qualifiers are replaced
+        "sql": 'SELECT "cte"."a" AS "a" FROM "cte" AS "cte" WHERE "cte"."b" > 0',
+        "alias_to_name": {"cte": '"SPEQL_TEMP_TABLE_1"'},
+        "output": 'SELECT "SPEQL_TEMP_TABLE_1"."a" AS "a" FROM "SPEQL_TEMP_TABLE_1" AS "SPEQL_TEMP_TABLE_1" WHERE "SPEQL_TEMP_TABLE_1"."b" > 0',
+        "regex_correct": True,
+    },
+    {
+        # A table aliased by another name keeps its alias
+        "sql": 'SELECT "x"."a" AS "a" FROM "cte" AS "x" JOIN "cte" AS "cte" ON "x"."a" = "cte"."a"',
+        "alias_to_name": {"cte": '"SPEQL_TEMP_TABLE_1"'},
+        "output": 'SELECT "x"."a" AS "a" FROM "SPEQL_TEMP_TABLE_1" AS "x" JOIN "SPEQL_TEMP_TABLE_1" AS "SPEQL_TEMP_TABLE_1" ON "x"."a" = "SPEQL_TEMP_TABLE_1"."a"',
+        "regex_correct": True,
+    },
+    {
+        # String literals and columns named after the CTE are kept
+        "sql": 'SELECT "t"."cte" AS "cte" FROM "t" AS "t" JOIN "cte" AS "cte" ON "t"."a" = "cte"."a" WHERE "t"."b" = \'"cte"\'',
+        "alias_to_name": {"cte": '"SPEQL_TEMP_TABLE_1"'},
+        "output": 'SELECT "t"."cte" AS "cte" FROM "t" AS "t" JOIN "SPEQL_TEMP_TABLE_1" AS "SPEQL_TEMP_TABLE_1" ON "t"."a" = "SPEQL_TEMP_TABLE_1"."a" WHERE "t"."b" = \'"cte"\'',
+        "regex_correct": False,
+    },
+    {
+        # Tables of another schema are kept
+        "sql": 'SELECT "cte"."a" AS "a" FROM "other"."cte" AS "cte"',
+        "alias_to_name": {"cte": '"SPEQL_TEMP_TABLE_1"'},
+        "output": 'SELECT "cte"."a" AS "a" FROM "other"."cte" AS "cte"',
+        "regex_correct": False,
+    },
+    {
+        # Tables inside subqueries and set operations are replaced
+        "sql": 'SELECT "a"."x" AS "x" FROM "a" AS "a" UNION SELECT "s"."x" AS "x" FROM (SELECT "b"."x" AS "x" FROM "b" AS "b") AS "s"',
+        "alias_to_name": {"a": '"SPEQL_TEMP_TABLE_1"', "b": '"SPEQL_TEMP_TABLE_2"'},
+        "output": 'SELECT "SPEQL_TEMP_TABLE_1"."x" AS "x" FROM "SPEQL_TEMP_TABLE_1" AS "SPEQL_TEMP_TABLE_1" UNION SELECT "s"."x" AS "x" FROM (SELECT "SPEQL_TEMP_TABLE_2"."x" AS "x" FROM "SPEQL_TEMP_TABLE_2" AS "SPEQL_TEMP_TABLE_2") AS "s"',
+        "regex_correct": True,
+    },
+    {
+        # A nested scope with a source of the same name keeps its qualifiers
+        "sql": 'SELECT "cte"."a" AS "a" FROM "cte" AS "cte" WHERE EXISTS (SELECT 1 FROM "s"."cte" AS "cte" WHERE "cte"."b" = 1)',
+        "alias_to_name": {"cte": '"SPEQL_TEMP_TABLE_1"'},
+        "output": 'SELECT "SPEQL_TEMP_TABLE_1"."a" AS "a" FROM "SPEQL_TEMP_TABLE_1" AS "SPEQL_TEMP_TABLE_1" WHERE EXISTS(SELECT 1 FROM "s"."cte" AS "cte" WHERE "cte"."b" = 1)',
+        "regex_correct": False,
+    },
+    {
+        # A correlated reference to a replaced table is replaced
+        "sql": 'SELECT "cte"."a" AS "a" FROM "cte" AS "cte" WHERE EXISTS (SELECT 1 FROM "t" AS "t" WHERE "t"."b" = "cte"."b")',
+        "alias_to_name": {"cte": '"SPEQL_TEMP_TABLE_1"'},
+        "output": 'SELECT "SPEQL_TEMP_TABLE_1"."a" AS "a" FROM "SPEQL_TEMP_TABLE_1" AS "SPEQL_TEMP_TABLE_1" WHERE EXISTS(SELECT 1 FROM "t" AS "t" WHERE "t"."b" = "SPEQL_TEMP_TABLE_1"."b")',
+        "regex_correct": True,
+    },
+]
+
+
+def get_long_query(cte_count):
+    """A chain of CTEs, each joining the previous one, with a main query over all of them."""
+    cte_list = ['"cte_0" AS (SELECT "t"."a" AS "a", "t"."b" AS "b" FROM "t" AS "t" WHERE "t"."a" > 0)']
+    for i in range(1, cte_count):
+        cte_list.append(
+            f'"cte_{i}" AS (SELECT "cte_{i - 1}"."a" AS "a", SUM("t"."b") AS "b" '
+            f'FROM "cte_{i - 1}" AS "cte_{i - 1}" JOIN "t" AS "t" ON "t"."a" = "cte_{i - 1}"."a" '
+            f'WHERE "t"."b" > {i} GROUP BY "cte_{i - 1}"."a")'
+        )
+    main_query = " UNION ALL ".join(
+        f'SELECT "cte_{i}"."a" AS "a", "cte_{i}"."b" AS "b" FROM "cte_{i}" AS "cte_{i}"'
+        for i in range(cte_count)
+    )
+    return f"WITH {', '.join(cte_list)} {main_query}"
+
+
+def test_correctness():
+    print("\033[33m---Test Correctness---\033[0m")
+    for case in input:
+        output = replace_table(parse_one(case["sql"]), case["alias_to_name"]).sql()
+        regex_output = replace_table_regex(case["sql"], case["alias_to_name"])
+        assert output == case["output"], f"{output} != {case['output']}"
+        assert (normalize(regex_output) == case["output"]) == case["regex_correct"]
+        # The text fast path is taken only where it is correct
+        sql_output = replace_table_sql(parse_one(case["sql"]), case["alias_to_name"])
+        assert normalize(sql_output) == case["output"], f"{sql_output} != {case['output']}"
+        print("pass", output)
+
+
+def test_timing(cte_count, repeat=10):
+    """
+    Substitute every CTE name in each CTE body and in the main query, as
+    create_inner() does, and compare the regex and the AST substitution.
+    """
+    parsed = parse_one(get_long_query(cte_count))
+    alias_to_name = {
+        f"cte_{i}": f'"SPEQL_TEMP_TABLE_{i + 1}"' for i in range(cte_count)
+    }
+    cte_list = parsed.args["with"].expressions
+    main_query = parsed.copy()
+    main_query.set("with", None)
+
+    start_time = time.perf_counter()
+    for _ in range(repeat):
+        regex_output = [replace_table_regex(cte.this.sql(), alias_to_name) for cte in cte_list]
+        regex_output.append(replace_table_regex(main_query.sql(), alias_to_name))
+    regex_time = (time.perf_counter() - start_time) / repeat
+
+    start_time = time.perf_counter()
+    for _ in range(repeat):
+        ast_output = [replace_table(cte.this, alias_to_name).sql() for cte in cte_list]
+        ast_output.append(replace_table(main_query, alias_to_name).sql())
+    ast_time = (time.perf_counter() - start_time) / repeat
+
+    start_time = time.perf_counter()
+    for _ in range(repeat):
+        sql_output = [replace_table_sql(cte.this, alias_to_name) for cte in cte_list]
+        sql_output.append(replace_table_sql(main_query, alias_to_name))
+    sql_time = (time.perf_counter() - start_time) / repeat
+
+    for regex_script, ast_script, sql_script in zip(regex_output, ast_output, sql_output):
+        assert normalize(regex_script) == ast_script
+        assert normalize(sql_script) == ast_script
+    print(
+        f"cte_count: {cte_count}, regex: {regex_time * 1000:.2f} ms, "
+        f"ast: {ast_time * 1000:.2f} ms, replace_table_sql: {sql_time * 1000:.2f} ms"
+    )
+
+
+if __name__ == "__main__":
+    test_correctness()
+
+    print("\033[33m---Test Timing---\033[0m")
+    for cte_count in [5, 20, 50, 100]:
+        test_timing(cte_count)
@@ -0,0 +1,174 @@
+import sys
+from pathlib import Path
+
+root_dir = str(Path(__file__).parent.parent)
+sys.path.extend(
+    [
+        root_dir,
+        str(Path(root_dir) / "src"),
+        str(Path(root_dir) / "util"),
+    ]
+)
+
+from sqlglot import parse_one
+import sample_table
+from param import get_sample_table_param
+from sample import (
+    CI_SUFFIX,
+    scale_aggregate,
+    get_ci_expression,
+    get_universe_key,
+    get_sample_script,
+)
+
+
+def normalize(sql):
+    return parse_one(sql).sql()
+
+
+scale_input = [
+    {
+        # SUM and COUNT are scaled, the intervals go last
+        "sql": 'SELECT "a" AS "a", SUM("x") AS "s", COUNT(*) AS "c" FROM "t" AS "t" GROUP BY "a"',
+        "ratio": 0.25,
+        "scaled": ["(SUM(\"x\") * 4.0)", "(COUNT(*) * 4.0)"],
+        "ci": ["s" + CI_SUFFIX, "c" + CI_SUFFIX],
+    },
+    {
+        # HAVING is scaled too
+        "sql": 'SELECT "a" AS "a", SUM("x") AS "s" FROM "t" AS "t" GROUP BY "a" HAVING SUM("x") > 10',
+        "ratio": 0.5,
+        "scaled": ["(SUM(\"x\") * 2.0) > 10"],
+        "ci": ["s" + CI_SUFFIX],
+    },
+    {
+        # AVG and COUNT(DISTINCT) keep their value, only AVG gets an interval
+        "sql": 'SELECT AVG("x") AS "m", COUNT(DISTINCT "y") AS "d" FROM "t" AS "t"',
+        "ratio": 0.5,
+        "scaled": ['AVG("x") AS "m"', 'COUNT(DISTINCT "y") AS "d"'],
+        "ci": ["m" + CI_SUFFIX],
+    },
+    {
+        # Window functions are kept, the aggregate inside one is scaled
+        "sql": 'SELECT "a" AS "a", SUM("x") OVER (PARTITION BY "a") AS "w", SUM(SUM("x")) OVER () AS "v" FROM "t" AS "t" GROUP BY "a", "x"',
+        "ratio": 0.5,
+        "scaled": [
+            'SUM("x") OVER (PARTITION BY "a") AS "w"',
+            'SUM((SUM("x") * 2.0)) OVER () AS "v"',
+        ],
+        "ci": [],
+    },
+    {
+        # No aggregate, no rewrite
+        "sql": 'SELECT "a" AS "a" FROM "t" AS "t"',
+        "ratio": 0.5,
+        "scaled": [],
+        "ci": [],
+    },
+]
+
+ci_input = [
+    {
+        "sql": 'SUM("x")',
+        "output": '1.96 * SQRT(0.75 * SUM(CAST("x" AS FLOAT) * CAST("x" AS FLOAT))) / 0.25',
+    },
+    {
+        "sql": 'COUNT("x")',
+        "output": '1.96 * SQRT(0.75 * COUNT("x")) / 0.25',
+    },
+    {
+        "sql": 'AVG("x")',
+        "output": '1.96 * STDDEV_SAMP(CAST("x" AS FLOAT)) / SQRT(NULLIF(COUNT("x"), 0))',
+    },
+    {
+        "sql": 'COUNT(DISTINCT "x")',
+        "output": None,
+    },
+]
+
+table_ratio_input = [
+    {
+        # A query over a table sampled at 0.25 is scaled by it, unsampled itself
+        "table_ratio": 0.25,
+        "scaled": True,
+    },
+    {
+        # A query over an exact table is kept
+        "table_ratio": 1.0,
+        "scaled": False,
+    },
+    {
+        # A query over an aggregated sample cannot be scaled
+        "table_ratio": None,
+        "scaled": False,
+    },
+]
+
+universe_input = [
+    {
+        # Two large tables joined on a key
+        "sql": 'SELECT * FROM "store_sales" AS "ss" JOIN "store_returns" AS "sr" ON "ss"."ss_item_sk" = "sr"."sr_item_sk"',
+        "output": {"ss": "ss_item_sk", "sr": "sr_item_sk"},
+    },
+    {
+        # The key passes through a small table, and the WHERE clause counts
+        "sql": 'SELECT * FROM "store_sales" AS "ss", "item" AS "i", "store_returns" AS "sr" WHERE "ss"."ss_item_sk" = "i"."i_item_sk" AND "i"."i_item_sk" = "sr"."sr_item_sk"',
+        "output": {"ss": "ss_item_sk", "sr": "sr_item_sk"},
+    },
+    {
+        # A single large table has no universe key
+        "sql": 'SELECT * FROM "store_sales" AS "ss" JOIN "item" AS "i" ON "ss"."ss_item_sk" = "i"."i_item_sk"',
+        "output": None,
+    },
+    {
+        # Non-equality predicates do not join the key
+        "sql": 'SELECT * FROM "store_sales" AS "ss" JOIN "store_returns" AS "sr" ON "ss"."ss_item_sk" < "sr"."sr_item_sk"',
+        "output": None,
+    },
+]
+
+if __name__ == "__main__":
+    for item in scale_input:
+        output = scale_aggregate(item["sql"], item["ratio"])
+        # The output is valid SQL
+        select = parse_one(output)
+        for scaled in item["scaled"]:
+            assert scaled in output, f"{scaled} not in {output}"
+        alias_list = [expression.alias_or_name for expression in select.expressions]
+        ci_list = alias_list[len(alias_list) - len(item["ci"]) :] if item["ci"] else []
+        assert ci_list == item["ci"], f"{ci_list} != {item['ci']}"
+        assert not any(
+            alias.endswith(CI_SUFFIX) for alias in alias_list[: len(alias_list) - len(item["ci"])]
+        ), output
+        if not item["scaled"]:
+            assert output == item["sql"], output
+    print("\033[32mscale_aggregate passed\033[0m")
+
+    for item in ci_input:
+        output = get_ci_expression(parse_one(item["sql"]), 0.25)
+        if item["output"] is None:
+            assert output is None, output.sql()
+        else:
+            assert output.sql() == normalize(item["output"]), output.sql()
+    print("\033[32mget_ci_expression passed\033[0m")
+
+    sql = 'SELECT "t"."a" AS "a", SUM("t"."x") AS "s" FROM "SPEQL_TEMP_TABLE_1" AS "t" GROUP BY "t"."a"'
+    for item in table_ratio_input:
+        output, ratio = get_sample_script(sql, 0, scale=True, table_ratio=item["table_ratio"])
+        assert ratio == 1.0, ratio
+        assert (CI_SUFFIX.upper() in output.upper()) == item["scaled"], output
+        if not item["scaled"]:
+            assert output == sql, output
+    print("\033[32mget_sample_script passed\033[0m")
+
+    # Preset the catalog instead of reading it from the warehouse
+    min_size = get_sample_table_param()["min_size"]
+    sample_table.table_size_catalog = {
+        "STORE_SALES": min_size * 10,
+        "STORE_RETURNS": min_size * 2,
+        "ITEM": 0.0,
+    }
+    for item in universe_input:
+        output = get_universe_key(parse_one(item["sql"]))
+        assert output == item["output"], f"{output} != {item['output']}"
+    print("\033[32mget_universe_key passed\033[0m")
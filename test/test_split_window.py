@@ -0,0 +1,73 @@
+import sys
+from pathlib import Path
+
+root_dir = str(Path(__file__).parent.parent)
+sys.path.extend(
+    [
+        root_dir,
+        str(Path(root_dir) / "src"),
+        str(Path(root_dir) / "util"),
+    ]
+)
+
+from sqlglot import parse_one
+from param import get_dialect_param
+from create_rewrite import split_window, merge_window
+
+
+def normalize(sql):
+    return parse_one(sql, read=get_dialect_param()["endpoint"]).sql()
+
+
+input = [
+    {
+        # Columns and aggregates are hoisted
+        "sql": 'SELECT "t"."a" AS "a", RANK() OVER (ORDER BY SUM("t"."x")) AS "r" FROM "t" AS "t" GROUP BY "t"."a"',
+        "inner": 'SELECT "T"."A" AS "A", SUM("T"."X") AS "SUM_X" FROM "T" AS "T" GROUP BY "T"."A"',
+        "outer": 'SELECT "SPEQL_WINDOW"."A" AS "A", RANK() OVER (ORDER BY "SPEQL_WINDOW"."SUM_X") AS "R" FROM "SPEQL_WINDOW" AS "SPEQL_WINDOW"',
+    },
+    {
+        # A grouping expression is hoisted as a whole
+        "sql": 'SELECT "t"."a" + 1 AS "b", RANK() OVER (ORDER BY COUNT(*)) AS "r" FROM "t" AS "t" GROUP BY "t"."a" + 1',
+        "inner": 'SELECT "T"."A" + 1 AS "ADD_A", COUNT(*) AS "COUNT" FROM "T" AS "T" GROUP BY "T"."A" + 1',
+        "outer": 'SELECT "SPEQL_WINDOW"."ADD_A" AS "B", RANK() OVER (ORDER BY "SPEQL_WINDOW"."COUNT") AS "R" FROM "SPEQL_WINDOW" AS "SPEQL_WINDOW"',
+    },
+    {
+        # ROLLUP with GROUPING() in the window, as in TPC-DS q36, q70 and q86
+        "sql": 'SELECT "t"."a" AS "a", "t"."b" AS "b", SUM("t"."x") AS "s", GROUPING("t"."a") + GROUPING("t"."b") AS "lochierarchy", RANK() OVER (PARTITION BY GROUPING("t"."a") + GROUPING("t"."b") ORDER BY SUM("t"."x") DESC) AS "r" FROM "t" AS "t" GROUP BY ROLLUP ("t"."a", "t"."b") ORDER BY "lochierarchy" DESC LIMIT 100',
+        "inner": 'SELECT "T"."A" AS "A", "T"."B" AS "B", SUM("T"."X") AS "SUM_X", GROUPING("T"."A") AS "GROUPING_A", GROUPING("T"."B") AS "GROUPING_B" FROM "T" AS "T" GROUP BY ROLLUP ("T"."A", "T"."B")',
+        "outer": 'SELECT "SPEQL_WINDOW"."A" AS "A", "SPEQL_WINDOW"."B" AS "B", "SPEQL_WINDOW"."SUM_X" AS "S", "SPEQL_WINDOW"."GROUPING_A" + "SPEQL_WINDOW"."GROUPING_B" AS "LOCHIERARCHY", RANK() OVER (PARTITION BY "SPEQL_WINDOW"."GROUPING_A" + "SPEQL_WINDOW"."GROUPING_B" ORDER BY "SPEQL_WINDOW"."SUM_X" DESC) AS "R" FROM "SPEQL_WINDOW" AS "SPEQL_WINDOW" ORDER BY "LOCHIERARCHY" DESC LIMIT 100',
+    },
+    {
+        # A column that is only part of a grouping expression cannot be selected
+        "sql": 'SELECT "t"."a" AS "a", RANK() OVER (ORDER BY COUNT(*)) AS "r" FROM "t" AS "t" GROUP BY "t"."a" + 1',
+        "inner": None,
+        "outer": None,
+    },
+    {
+        # Grouping by position is not split
+        "sql": 'SELECT "t"."a" AS "a", RANK() OVER (ORDER BY COUNT(*)) AS "r" FROM "t" AS "t" GROUP BY 1',
+        "inner": None,
+        "outer": None,
+    },
+]
+
+if __name__ == "__main__":
+    for case in input:
+        split = split_window(case["sql"])
+        if case["inner"] is None:
+            assert split is None, split
+            print("pass", None)
+            continue
+        assert normalize(split["inner"]) == normalize(case["inner"]), split["inner"]
+        assert normalize(split["outer"]) == normalize(case["outer"]), split["outer"]
+
+        # The inner query replaces the window table on the AST
+        merged = parse_one(
+            merge_window(split["outer"], split["inner"]),
+            read=get_dialect_param()["endpoint"],
+        )
+        window_table = merged.args["from"].this
+        assert normalize(window_table.this.sql()) == normalize(case["inner"]), merged.sql()
+        assert window_table.alias == "SPEQL_WINDOW", merged.sql()
+        print("pass", split["outer"])
@@ -0,0 +1,202 @@
+# Copyright (c) 2025 Haoyu Li
+# Released under the MIT License.
+# See LICENSE file in the project root for details.
+
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Cache module for SpeQL.
+=============
+
+This module provides a bounded LRU cache for the memo dictionaries
+(format, extract, rewrite, schema, ...), so that a long-running server
+does not grow without limit.
+
+Key Features:
+    1. Bound each cache by entry count and estimated memory
+    2. Evict the least recently used entries first
+    3. Record hit, miss, eviction and memory statistics per cache
+"""
+
+import sys
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, Hashable, Optional
+
+# -----------------------------------------------------------------------------
+# Path Configuration
+# -----------------------------------------------------------------------------
+
+root_dir = str(Path(__file__).parent.parent)
+sys.path.extend([
+    root_dir,
+    str(Path(root_dir) / "src"),
+    str(Path(root_dir) / "util"),
+])
+
+# -----------------------------------------------------------------------------
+# Local Imports
+# -----------------------------------------------------------------------------
+
+from param import get_cache_param
+
+# -----------------------------------------------------------------------------
+# Global Variables
+# -----------------------------------------------------------------------------
+
+cache_registry: Dict[str, "BoundedCache"] = {}
+
+# -----------------------------------------------------------------------------
+# Memory Estimation
+# -----------------------------------------------------------------------------
+
+def get_size(obj: Any) -> int:
+    """
+    Estimate the memory of an object in bytes, following the containers
+    used by the caches (dict, list, tuple, set) and the fields of __slots__
+    objects such as the extracted clauses. Other objects are counted by
+    sys.getsizeof() only.
+    """
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(get_size(key) + get_size(value) for key, value in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(get_size(item) for item in obj)
+    elif hasattr(type(obj), "__slots__"):
+        for cls in type(obj).__mro__:
+            for slot in getattr(cls, "__slots__", ()):
+                if hasattr(obj, slot):
+                    size += get_size(getattr(obj, slot))
+    return size
+
+# -----------------------------------------------------------------------------
+# Bounded Cache
+# -----------------------------------------------------------------------------
+
+class BoundedCache:
+    """
+    A dictionary-like LRU cache bounded by entry count and estimated memory.
+
+    Use get() for lookups so that hits and misses are counted. The
+    membership test (in) does not update the statistics or the LRU order.
+
+    Example:
+        >>> cache = BoundedCache("example", max_count=2)
+        >>> cache["a"] = 1; cache["b"] = 2; cache["c"] = 3
+        >>> cache.get("a"), cache.get("c")
+        (None, 3)
+        >>> cache.get_stats()["eviction"]
+        1
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_count: Optional[int] = None,
+        max_size: Optional[int] = None,
+        sizeof: Optional[Callable[[Hashable, Any], int]] = None,
+    ) -> None:
+        """
+        Args:
+            name: Name reported in the statistics
+            max_count: Maximum number of entries. Defaults to --cache-count.
+            max_size: Maximum estimated memory in MB. Defaults to --cache-size.
+            sizeof: Estimates the bytes of an entry from (key, value).
+                Defaults to get_size(key) + get_size(value).
+        """
+        self.name = name
+        self.max_count = max_count if max_count is not None else get_cache_param()["count"]
+        self.max_size = (
+            max_size if max_size is not None else get_cache_param()["size"]
+        ) * 1024 * 1024
+        self.sizeof = sizeof if sizeof is not None else (
+            lambda key, value: get_size(key) + get_size(value)
+        )
+
+        # Maps key to (value, size). The last item is the most recently used.
+        self.data: OrderedDict = OrderedDict()
+        self.size = 0
+        self.hit = 0
+        self.miss = 0
+        self.eviction = 0
+        self.lock = threading.Lock()
+
+        cache_registry[name] = self
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.data
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return the cached value and mark it as recently used."""
+        with self.lock:
+            if key in self.data:
+                self.hit += 1
+                self.data.move_to_end(key)
+                return self.data[key][0]
+            self.miss += 1
+            return default
+
+    def __getitem__(self, key: Hashable) -> Any:
+        with self.lock:
+            self.data.move_to_end(key)
+            return self.data[key][0]
+
+    def __setitem__(self, key: Hashable, value: Any) -> None:
+        size = self.sizeof(key, value)
+        with self.lock:
+            if key in self.data:
+                self.size -= self.data.pop(key)[1]
+            self.data[key] = (value, size)
+            self.size += size
+            self.evict()
+
+    def __delitem__(self, key: Hashable) -> None:
+        with self.lock:
+            self.size -= self.data.pop(key)[1]
+
+    def evict(self) -> None:
+        """
+        Drop the least recently used entries until both limits hold. The
+        entry just inserted is kept even if it alone exceeds the memory limit.
+        The caller must hold the lock.
+        """
+        while len(self.data) > 1 and (
+            len(self.data) > self.max_count or self.size > self.max_size
+        ):
+            _, (_, size) = self.data.popitem(last=False)
+            self.size -= size
+            self.eviction += 1
+
+    def clear(self) -> None:
+        """Remove all entries. The statistics are kept."""
+        with self.lock:
+            self.data.clear()
+            self.size = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Returns:
+            Dict[str, Any]: Entry count, estimated memory in bytes, limits,
+            hits, misses, evictions and hit rate
+        """
+        lookup = self.hit + self.miss
+        return {
+            "count": len(self.data),
+            "size": self.size,
+            "max_count": self.max_count,
+            "max_size": self.max_size,
+            "hit": self.hit,
+            "miss": self.miss,
+            "eviction": self.eviction,
+            "hit_rate": round(self.hit / lookup, 4) if lookup else 0.0,
+        }
+
+
+def get_cache_stats() -> Dict[str, Dict[str, Any]]:
+    """Return the statistics of every bounded cache, keyed by cache name."""
+    return {name: cache.get_stats() for name, cache in cache_registry.items()}
@@ -13,10 +13,11 @@ This module manages thread synchronization and background process handling.
 """
 
 import sys
+import asyncio
 import threading
 import time
 from pathlib import Path
-from typing import Optional, Union, Dict
+from typing import Any, Optional, Union, Dict, List
 from asyncio import Task
 
 # -----------------------------------------------------------------------------
@@ -43,13 +44,32 @@ running_sql: Dict[str, Optional[str]] = {
     "db": None,
 }
 running_inference: Optional[Task] = None
-background_create: Optional[str] = None
 background_create_tid: Optional[int] = None
+background_create_tid_list: List[int] = []
 priority: Dict[str, int] = {
     "llm": 0,
     "db": 0,
 }
 
+"""
+Background jobs, keyed by SQL so that a query queued twice runs once. A job is
+{"sql", "utility", "kind", "time"}, and runs in the order of get_job_priority().
+"""
+background_queue: Dict[str, Dict[str, Any]] = {}
+BACKGROUND_QUEUE_SIZE = 32
+
+"""
+Priority gained per second of waiting, so that low-utility jobs still run
+eventually.
+"""
+BACKGROUND_AGING = 0.01
+
+"""
+When the user sends a new query, the jobs queued for earlier queries are
+less likely to be useful.
+"""
+BACKGROUND_DECAY = 0.5
+
 # Thread synchronization objects
 tid_lock = threading.Lock()
 background_create_event = threading.Event()
@@ -83,6 +103,16 @@ def get_recent_tid(type: str) -> Optional[int]:
     return recent_tid[type]
 
 
+def check_recent_tid(type: str) -> bool:
+    """
+    Returns whether the current thread may keep working. This is the most
+    recent thread, or any background thread while the system is idle.
+    """
+    if recent_tid[type] == threading.get_ident():
+        return True
+    return recent_tid[type] == get_background_tid() and is_background_thread()
+
+
 def get_priority(type: str) -> int:
     """
     Gets the priority of the current thread if it's the most recent one.
@@ -163,16 +193,55 @@ def set_background_create(sql: str) -> None:
     Args:
         sql: SQL query for background creation
     """
-    global background_create
+    with tid_lock:
+        if threading.get_ident() != get_recent_tid("db"):
+            return
+        for job in background_queue.values():
+            job["utility"] *= BACKGROUND_DECAY
+    push_background_create(sql, utility=1.0, kind="query")
+
+
+def push_background_create(sql: str, utility: float, kind: str) -> None:
+    """
+    Queue a background job. If the SQL is already queued, the job keeps its
+    waiting time and the higher utility.
 
+    Args:
+        sql: SQL query for background creation
+        utility: Expected benefit of the job. A query the user sent has 1.0.
+        kind: "query" for a query the user sent, "lattice" for a candidate
+        derived from one (see create_lattice)
+    """
     with tid_lock:
-        if threading.get_ident() == get_recent_tid("db"):
-            background_create = sql
+        if sql in background_queue:
+            job = background_queue[sql]
+            job["utility"] = max(job["utility"], utility)
+            return
+
+        background_queue[sql] = {
+            "sql": sql,
+            "utility": utility,
+            "kind": kind,
+            "time": time.time(),
+        }
+        if len(background_queue) > BACKGROUND_QUEUE_SIZE:
+            job = min(background_queue.values(), key=get_job_priority)
+            del background_queue[job["sql"]]
 
 
-def get_background_create() -> Optional[str]:
-    """Return the current background creation SQL."""
-    return background_create
+def get_job_priority(job: Dict[str, Any]) -> float:
+    """Returns the utility of a job plus its aging bonus."""
+    return job["utility"] + BACKGROUND_AGING * (time.time() - job["time"])
+
+
+def get_background_create() -> Optional[Dict[str, Any]]:
+    """Remove and return the background job with the highest priority."""
+    with tid_lock:
+        if not background_queue:
+            return None
+        job = max(background_queue.values(), key=get_job_priority)
+        del background_queue[job["sql"]]
+        return job
 
 
 def set_background_create_event() -> None:
@@ -191,19 +260,35 @@ def wait_background_create_event() -> None:
 
 
 def get_background_tid() -> Optional[int]:
-    """Return the background thread ID."""
+    """
+    Return the background thread ID. With several background workers, this
+    is the first one, and stands for all of them in recent_tid.
+    """
     return background_create_tid
 
 
 def set_background_tid(new_background_create_tid: int) -> None:
     """
-    Sets the background thread ID.
+    Registers a background thread.
     
     Args:
         new_background_create_tid: New background thread ID to set
     """
     global background_create_tid
-    background_create_tid = new_background_create_tid
+    with tid_lock:
+        if background_create_tid is None:
+            background_create_tid = new_background_create_tid
+        background_create_tid_list.append(new_background_create_tid)
+
+
+def is_background_thread() -> bool:
+    """Return whether the current thread is a background worker."""
+    return threading.get_ident() in background_create_tid_list
+
+
+def get_background_worker_index() -> int:
+    """Return the registration order of the current background worker."""
+    return background_create_tid_list.index(threading.get_ident())
 
 # -----------------------------------------------------------------------------
 # Middle Speculation Management
@@ -212,30 +297,62 @@ def set_background_tid(new_background_create_tid: int) -> None:
 speculate_middle: Optional[Union[str, Task]] = None
 
 
-async def get_speculate_middle() -> Optional[str]:
+async def get_speculate_middle(timeout: Optional[float] = None) -> Optional[str]:
     """
     Retrieves the middle speculation result.
+
+    The speculation task belongs to the event loop of the request that
+    started it. Only that loop can wait for it, other threads (e.g. the
+    background workers) get the result once the task has handed it over as
+    a string (see set_speculate_middle), and None before.
+
+    Args:
+        timeout: Seconds to wait for the speculation task. None waits until it
+        is done. The task is not cancelled when the wait times out, so a later
+        call can still get its result.
     
     Returns:
         Optional[str]: Speculation result or None if not available
     """
-    global speculate_middle
-    if speculate_middle is None:
+    task = speculate_middle
+    if task is None:
+        return None
+    elif isinstance(task, str):
+        return task
+    elif task.get_loop() is not asyncio.get_running_loop():
+        # Waiting on a task of another loop would never wake up
         return None
-    elif isinstance(speculate_middle, str):
-        return speculate_middle
     else:
         try:
-            return await speculate_middle
-        except:
+            if not task.done():
+                await asyncio.wait({task}, timeout=timeout)
+            if not task.done() or task.cancelled():
+                # The task ran out of time, or was cancelled with its event loop
+                return None
+            return task.result()
+        except Exception:
             return ""
 
+
 def set_speculate_middle(task_or_string: Union[Task, str]) -> None:
     """
-    Sets the middle speculation task or result.
+    Sets the middle speculation task or result. Once a task finishes, its
+    result replaces it, unless a newer speculation has been set meanwhile.
+    A task cancelled with the event loop of its request leaves no result.
     
     Args:
         task_or_string: Task or string to set as speculation
     """
     global speculate_middle
     speculate_middle = task_or_string
+
+    if isinstance(task_or_string, Task):
+
+        def hand_over(task: Task) -> None:
+            global speculate_middle
+            if task.cancelled() or task.exception() is not None:
+                return
+            if speculate_middle is task:
+                speculate_middle = task.result()
+
+        task_or_string.add_done_callback(hand_over)
@@ -9,13 +9,15 @@
 Cost Module
 =============
 
-This module controls LLM inference frequency and retry count.
+This module controls LLM inference frequency and retry count, and accounts
+for the warehouse time and LLM tokens the session spends against its budgets.
 """
 
 import sys
+import threading
 from pathlib import Path
 from Levenshtein import distance
-from typing import Optional
+from typing import Any, Dict, Optional
 
 # -----------------------------------------------------------------------------
 # Path Configuration
@@ -34,7 +36,7 @@ sys.path.extend(
 # Local Imports
 # -----------------------------------------------------------------------------
 
-from param import get_similarity_threshold, get_max_iteration
+from param import get_similarity_threshold, get_max_iteration, get_budget_param
 
 # -----------------------------------------------------------------------------
 # Global Variables
@@ -44,6 +46,14 @@ active_period: int = 1
 count_down: int = 0
 max_retry: int = 0
 
+# Spend of the session, since the server started
+cost_usage: Dict[str, Any] = {
+    "warehouse_time": {"create": 0.0, "preview": 0.0},
+    "prompt_tokens": 0,
+    "completion_tokens": 0,
+}
+cost_usage_lock = threading.Lock()
+
 # -----------------------------------------------------------------------------
 # SQL Similarity Check
 # -----------------------------------------------------------------------------
@@ -114,3 +124,109 @@ def update_max_retry() -> None:
     else:
         max_retry = get_max_iteration()
         count_down = active_period
+
+
+# -----------------------------------------------------------------------------
+# Cost Accounting
+# -----------------------------------------------------------------------------
+
+
+def add_warehouse_time(kind: str, elapsed_time: float) -> None:
+    """
+    Account for the elapsed time of a statement.
+
+    Args:
+        kind: "create" for CTAS statements, "preview" for preview queries
+        elapsed_time: Elapsed seconds, from the metrics of the statement
+    """
+    if elapsed_time < 0:
+        return
+    with cost_usage_lock:
+        cost_usage["warehouse_time"][kind] += elapsed_time
+
+
+def add_llm_tokens(prompt_tokens: int, completion_tokens: int) -> None:
+    """Account for the tokens of an LLM response."""
+    with cost_usage_lock:
+        cost_usage["prompt_tokens"] += prompt_tokens
+        cost_usage["completion_tokens"] += completion_tokens
+
+
+def get_budget_usage(kind: str) -> float:
+    """
+    Return the fraction of a budget the session has spent.
+
+    Args:
+        kind: "warehouse" (--budget-warehouse-time seconds) or "llm"
+            (--budget-llm-tokens prompt and completion tokens)
+
+    Example:
+        >>> get_budget_usage("warehouse")
+        0.25
+    """
+    with cost_usage_lock:
+        if kind == "warehouse":
+            spent = sum(cost_usage["warehouse_time"].values())
+            budget = get_budget_param()["warehouse_time"]
+        else:
+            spent = cost_usage["prompt_tokens"] + cost_usage["completion_tokens"]
+            budget = get_budget_param()["llm_tokens"]
+    return spent / budget if budget > 0 else 1.0
+
+
+def is_over_budget(kind: str, ratio: float = 1.0) -> bool:
+    """Return whether the session has spent the given fraction of a budget."""
+    return get_budget_usage(kind) >= ratio
+
+
+def is_degraded(kind: str) -> bool:
+    """
+    Return whether the session has spent --budget-degrade-ratio of a budget.
+    From then on, SpeQL degrades gracefully: no lattice candidates and
+    smaller samples for the warehouse, and only the fast model for the LLM.
+    """
+    return is_over_budget(kind, get_budget_param()["degrade_ratio"])
+
+
+def get_sample_time(retry_time: int) -> int:
+    """
+    Return the number of halvings of the sampling ratio (see sample_script)
+    of a sampled attempt. Past --budget-degrade-ratio of the warehouse
+    budget, retries sample at half the ratio, and once the budget is spent,
+    even the first attempt is sampled.
+
+    Args:
+        retry_time: Number of retry attempts
+
+    Example:
+        >>> # With 90% of the warehouse budget spent
+        >>> get_sample_time(0), get_sample_time(1)
+        (0, 2)
+    """
+    if is_over_budget("warehouse"):
+        return retry_time + 2
+    if retry_time > 0 and is_degraded("warehouse"):
+        return retry_time + 1
+    return retry_time
+
+
+def get_cost_stats() -> Dict[str, Any]:
+    """
+    Return the spend of the session and the fraction of each budget spent.
+
+    Example:
+        >>> get_cost_stats()
+        {'warehouse_time': {'create': 12.5, 'preview': 3.1}, 'prompt_tokens': 5120,
+         'completion_tokens': 830, 'budget': {'warehouse': 0.01, 'llm': 0.0}}
+    """
+    with cost_usage_lock:
+        stats = {
+            "warehouse_time": dict(cost_usage["warehouse_time"]),
+            "prompt_tokens": cost_usage["prompt_tokens"],
+            "completion_tokens": cost_usage["completion_tokens"],
+        }
+    stats["budget"] = {
+        "warehouse": get_budget_usage("warehouse"),
+        "llm": get_budget_usage("llm"),
+    }
+    return stats
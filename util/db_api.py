@@ -10,10 +10,12 @@ Database API Module
 """
 
 import sys
+import queue
+import atexit
 import redshift_connector
 import snowflake.connector
 from pathlib import Path
-from typing import Dict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
 
 # -----------------------------------------------------------------------------
 # Path Configuration
@@ -36,6 +38,35 @@ from param import get_db_param, get_system_name, get_test_param, get_dialect_par
 from concurrency import get_execute_cursor_lock
 from log import log
 
+# -----------------------------------------------------------------------------
+# Lane Configuration
+# -----------------------------------------------------------------------------
+
+
+def get_lane_count() -> int:
+    """
+    Returns the number of connections that can create tables in parallel.
+    Only Redshift supports more than one lane.
+    """
+    if get_dialect_param()["endpoint"] != "redshift":
+        return 1
+    return max(get_db_param()["connection_count"], 1)
+
+
+def get_lane_schema() -> str:
+    """
+    Returns the schema of the tables created when there is more than one
+    lane. It is unique to the server process, named after the session id of
+    the execute cursor, so that servers sharing a cluster do not drop each
+    other's tables.
+
+    Example:
+        >>> get_lane_schema()
+        'speql_lane_1073807410'
+    """
+    return f"{get_system_name().lower()}_lane_{execute_session_id}"
+
+
 # -----------------------------------------------------------------------------
 # Database Connection Management
 # -----------------------------------------------------------------------------
@@ -90,6 +121,9 @@ def new_db_cursor(test: bool = False) -> redshift_connector.Cursor:
             if test
             else db_param["search_path"]
         )
+        if get_lane_count() > 1 and execute_session_id is not None:
+            # Tables created on one lane must be visible to the others
+            schema_path = f"{schema_path}, {get_lane_schema()}"
         print("schema_path", schema_path)
     
     
@@ -198,18 +232,74 @@ if get_test_param()["skip_create"]:
     except Exception as e:
         log("error.txt", f"{str(e)}")
 
+# Set below, once the execute cursor has a session
+execute_session_id = None
+
 # Initialize cursors
 execute_cursor, explain_cursor = new_db_cursor(
     test=get_test_param()["skip_create"]
 ), new_db_cursor(test=get_test_param()["skip_create"])
 
+
+def get_session_id(cursor: redshift_connector.Cursor) -> int:
+    """Returns the session ID of a cursor."""
+    if get_dialect_param()["endpoint"] == "redshift":
+        cursor.execute("SELECT pg_backend_pid();")
+    elif get_dialect_param()["endpoint"] == "snowflake":
+        cursor.execute("SELECT CURRENT_SESSION();")
+    return cursor.fetchone()[0]
+
+
 # Get session ID
-if get_dialect_param()["endpoint"] == "redshift":
-    execute_cursor.execute("SELECT pg_backend_pid();")
-    execute_session_id = execute_cursor.fetchone()[0]
-elif get_dialect_param()["endpoint"] == "snowflake":
-    execute_cursor.execute("SELECT CURRENT_SESSION();")
-    execute_session_id = execute_cursor.fetchone()[0]
+execute_session_id = get_session_id(execute_cursor)
+explain_session_id = get_session_id(explain_cursor)
+
+"""
+Lanes are extra connections used to create the temporary tables of
+independent CTEs in parallel. Temporary tables are only visible to the session
+that created them, so with more than one lane the tables are regular tables in
+a schema of their own, appended to the search path. The schema belongs to this
+process (see get_lane_schema), and is dropped at exit, or at the next start if
+the process did not exit cleanly. With a single connection, tables are created
+on the execute cursor as before.
+"""
+lane_queue: "queue.Queue[redshift_connector.Cursor]" = queue.Queue()
+lane_session_id_list: List[int] = []
+
+
+def drop_lane_schema() -> None:
+    """
+    Drops the lane schema of this process, and those left behind by servers
+    whose session has ended, with their tables.
+    """
+    try:
+        with get_execute_cursor_lock():
+            execute_cursor.execute(
+                f"""
+SELECT nspname FROM pg_namespace WHERE nspname LIKE '{get_system_name().lower()}_lane_%'
+AND SUBSTRING(nspname FROM {len(get_system_name()) + 7}) NOT IN
+(SELECT CAST(process AS VARCHAR) FROM stv_sessions WHERE process <> {execute_session_id});
+"""
+            )
+            for (schema_name,) in execute_cursor.fetchall():
+                execute_cursor.execute(f"DROP SCHEMA IF EXISTS {schema_name.strip()} CASCADE;")
+    except Exception as e:
+        log("error.txt", f"Cannot drop lane schema: {e}")
+
+
+if get_lane_count() > 1:
+    drop_lane_schema()
+    execute_cursor.execute(f"CREATE SCHEMA IF NOT EXISTS {get_lane_schema()};")
+    atexit.register(drop_lane_schema)
+    # Tables created on the lanes must be visible to the execute and explain cursors
+    for cursor in [execute_cursor, explain_cursor]:
+        cursor.execute("SHOW search_path;")
+        cursor.execute(f"set search_path to {cursor.fetchone()[0]}, {get_lane_schema()};")
+
+    for _ in range(get_lane_count()):
+        lane_cursor = new_db_cursor(test=get_test_param()["skip_create"])
+        lane_session_id_list.append(get_session_id(lane_cursor))
+        lane_queue.put(lane_cursor)
 
 # -----------------------------------------------------------------------------
 # Cursor Access Functions
@@ -221,6 +311,29 @@ def get_execute_session_id() -> int:
     return execute_session_id
 
 
+def get_explain_session_id() -> int:
+    """Returns the session ID of the explain cursor."""
+    return explain_session_id
+
+
+def get_lane_session_id_list() -> List[int]:
+    """Returns the session IDs of the lane connections."""
+    return lane_session_id_list
+
+
+def acquire_lane() -> redshift_connector.Cursor:
+    """
+    Takes a free lane cursor, waiting until one is released. The caller must
+    return it with release_lane().
+    """
+    return lane_queue.get()
+
+
+def release_lane(cursor: redshift_connector.Cursor) -> None:
+    """Returns a lane cursor taken by acquire_lane()."""
+    lane_queue.put(cursor)
+
+
 def get_cursor() -> Dict[str, redshift_connector.Cursor]:
     """
     Returns dictionary containing database cursors.
@@ -234,3 +347,64 @@ def get_cursor() -> Dict[str, redshift_connector.Cursor]:
         "explain": explain_cursor,
         "execute": execute_cursor,
     }
+
+
+# -----------------------------------------------------------------------------
+# Result Fetching
+# -----------------------------------------------------------------------------
+
+
+def fetch_column(cursor: redshift_connector.Cursor) -> Tuple[List[str], List[Sequence[Any]]]:
+    """
+    Fetch the result of the last statement of a cursor by column.
+
+    Snowflake returns the result as Arrow record batches, which are kept as
+    Arrow arrays, so that only the values that are shown become Python
+    objects (see format_preview_table). redshift_connector has no Arrow
+    interface, and its fetch_dataframe() is built from the rows as well, so
+    the rows are fetched and transposed.
+
+    Args:
+        cursor: Cursor that has executed a statement
+
+    Returns:
+        Tuple[List[str], List[Sequence[Any]]]: Column names, and the values
+        of each column. A sequence may be an Arrow array, see
+        get_python_list.
+
+    Example:
+        >>> cursor.execute("SELECT 1 AS a, 'x' AS b UNION ALL SELECT 2, 'y'")
+        >>> fetch_column(cursor)
+        (['a', 'b'], [(1, 2), ('x', 'y')])
+    """
+    column_list = [desc[0] for desc in cursor.description]
+
+    if get_dialect_param()["endpoint"] == "snowflake":
+        try:
+            table = cursor.fetch_arrow_all()
+        except Exception as e:
+            # pyarrow is not installed, or the result is not in Arrow format
+            log("error.txt", f"Cannot fetch Arrow batches: {e}")
+        else:
+            if table is None:
+                return column_list, [[] for _ in column_list]
+            return column_list, [table.column(i) for i in range(table.num_columns)]
+
+    row_list = cursor.fetchall()
+    if not row_list:
+        return column_list, [[] for _ in column_list]
+    return column_list, list(zip(*row_list))
+
+
+def get_python_list(column: Sequence[Any], count: Optional[int] = None) -> List[Any]:
+    """
+    Return the first values of a column fetched by fetch_column as Python
+    objects.
+
+    Args:
+        column: Values of a column, possibly an Arrow array
+        count: Number of values. Defaults to all of them.
+    """
+    if count is not None:
+        column = column[:count]
+    return column.to_pylist() if hasattr(column, "to_pylist") else list(column)
@@ -0,0 +1,256 @@
+# Copyright (c) 2025 Haoyu Li
+# Released under the MIT License.
+# See LICENSE file in the project root for details.
+
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Deadline Module
+===============
+
+This module plans each request against an end-to-end latency target
+(--deadline-target seconds from the input to the first preview), instead of
+bounding each stage only by --llm-timeout and --db-timeout.
+
+Key Features:
+    - Split of the target between the debug (LLM validation), create
+      (rewrite) and preview (execution) stages
+    - Fast model when the accurate one is not expected to answer within the
+      debug budget
+    - Sampling ratio chosen for the budget of the stage (see latency)
+    - No speculative widening (see get_powerset) once create is behind
+    - Achieved versus target latency, logged and summarized in /stats
+
+Note:
+    Plans are kept per thread. Requests are handled each in a thread of its
+    own, and background workers have no plan, so they are not constrained.
+"""
+
+import sys
+import time
+import math
+import threading
+from collections import deque
+from pathlib import Path
+from typing import Any, Deque, Dict, Optional
+
+# -----------------------------------------------------------------------------
+# Path Configuration
+# -----------------------------------------------------------------------------
+
+root_dir = str(Path(__file__).parent.parent)
+sys.path.extend(
+    [
+        root_dir,
+        str(Path(root_dir) / "src"),
+        str(Path(root_dir) / "util"),
+    ]
+)
+
+# -----------------------------------------------------------------------------
+# Local Imports
+# -----------------------------------------------------------------------------
+
+from param import get_enable_param, get_deadline_param
+from log import log
+
+# -----------------------------------------------------------------------------
+# Global Variables
+# -----------------------------------------------------------------------------
+
+"""
+Share of the target of each stage, in order. The LLM and the preview query
+dominate; create mostly hits temporary tables that already exist.
+"""
+DEADLINE_SHARE = {
+    "debug": 0.4,
+    "create": 0.2,
+    "preview": 0.4,
+}
+
+# Weight of the newest observation of the latency of a model
+MODEL_ALPHA = 0.2
+
+# Maps a request thread to its plan
+deadline_plan: Dict[int, Dict[str, Any]] = {}
+deadline_lock = threading.Lock()
+
+# Seconds one LLM response takes, per model
+model_latency: Dict[str, Optional[float]] = {
+    "fast": None,
+    "accurate": None,
+}
+
+# Achieved latency of the recent requests, None if no preview was produced
+achieved_list: Deque[Optional[float]] = deque(maxlen=1000)
+
+# -----------------------------------------------------------------------------
+# Plan
+# -----------------------------------------------------------------------------
+
+
+def start_deadline() -> None:
+    """Start the plan of the request handled by the current thread."""
+    if not get_enable_param()["deadline"]:
+        return
+    with deadline_lock:
+        deadline_plan[threading.get_ident()] = {
+            "start": time.time(),
+            "stage": {},
+            "first_preview": None,
+            "superseded": False,
+        }
+
+
+def get_plan() -> Optional[Dict[str, Any]]:
+    """Return the plan of the current thread, if any."""
+    with deadline_lock:
+        return deadline_plan.get(threading.get_ident())
+
+
+def get_stage_budget(stage: str) -> Optional[float]:
+    """
+    Return the seconds left until the end of a stage, which may be negative.
+
+    Args:
+        stage: "debug", "create" or "preview"
+
+    Returns:
+        Optional[float]: None if the current thread has no plan
+
+    Example:
+        >>> # --deadline-target 1.5, 0.5 s after the input
+        >>> get_stage_budget("create")
+        0.4
+    """
+    plan = get_plan()
+    if plan is None:
+        return None
+    share = 0.0
+    for name, stage_share in DEADLINE_SHARE.items():
+        share += stage_share
+        if name == stage:
+            break
+    return plan["start"] + share * get_deadline_param()["target"] - time.time()
+
+
+def finish_stage(stage: str) -> None:
+    """Record the end of a stage of the current plan."""
+    plan = get_plan()
+    if plan is not None:
+        plan["stage"][stage] = time.time() - plan["start"]
+
+
+def is_behind_deadline(stage: str) -> bool:
+    """Return whether the current plan has used up the budget of a stage."""
+    budget = get_stage_budget(stage)
+    return budget is not None and budget <= 0
+
+
+def mark_first_preview() -> None:
+    """Record that the first preview has been sent."""
+    plan = get_plan()
+    if plan is not None and plan["first_preview"] is None:
+        plan["first_preview"] = time.time() - plan["start"]
+
+
+def mark_superseded() -> None:
+    """Record that a newer input took over the request of the current plan."""
+    plan = get_plan()
+    if plan is not None:
+        plan["superseded"] = True
+
+
+def finish_deadline() -> None:
+    """
+    End the plan of the current thread, and record the latency it achieved
+    against the target in deadline.txt.
+
+    Note:
+        A request superseded by a newer keystroke before its first preview
+        is not recorded, as it was abandoned rather than late.
+    """
+    with deadline_lock:
+        plan = deadline_plan.pop(threading.get_ident(), None)
+    if plan is None or (plan["superseded"] and plan["first_preview"] is None):
+        return
+
+    achieved = plan["first_preview"]
+    target = get_deadline_param()["target"]
+    achieved_list.append(achieved)
+    log(
+        "deadline.txt",
+        {
+            "target": target,
+            "achieved": achieved,
+            "met": achieved is not None and achieved <= target,
+            "stage": plan["stage"],
+        },
+        is_dict=True,
+    )
+
+# -----------------------------------------------------------------------------
+# Model Choice
+# -----------------------------------------------------------------------------
+
+
+def update_model_latency(model: str, elapsed_time: float) -> None:
+    """
+    Learn the latency of a model.
+
+    Args:
+        model: "fast" or "accurate"
+        elapsed_time: Seconds the response took
+    """
+    with deadline_lock:
+        if model_latency[model] is None:
+            model_latency[model] = elapsed_time
+        else:
+            model_latency[model] += MODEL_ALPHA * (elapsed_time - model_latency[model])
+
+
+def should_use_fast_model() -> bool:
+    """
+    Return whether the accurate model is not expected to answer within the
+    debug budget of the current plan.
+    """
+    budget = get_stage_budget("debug")
+    if budget is None:
+        return False
+    with deadline_lock:
+        accurate = model_latency["accurate"]
+    return accurate is not None and accurate > budget
+
+# -----------------------------------------------------------------------------
+# Statistics
+# -----------------------------------------------------------------------------
+
+
+def get_deadline_stats() -> Dict[str, Any]:
+    """
+    Summarize the achieved latency of the recent requests.
+
+    Example:
+        >>> get_deadline_stats()
+        {'target': 1.5, 'count': 40, 'met': 31, 'p50': 0.92, 'p90': 2.4}
+    """
+    with deadline_lock:
+        achieved = list(achieved_list)
+    target = get_deadline_param()["target"]
+    # A request without a preview counts as the slowest
+    ordered = sorted(a if a is not None else math.inf for a in achieved)
+
+    def percentile(p: float) -> Optional[float]:
+        if not ordered:
+            return None
+        value = ordered[min(int(p * len(ordered)), len(ordered) - 1)]
+        return None if value == math.inf else value
+
+    return {
+        "target": target,
+        "count": len(ordered),
+        "met": sum(1 for a in ordered if a <= target),
+        "p50": percentile(0.5),
+        "p90": percentile(0.9),
+    }
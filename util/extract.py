@@ -12,7 +12,7 @@ Extract module for SpeQL.
 import sys
 import re
 from pathlib import Path
-from typing import Dict
+from typing import Dict, Any, Tuple, Iterable
 
 # -----------------------------------------------------------------------------
 # Path Configuration
@@ -29,7 +29,9 @@ sys.path.extend([
 # Local Imports
 # -----------------------------------------------------------------------------
 
-from parse import get_parse, parse_table, parse_condition
+from parse import parse_table, parse_condition
+from query import get_query, get_fingerprint
+from cache import BoundedCache
 from log import log
 
 # -----------------------------------------------------------------------------
@@ -50,7 +52,10 @@ def extract_inner(sql: str, clause_type: str) -> list:
     Raises:
         AssertionError: If clause_type is not supported
     """
-    parsed = get_parse(sql)
+    """
+    The shared AST is only read here, so no copy is made for each clause.
+    """
+    parsed = get_query(sql).parse
     
     if clause_type == "select":
         """
@@ -253,9 +258,158 @@ def extract_inner(sql: str, clause_type: str) -> list:
         # This should never happen.
         assert False, f"Unsupported clause type: {clause_type}"
 
-extract_dict = {}
+# -----------------------------------------------------------------------------
+# Clause IR
+# -----------------------------------------------------------------------------
+
+class Frozen:
+    """
+    Base class of the immutable clause objects. Fields are set once in
+    __init__, the hash is computed once, and updates go through replace().
+    Fields can also be read as obj["field"], so callers written against
+    the former dict representation keep working.
+    """
+    __slots__ = ("_hash",)
+    FIELDS: Tuple[str, ...] = ()
+
+    def __init__(self, **fields: Any) -> None:
+        for field in self.FIELDS:
+            object.__setattr__(self, field, fields[field])
+        object.__setattr__(
+            self, "_hash", hash(tuple(getattr(self, field) for field in self.FIELDS))
+        )
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        raise AttributeError(f"{type(self).__name__} is immutable, use replace()")
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in self.FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __hash__(self) -> int:
+        return self._hash
+
+    def __eq__(self, other: Any) -> bool:
+        if type(other) is not type(self):
+            return NotImplemented
+        return self._hash == other._hash and all(
+            getattr(self, field) == getattr(other, field) for field in self.FIELDS
+        )
+
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{field}={getattr(self, field)!r}" for field in self.FIELDS)
+        return f"{type(self).__name__}({fields})"
+
+    def replace(self, **changes: Any) -> "Frozen":
+        """Return a copy with some fields changed."""
+        fields = {field: getattr(self, field) for field in self.FIELDS}
+        fields.update(changes)
+        return type(self)(**fields)
+
+
+class ClauseItem(Frozen):
+    """
+    A select item or a table: an expression and its alias.
+
+    Example:
+        >>> ClauseItem(name='"T"."A"', alias='"A"')["alias"]
+        '"A"'
+    """
+    __slots__ = ("name", "alias")
+    FIELDS = ("name", "alias")
+
+
+class JoinItem(Frozen):
+    """
+    A joined table with its join type and conditions. condition keeps the
+    order of the query, condition_set is used for matching.
+    """
+    __slots__ = ("table", "type", "condition", "condition_set")
+    FIELDS = ("table", "type", "condition")
+
+    def __init__(self, **fields: Any) -> None:
+        fields["condition"] = tuple(fields["condition"])
+        super().__init__(**fields)
+        object.__setattr__(self, "condition_set", frozenset(self.condition))
+
+
+class Clause(Frozen):
+    """
+    The extracted clauses of a query, returned by extract().
+
+    Each clause is a tuple in query order. The sets are precomputed so that
+    rewrite can match clauses with set operations.
+
+    Example:
+        >>> clause = extract('SELECT "T"."A" AS "A" FROM "T" AS "T" WHERE "T"."B" = 1')
+        >>> clause["where"], clause.where_set
+        (('"T"."B" = 1',), frozenset({'"T"."B" = 1'}))
+        >>> clause.replace(where=())["where"]
+        ()
+    """
+    __slots__ = (
+        "select", "from_", "join", "where", "group", "order", "having", "limit",
+        "distinct", "select_set", "where_set", "group_set", "having_set",
+        "join_table_set",
+    )
+    FIELDS = (
+        "select", "from_", "join", "where", "group", "order", "having", "limit",
+        "distinct",
+    )
+
+    def __init__(self, **fields: Any) -> None:
+        """
+        Fields are the clause types of extract_inner(). "from" is stored as
+        from_ because it is a keyword. Lists are converted to tuples.
+        """
+        if "from" in fields:
+            fields["from_"] = fields.pop("from")
+        super().__init__(**{field: tuple(fields[field]) for field in self.FIELDS})
+        object.__setattr__(self, "select_set", frozenset(self.select))
+        object.__setattr__(self, "where_set", frozenset(self.where))
+        object.__setattr__(self, "group_set", frozenset(self.group))
+        object.__setattr__(self, "having_set", frozenset(self.having))
+        object.__setattr__(
+            self, "join_table_set", frozenset(join.table for join in self.join)
+        )
+
+    def __getitem__(self, key: str) -> Any:
+        return super().__getitem__("from_" if key == "from" else key)
+
+    def replace(self, **changes: Iterable) -> "Clause":
+        """
+        Example:
+            >>> clause.replace(order=(), limit=())
+        """
+        return super().replace(**changes)
+
+
+def to_clause(extract_result: Dict[str, list]) -> Clause:
+    """Convert the lists and dicts of extract_inner() into a Clause."""
+    return Clause(
+        select=[ClauseItem(**item) for item in extract_result["select"]],
+        from_=[ClauseItem(**item) for item in extract_result["from"]],
+        join=[
+            JoinItem(
+                table=ClauseItem(**item["table"]),
+                type=item["type"],
+                condition=tuple(item["condition"]),
+            )
+            for item in extract_result["join"]
+        ],
+        where=extract_result["where"],
+        group=extract_result["group"],
+        order=extract_result["order"],
+        having=extract_result["having"],
+        limit=extract_result["limit"],
+        distinct=extract_result["distinct"],
+    )
+
+
+extract_dict = BoundedCache("extract")
 
-def extract(sql: str) -> Dict[str, list]:
+def extract(sql: str) -> Clause:
     """
     Extracts all supported clauses from a SQL query.
     
@@ -263,12 +417,14 @@ def extract(sql: str) -> Dict[str, list]:
         sql: SQL query to parse
         
     Returns:
-        Dict[str, list]: Dictionary containing parsed components of each 
-        clause. Return type differs according to the clause_type. See 
-        extract_inner() for details.
+        Clause: Immutable components of each clause. The item types differ
+        according to the clause_type. See extract_inner() for details. The
+        result is shared through the cache, so use replace() to change it.
     """
-    if sql not in extract_dict:
-        extract_dict[sql] = {
+    sql_key = get_fingerprint(sql)
+    extract_sql = extract_dict.get(sql_key)
+    if extract_sql is None:
+        extract_sql = to_clause({
             "select": extract_inner(sql, "select"),
             "from": extract_inner(sql, "from"),
             "join": extract_inner(sql, "join"),
@@ -278,5 +434,6 @@ def extract(sql: str) -> Dict[str, list]:
             "having": extract_inner(sql, "having"),
             "limit": extract_inner(sql, "limit"),
             "distinct": extract_inner(sql, "distinct"),
-        }.copy()
-    return extract_dict[sql].copy()
+        })
+        extract_dict[sql_key] = extract_sql
+    return extract_sql
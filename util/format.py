@@ -14,9 +14,11 @@ It also includes functions to format query results and modifications.
 
 import sys
 import re
-import pandas as pd
+import math
+import datetime
+from decimal import Decimal
 from pathlib import Path
-from typing import Dict, List, Optional, Any, Union
+from typing import Dict, List, Optional, Any, Sequence, Tuple, Union
 
 # -----------------------------------------------------------------------------
 # Path Configuration
@@ -35,18 +37,19 @@ sys.path.extend(
 # Local Imports
 # -----------------------------------------------------------------------------
 
-from parse import parse_preview
 from param import get_plugin_param
 from dialect import patch
-from db_api import get_cursor
-from sample import get_sample
+from db_api import get_cursor, get_python_list
+from sample import get_sample, CI_SUFFIX
 from concurrency import get_recent_tid, get_background_tid
+from query import Fingerprint, get_query, get_fingerprint
+from cache import BoundedCache
 
 # -----------------------------------------------------------------------------
 # Global State
 # -----------------------------------------------------------------------------
 
-format_dict: Dict[str, str] = {}
+format_dict = BoundedCache("format")
 
 # -----------------------------------------------------------------------------
 # SQL Formatting Functions
@@ -63,10 +66,16 @@ def format(sql_string: str) -> str:
     Returns:
         str: Formatted SQL string
     """
-    if sql_string in format_dict:
-        return format_dict[sql_string]
+    """
+    The output keeps the exact text of string literals and comments, so it is
+    keyed by the hash of the raw text, which the shared query object computes
+    once, instead of the canonical query.
+    """
+    mem_key = get_query(sql_string).text_fingerprint
+    formatted = format_dict.get(mem_key)
+    if formatted is not None:
+        return formatted
 
-    mem_string = sql_string
     sql_string = patch(sql_string)
 
     """
@@ -108,8 +117,8 @@ def format(sql_string: str) -> str:
         get_plugin_param()["cursor_identifier"],
     )
 
-    format_dict[mem_string] = sql_string.strip()
-    return format_dict[mem_string]
+    format_dict[mem_key] = sql_string.strip()
+    return sql_string.strip()
 
 
 def format_clause(clause_dict: Dict[str, Any]) -> str:
@@ -268,14 +277,14 @@ def prepare_sql(sql: str) -> Optional[Dict[str, Union[str, int]]]:
 
 
 def format_output(
-    prepare_result: Optional[Dict[str, Any]], sql_to_preview: Dict[str, Dict[str, str]]
+    prepare_result: Optional[Dict[str, Any]], sql_to_preview: Dict[Fingerprint, Dict[str, str]]
 ) -> Dict[str, str]:
     """
     Formats SQL output with preview and modifications.
 
     Args:
         prepare_result: Dictionary containing SQL parts and formatting info
-        sql_to_preview: Dictionary mapping SQL to preview and modification info
+        sql_to_preview: Dictionary mapping SQL fingerprint to preview and modification info
 
     Returns:
         Dict[str, str]: Dictionary containing:
@@ -286,9 +295,10 @@ def format_output(
     if prepare_result is None:
         preview, modification, show = "", "", False
     else:
+        sql_key = get_fingerprint(prepare_result["sql"])
         if (
             prepare_result["priority"] == 0
-            or prepare_result["sql"] not in sql_to_preview
+            or sql_key not in sql_to_preview
         ):
             (
                 preview,
@@ -300,7 +310,7 @@ def format_output(
                 False,
             )
         else:
-            preview = sql_to_preview[prepare_result["sql"]]["preview"]
+            preview = sql_to_preview[sql_key]["preview"]
             show = True
             cursor_id = get_plugin_param()["cursor_identifier"]
 
@@ -336,7 +346,7 @@ def format_output(
             # with open("preview.txt", "w") as f:
             #     f.write(sql_to_preview[prepare_result["sql"]]["preview"])
             
-            modification = sql_to_preview[prepare_result["sql"]][
+            modification = sql_to_preview[sql_key][
                 "modification"
             ].replace(cursor_id, "")
             modification = modification.rstrip()
@@ -363,41 +373,185 @@ def format_modification(modification: Optional[str]) -> Optional[str]:
     return modification
 
 
-def format_preview(result: List[Any]) -> str:
+# -----------------------------------------------------------------------------
+# Preview Formatting
+# -----------------------------------------------------------------------------
+
+
+def get_value_type(value: Any) -> str:
     """
-    Formats query result preview with truncation.
+    Returns the type of a result value in the structured preview: "null",
+    "boolean", "number", "date", "datetime" or "string".
+    """
+    if value is None:
+        return "null"
+    if isinstance(value, bool):
+        return "boolean"
+    if isinstance(value, (int, float, Decimal)):
+        return "number"
+    if isinstance(value, datetime.datetime):
+        return "datetime"
+    if isinstance(value, datetime.date):
+        return "date"
+    return "string"
+
+
+def format_value(value: Any) -> str:
+    """
+    Formats a result value as a cell of the text preview.
+
+    Example:
+        >>> format_value(Decimal("12.50")), format_value(datetime.date(2000, 1, 2))
+        ('12.50', '2000-01-02')
+    """
+    if value is None:
+        return "None"
+    if isinstance(value, float):
+        return str(round(value, 6))
+    if isinstance(value, datetime.datetime):
+        return value.isoformat(sep=" ")
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return bytes(value).hex()
+    # Keep one row per line
+    return str(value).replace("\n", "\\n")
+
+
+def to_json_value(value: Any) -> Any:
+    """Converts a result value to a JSON value of the structured preview."""
+    if value is None or isinstance(value, (bool, int, str)):
+        return value
+    if isinstance(value, (float, Decimal)):
+        if not math.isfinite(value):
+            return None
+        return int(value) if isinstance(value, Decimal) and value == value.to_integral_value() else float(value)
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    return format_value(value)
+
+
+def format_preview_table(
+    value_list: Sequence[Sequence[Any]], column_list: List[str]
+) -> Tuple[str, Dict[str, Any]]:
+    """
+    Formats a query result, by column, as a text table and a structured
+    payload.
+
+    The values are formatted by type straight from the fetched columns (see
+    fetch_column), and only the rows and characters that fit --plugin-preview
+    and --plugin-preview-char are formatted at all. Only those values become
+    Python objects if the columns are Arrow arrays. The confidence interval
+    columns of a sampled preview (see scale_aggregate) are merged into the
+    cells of their values.
 
     Args:
-        result: Query result rows
+        value_list: Values of each column
+        column_list: Column names, in the same order
 
     Returns:
-        str: Formatted preview string with comments
+        Tuple[str, Dict[str, Any]]: The text table, and
+            {"columns": [{"name", "type"}], "rows", "ci95", "truncated", "sampled"}
+
+    Example:
+        >>> text, table = format_preview_table([(1,), (Decimal("2.5"),), (0.1,)], ["a", "s", "s_ci95"])
+        >>> print(text)
+           a          s
+        0  1  2.5 ± 0.1
+        >>> table["ci95"]
+        {'s': [0.1]}
     """
-    preview_lines = (
-        pd.DataFrame(
-            [parse_preview(str(row)) for row in result],
-            columns=[desc[0] for desc in get_cursor()["execute"].description],
+    plugin_params = get_plugin_param()
+    # The header is the first line of the text table
+    row_count = max(plugin_params["preview"] - 1, 0)
+    truncated = bool(value_list) and len(value_list[0]) > row_count
+    value_list = [get_python_list(column, row_count) for column in value_list]
+    row_count = len(value_list[0]) if value_list else 0
+
+    # Pair each confidence interval column with the column of its value
+    name_to_index = {str(column).lower(): i for i, column in enumerate(column_list)}
+    ci_index = {}
+    for i, column in enumerate(column_list):
+        name = str(column).lower()
+        if name.endswith(CI_SUFFIX) and name[: -len(CI_SUFFIX)] in name_to_index:
+            ci_index[name_to_index[name[: -len(CI_SUFFIX)]]] = i
+    value_index = [i for i in range(len(column_list)) if i not in ci_index.values()]
+
+    # A cell wider than the whole preview cannot be shown anyway
+    max_width = plugin_params["preview_char"]
+    header = [str(column_list[i]) for i in value_index]
+    cell_list = []
+    for i in value_index:
+        cell = [format_value(value) for value in value_list[i]]
+        if i in ci_index:
+            cell = [
+                text if ci is None or ci != ci else f"{text} ± {float(ci):.4g}"
+                for text, ci in zip(cell, value_list[ci_index[i]])
+            ]
+        cell_list.append(
+            [text if len(text) <= max_width else text[: max_width - 3] + "..." for text in cell]
         )
-        .to_string()
-        .split("\n")
-    )
+
+    # Right-aligned columns after a row number, as pandas prints them
+    number_width = len(str(max(row_count - 1, 0)))
+    width = [max([len(name)] + [len(text) for text in cell]) for name, cell in zip(header, cell_list)]
+    line_list = [
+        " " * number_width + "".join(f"  {name.rjust(w)}" for name, w in zip(header, width))
+    ] + [
+        str(n).ljust(number_width)
+        + "".join(f"  {cell[n].rjust(w)}" for cell, w in zip(cell_list, width))
+        for n in range(row_count)
+    ]
 
     truncated_preview = []
     char_count = 0
-    plugin_params = get_plugin_param()
-
-    for i, line in enumerate(preview_lines):
-        if (
-            i == plugin_params["preview"]
-            or char_count + len(line) > plugin_params["preview_char"]
-        ):
-            truncated_preview.append("...")
+    for line in line_list:
+        if char_count + len(line) > plugin_params["preview_char"]:
+            truncated = True
             break
-
         truncated_preview.append(line)
         char_count += len(line)
+    if truncated:
+        truncated_preview.append("...")
 
     if get_sample():
         truncated_preview.append("SpeQL may make mistakes. Check important info.")
 
-    return "\n".join(truncated_preview)
+    table = {
+        "columns": [
+            {
+                "name": str(column_list[i]),
+                "type": next(
+                    (get_value_type(value) for value in value_list[i] if value is not None),
+                    "null",
+                ),
+            }
+            for i in value_index
+        ],
+        "rows": [[to_json_value(value_list[i][n]) for i in value_index] for n in range(row_count)],
+        "ci95": {
+            str(column_list[i]): [to_json_value(value) for value in value_list[j]]
+            for i, j in ci_index.items()
+        },
+        "truncated": truncated,
+        "sampled": get_sample(),
+    }
+    return "\n".join(truncated_preview), table
+
+
+def format_preview(result: Sequence[Sequence[Any]], column_list: Optional[List[str]] = None) -> str:
+    """
+    Formats query result preview with truncation.
+
+    Args:
+        result: Query result rows
+        column_list: Column names. Defaults to the description of the
+            execute cursor.
+
+    Returns:
+        str: Formatted preview string with comments
+    """
+    if column_list is None:
+        column_list = [desc[0] for desc in get_cursor()["execute"].description]
+    value_list = list(zip(*result)) if result else [[] for _ in column_list]
+    return format_preview_table(value_list, column_list)[0]
@@ -0,0 +1,142 @@
+# Copyright (c) 2025 Haoyu Li
+# Released under the MIT License.
+# See LICENSE file in the project root for details.
+
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Latency Prediction Module
+=========================
+
+This module predicts the runtime of a statement from its EXPLAIN cost, so
+that SpeQL picks the sampling ratio that meets --plugin-latency-target on the
+first attempt instead of waiting for --db-timeout and halving the sample.
+The timeout stays as a safety net for mispredictions.
+
+Key Features:
+    - Seconds per unit of EXPLAIN cost, learned from the metrics of earlier
+      statements as an exponentially weighted moving average in log space
+    - Initial number of halvings of the sampling ratio (see sample_script)
+"""
+
+import sys
+import math
+import threading
+from pathlib import Path
+from typing import Dict, Optional
+
+# -----------------------------------------------------------------------------
+# Path Configuration
+# -----------------------------------------------------------------------------
+
+root_dir = str(Path(__file__).parent.parent)
+sys.path.extend(
+    [
+        root_dir,
+        str(Path(root_dir) / "src"),
+        str(Path(root_dir) / "util"),
+    ]
+)
+
+# -----------------------------------------------------------------------------
+# Local Imports
+# -----------------------------------------------------------------------------
+
+from param import get_plugin_param
+from deadline import get_stage_budget
+
+# -----------------------------------------------------------------------------
+# Global Variables
+# -----------------------------------------------------------------------------
+
+"""
+Weight of the newest observation. The EXPLAIN cost already reflects the table
+statistics, so the rate only has to absorb the speed of the cluster, which
+changes slowly. The average is taken in log space, so that one plan whose
+cost is far off does not dominate.
+"""
+LATENCY_ALPHA = 0.2
+
+# Log of the seconds per unit of EXPLAIN cost, one model per statement kind
+log_rate: Dict[str, Optional[float]] = {
+    "create": None,
+    "preview": None,
+}
+log_rate_lock = threading.Lock()
+
+# -----------------------------------------------------------------------------
+# Latency Model
+# -----------------------------------------------------------------------------
+
+
+def update_latency(kind: str, cost: Optional[float], elapsed_time: float, sampling_ratio: float) -> None:
+    """
+    Learn from the elapsed time of a statement.
+
+    Args:
+        kind: "create" or "preview"
+        cost: EXPLAIN cost of the statement without sampling
+        elapsed_time: Elapsed seconds. For a timeout, --db-timeout, a lower
+            bound that still moves the rate the right way
+        sampling_ratio: Fraction of the rows the statement read, as returned
+            by get_sample_script. A prebuilt sample table (see sample_table)
+            may read far fewer rows than the halvings suggest, or none may
+            be sampled at all.
+    """
+    if cost is None or cost <= 0 or elapsed_time <= 0:
+        return
+    # Assume the runtime is proportional to the sampled fraction
+    observed = math.log(elapsed_time) - math.log(cost * sampling_ratio)
+    with log_rate_lock:
+        if log_rate[kind] is None:
+            log_rate[kind] = observed
+        else:
+            log_rate[kind] += LATENCY_ALPHA * (observed - log_rate[kind])
+
+
+def predict_latency(kind: str, cost: Optional[float]) -> Optional[float]:
+    """
+    Predict the elapsed seconds of a statement without sampling.
+
+    Returns:
+        Optional[float]: None before the first observation, or if the cost
+        is unknown
+    """
+    with log_rate_lock:
+        rate = log_rate[kind]
+    if rate is None or cost is None or cost <= 0:
+        return None
+    return math.exp(rate) * cost
+
+
+def get_initial_sample_time(kind: str, cost: Optional[float], max_sample_time: int) -> int:
+    """
+    Return the number of halvings of the sampling ratio that brings the
+    predicted latency within --plugin-latency-target, or within the budget
+    of the stage if the request has a deadline plan and it is tighter.
+
+    Args:
+        kind: "create" or "preview"
+        cost: EXPLAIN cost of the statement without sampling
+        max_sample_time: Largest number of halvings the retry loop allows
+
+    Returns:
+        int: 0 (no sampling) if the prediction is unknown or within target
+
+    Example:
+        >>> # Predicted 7 s with a target of 2 s: a quarter of the rows
+        >>> get_initial_sample_time("preview", 1.4e6, 2)
+        2
+    """
+    predicted = predict_latency(kind, cost)
+    target = get_plugin_param()["latency_target"]
+    budget = get_stage_budget(kind)
+    if budget is not None:
+        # Within a request planned against --deadline-target (see deadline)
+        target = min(target, budget)
+    if predicted is None or predicted <= target:
+        return 0
+    if target <= 0:
+        return max_sample_time
+    return min(math.ceil(math.log2(predicted / target)), max_sample_time)
@@ -36,6 +36,8 @@ sys.path.extend(
 
 from param import get_llm_param, get_enable_param, get_test_param
 from log import log, append_test_info
+from cost import add_llm_tokens, is_degraded
+from deadline import should_use_fast_model, update_model_latency
 
 # -----------------------------------------------------------------------------
 # OpenAI Client Configuration
@@ -70,10 +72,14 @@ async def get_llm_response(
 
     assert task in ["complex", "middle", "explain", "simple"], "Invalid task"
 
+    # Past --budget-degrade-ratio of the token budget, only the fast model is used.
+    # The same holds if the accurate model would miss the deadline of the request.
+    use_fast = iterator == 0 or is_degraded("llm") or should_use_fast_model()
+
     try:
         if task == "complex" and get_enable_param()["predict_inference"]:
             model = (
-                get_llm_param()["fast"] if iterator == 0 else get_llm_param()["accurate"]
+                get_llm_param()["fast"] if use_fast else get_llm_param()["accurate"]
             )
             response = openai_api.chat.completions.create(
                 model=model,
@@ -94,7 +100,7 @@ async def get_llm_response(
 
         elif task in ["explain", "simple"]:
             model = (
-                get_llm_param()["fast"] if iterator == 0 else get_llm_param()["accurate"]
+                get_llm_param()["fast"] if use_fast else get_llm_param()["accurate"]
             )
             response = openai_api.chat.completions.create(
                 model=model,
@@ -115,6 +121,9 @@ async def get_llm_response(
     output = response.choices[0].message.content
     prompt_tokens = response.usage.prompt_tokens
     completion_tokens = response.usage.completion_tokens
+    add_llm_tokens(prompt_tokens, completion_tokens)
+    if task != "middle":
+        update_model_latency("fast" if use_fast else "accurate", end_time - start_time)
 
     record = {
         "task": task,
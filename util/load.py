@@ -0,0 +1,186 @@
+# Copyright (c) 2025 Haoyu Li
+# Released under the MIT License.
+# See LICENSE file in the project root for details.
+
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Warehouse Load Module
+=====================
+
+This module watches the load of the data warehouse, so that speculative work
+yields to the queries of other users when the cluster is busy and uses it
+fully when it is idle.
+
+Key Features:
+    - Queued and running queries sampled from sys_query_history, at most
+      once per --load-interval seconds
+    - Load levels (idle, normal, saturated) against --load-capacity
+    - Exponential backoff of the background workers while saturated
+    - Smaller sampling ratios while saturated
+"""
+
+import sys
+import time
+import threading
+from pathlib import Path
+from typing import Any, Dict
+
+# -----------------------------------------------------------------------------
+# Path Configuration
+# -----------------------------------------------------------------------------
+
+root_dir = str(Path(__file__).parent.parent)
+sys.path.extend(
+    [
+        root_dir,
+        str(Path(root_dir) / "src"),
+        str(Path(root_dir) / "util"),
+    ]
+)
+
+# -----------------------------------------------------------------------------
+# Local Imports
+# -----------------------------------------------------------------------------
+
+from param import get_load_param, get_dialect_param, get_plugin_param
+from db_api import (
+    get_cursor,
+    get_execute_session_id,
+    get_explain_session_id,
+    get_lane_session_id_list,
+)
+from concurrency import get_explain_cursor_lock
+from log import log
+
+# -----------------------------------------------------------------------------
+# Global Variables
+# -----------------------------------------------------------------------------
+
+"""
+The cluster is idle while the queries of other users use at most this
+fraction of --load-capacity, and saturated once they reach it or any query
+waits in the queue.
+"""
+IDLE_RATIO = 0.25
+
+load: Dict[str, Any] = {
+    "time": None,
+    "running": 0,
+    "queued": 0,
+    "level": "idle",
+}
+load_lock = threading.Lock()
+
+# Maps a background worker thread to its current backoff in seconds
+background_delay: Dict[int, float] = {}
+
+# -----------------------------------------------------------------------------
+# Load Sampling
+# -----------------------------------------------------------------------------
+
+
+def sample_load() -> None:
+    """
+    Count the running and queued queries of other sessions. SpeQL's own
+    sessions are left out, so that speculative work does not throttle
+    itself. Only Redshift exposes the queue, other endpoints stay idle.
+    """
+    if get_dialect_param()["endpoint"] != "redshift":
+        return
+
+    try:
+        with get_explain_cursor_lock():
+            get_cursor()["explain"].execute(
+                """
+SELECT session_id, status FROM sys_query_history WHERE status IN ('running', 'queued');
+"""
+            )
+            query_list = get_cursor()["explain"].fetchall()
+    except Exception as e:
+        log("error.txt", f"Cannot sample warehouse load: {e}")
+        return
+
+    # The explain session runs this query itself, EXPLAIN and the cancellations
+    session_id_set = {
+        get_execute_session_id(),
+        get_explain_session_id(),
+        *get_lane_session_id_list(),
+    }
+    query_list = [item for item in query_list if item[0] not in session_id_set]
+    load["running"] = sum(1 for item in query_list if item[1].strip() == "running")
+    load["queued"] = sum(1 for item in query_list if item[1].strip() == "queued")
+
+    capacity = get_load_param()["capacity"]
+    if load["queued"] > 0 or load["running"] >= capacity:
+        load["level"] = "saturated"
+    elif load["running"] <= capacity * IDLE_RATIO:
+        load["level"] = "idle"
+    else:
+        load["level"] = "normal"
+
+
+def get_load() -> Dict[str, Any]:
+    """
+    Return the warehouse load, sampled again if the last sample is older
+    than --load-interval seconds.
+
+    Returns:
+        Dict[str, Any]: "time", "running", "queued" and "level"
+
+    Example:
+        >>> get_load()
+        {'time': 1735689600.0, 'running': 2, 'queued': 0, 'level': 'normal'}
+    """
+    with load_lock:
+        now = time.time()
+        if load["time"] is None or now - load["time"] >= get_load_param()["interval"]:
+            load["time"] = now
+            sample_load()
+        return dict(load)
+
+# -----------------------------------------------------------------------------
+# Throttling
+# -----------------------------------------------------------------------------
+
+
+def get_background_delay() -> float:
+    """
+    Return the seconds the current background worker waits before its next
+    job. The delay of each worker doubles from --load-interval up to
+    --load-max-backoff while the cluster stays saturated, and drops to zero
+    once it is not.
+    """
+    tid = threading.get_ident()
+    with load_lock:
+        saturated = load["level"] == "saturated"
+        if saturated:
+            background_delay[tid] = min(
+                max(background_delay.get(tid, 0.0) * 2, get_load_param()["interval"]),
+                get_load_param()["max_backoff"],
+            )
+        else:
+            background_delay[tid] = 0.0
+        return background_delay[tid]
+
+
+def get_background_worker_limit() -> int:
+    """
+    Return how many background workers may run jobs: all of them while the
+    cluster is idle, one under normal load, and none while saturated.
+    """
+    level = get_load()["level"]
+    if level == "saturated":
+        return 0
+    if level == "normal":
+        return 1
+    return get_plugin_param()["background_worker_count"]
+
+
+def get_sample_shift() -> int:
+    """
+    Return the extra halvings of the sampling ratio (see sample_script). A
+    saturated cluster gets a sample half as large.
+    """
+    return 1 if get_load()["level"] == "saturated" else 0
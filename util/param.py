@@ -48,6 +48,11 @@ llm_param: Optional[Dict[str, Any]] = None
 plugin_param: Optional[Dict[str, Any]] = None
 max_iteration: Optional[int] = None
 test_param: Optional[Dict[str, bool]] = None
+cache_param: Optional[Dict[str, int]] = None
+load_param: Optional[Dict[str, Any]] = None
+budget_param: Optional[Dict[str, Any]] = None
+sample_table_param: Optional[Dict[str, Any]] = None
+deadline_param: Optional[Dict[str, Any]] = None
 
 # -----------------------------------------------------------------------------
 # Parameter Getters
@@ -109,6 +114,31 @@ def get_test_param() -> Dict[str, bool]:
     return test_param
 
 
+def get_cache_param() -> Dict[str, int]:
+    """Returns memo cache limits."""
+    return cache_param
+
+
+def get_load_param() -> Dict[str, Any]:
+    """Returns warehouse load parameters."""
+    return load_param
+
+
+def get_budget_param() -> Dict[str, Any]:
+    """Returns session cost budgets."""
+    return budget_param
+
+
+def get_sample_table_param() -> Dict[str, Any]:
+    """Returns sample table parameters."""
+    return sample_table_param
+
+
+def get_deadline_param() -> Dict[str, Any]:
+    """Returns end-to-end deadline parameters."""
+    return deadline_param
+
+
 def get_system_name() -> str:
     """Returns system name."""
     return "SpeQL"
@@ -145,6 +175,11 @@ def create_parser() -> argparse.ArgumentParser:
     parser.add_argument("--enable-predict-inference", type=bool, default=True)
     parser.add_argument("--enable-aggressive-debug", type=bool, default=False)
     parser.add_argument("--enable-result-cache", type=bool, default=True)
+    parser.add_argument("--enable-lattice", type=bool, default=True)
+    parser.add_argument("--enable-sample-table", type=bool, default=False)
+    parser.add_argument("--enable-progressive", type=bool, default=False)
+    parser.add_argument("--enable-deadline", type=bool, default=False)
+    parser.add_argument("--enable-preview-cache", type=bool, default=True)
 
     # Dialect parameters
     dialect_group = parser.add_argument_group("Dialect Parameters")
@@ -180,6 +215,7 @@ def create_parser() -> argparse.ArgumentParser:
     db_group.add_argument("--db-user", type=str, default="admin")
     db_group.add_argument("--db-timeout", type=int, default=30)
     db_group.add_argument("--db-search-path", type=str, default="ext_tpcds100")
+    db_group.add_argument("--db-connection-count", type=int, default=1)
     
     # # snowflake
     # db_group.add_argument(
@@ -210,6 +246,44 @@ def create_parser() -> argparse.ArgumentParser:
     plugin_group.add_argument(
         "--plugin-debug-simple-message-size", type=int, default=8192
     )
+    plugin_group.add_argument("--plugin-middle-timeout", type=float, default=0.5)
+    plugin_group.add_argument("--plugin-powerset-column-count", type=int, default=8)
+    plugin_group.add_argument("--plugin-powerset-width", type=int, default=64)
+    plugin_group.add_argument("--plugin-lattice-count", type=int, default=3)
+    plugin_group.add_argument("--plugin-background-worker-count", type=int, default=1)
+    plugin_group.add_argument("--plugin-latency-target", type=float, default=2.0)
+    plugin_group.add_argument("--plugin-progressive-start", type=int, default=6)
+    plugin_group.add_argument("--plugin-progressive-step", type=int, default=2)
+    plugin_group.add_argument("--plugin-progressive-budget", type=float, default=10.0)
+    # Cache parameters
+    cache_group = parser.add_argument_group("Cache Parameters")
+    cache_group.add_argument("--cache-count", type=int, default=10000)
+    cache_group.add_argument("--cache-size", type=int, default=64)
+    cache_group.add_argument("--cache-preview-size", type=int, default=16)
+
+    # Load parameters
+    load_group = parser.add_argument_group("Load Parameters")
+    load_group.add_argument("--load-interval", type=float, default=5.0)
+    load_group.add_argument("--load-capacity", type=int, default=5)
+    load_group.add_argument("--load-max-backoff", type=float, default=60.0)
+
+    # Budget parameters
+    budget_group = parser.add_argument_group("Budget Parameters")
+    budget_group.add_argument("--budget-warehouse-time", type=float, default=INF)
+    budget_group.add_argument("--budget-llm-tokens", type=float, default=INF)
+    budget_group.add_argument("--budget-degrade-ratio", type=float, default=0.8)
+
+    # Sample table parameters
+    sample_table_group = parser.add_argument_group("Sample Table Parameters")
+    sample_table_group.add_argument("--sample-table-min-size", type=int, default=1024)
+    sample_table_group.add_argument(
+        "--sample-table-refresh-interval", type=float, default=86400.0
+    )
+
+    # Deadline parameters
+    deadline_group = parser.add_argument_group("Deadline Parameters")
+    deadline_group.add_argument("--deadline-target", type=float, default=1.5)
+
     # LLM parameters
     llm_group = parser.add_argument_group("LLM Parameters")
     llm_group.add_argument("--llm-accurate", type=str, default="gpt-4o-2024-08-06")
@@ -252,7 +326,8 @@ def set_param() -> None:
 
     global cert_path, min_rule_length, similarity_threshold, dialect_param
     global vector_db_param, db_param, plugin_param, llm_param, max_iteration
-    global enable_param, test_param
+    global enable_param, test_param, cache_param, load_param, budget_param
+    global sample_table_param, deadline_param
 
     cert_path = args.cert_path
     min_rule_length = args.min_rule_length
@@ -266,6 +341,11 @@ def set_param() -> None:
         "predict_inference": args.enable_predict_inference,
         "aggressive_debug": args.enable_aggressive_debug,
         "result_cache": args.enable_result_cache,
+        "lattice": args.enable_lattice,
+        "sample_table": args.enable_sample_table,
+        "progressive": args.enable_progressive,
+        "deadline": args.enable_deadline,
+        "preview_cache": args.enable_preview_cache,
     }
 
     dialect_param = {
@@ -291,6 +371,7 @@ def set_param() -> None:
         "user": args.db_user,
         "timeout": args.db_timeout,
         "search_path": args.db_search_path,
+        "connection_count": args.db_connection_count,
         # redshift
         "password": read_secret(cert_path + "/redshift_db_password.secret"),
         # # snowflake
@@ -309,6 +390,42 @@ def set_param() -> None:
         "temporary_table_size": args.plugin_temporary_table_size,
         "debug_simple_message_count": args.plugin_debug_simple_message_count,
         "debug_simple_message_size": args.plugin_debug_simple_message_size,
+        "middle_timeout": args.plugin_middle_timeout,
+        "powerset_column_count": args.plugin_powerset_column_count,
+        "powerset_width": args.plugin_powerset_width,
+        "lattice_count": args.plugin_lattice_count,
+        "background_worker_count": args.plugin_background_worker_count,
+        "latency_target": args.plugin_latency_target,
+        "progressive_start": args.plugin_progressive_start,
+        "progressive_step": args.plugin_progressive_step,
+        "progressive_budget": args.plugin_progressive_budget,
+    }
+
+    cache_param = {
+        "count": args.cache_count,
+        "size": args.cache_size,
+        "preview_size": args.cache_preview_size,
+    }
+
+    load_param = {
+        "interval": args.load_interval,
+        "capacity": args.load_capacity,
+        "max_backoff": args.load_max_backoff,
+    }
+
+    budget_param = {
+        "warehouse_time": args.budget_warehouse_time,
+        "llm_tokens": args.budget_llm_tokens,
+        "degrade_ratio": args.budget_degrade_ratio,
+    }
+
+    sample_table_param = {
+        "min_size": args.sample_table_min_size,
+        "refresh_interval": args.sample_table_refresh_interval,
+    }
+
+    deadline_param = {
+        "target": args.deadline_target,
     }
 
     llm_param = {
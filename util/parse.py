@@ -10,10 +10,10 @@ import re
 import ast
 import traceback
 from pathlib import Path
-from typing import Dict, Any, List
-import sqlglot
-from sqlglot import parse_one
+from typing import Dict, Any, List, Optional
+from sqlglot import exp
 from sqlglot.optimizer import optimize
+from sqlglot.optimizer.scope import traverse_scope
 from sqlglot.expressions import And, Expression
 
 # -----------------------------------------------------------------------------
@@ -36,6 +36,7 @@ sys.path.extend(
 from param import get_dialect_param
 from schema import get_schema
 from log import log
+from query import get_query
 
 # -----------------------------------------------------------------------------
 # SQL Parsing Functions
@@ -112,9 +113,12 @@ def parse_condition(condition: Expression) -> List[str]:
 def get_parse(sql: str) -> Expression:
     """
     Get parsed SQL expression.
+
+    The text is parsed only once. The caller receives its own copy of the AST
+    and may modify it. Read-only callers should use get_query(sql).parse.
     """
     try:
-        parse = parse_one(sql, read=get_dialect_param()["input"])
+        parse = get_query(sql).copy()
     except Exception as e:
         log("error.txt", str(e))
         raise e
@@ -122,6 +126,137 @@ def get_parse(sql: str) -> Expression:
     return parse
 
 
+def replace_table(expression: Expression, alias_to_name: Dict[str, str]) -> Expression:
+    """
+    Replace references to tables (e.g. CTEs) with other tables on the AST.
+
+    A table is replaced when its name is in alias_to_name and it has no schema.
+    If the table is not aliased, or is aliased by its own name, the alias and
+    the column qualifiers that refer to it are replaced as well. Unlike a text
+    substitution, string literals and columns with the same name are kept.
+
+    Args:
+        expression: sqlglot expression. It is not modified.
+        alias_to_name: Maps unquoted table names to quoted table names
+
+    Returns:
+        Expression: A copy of the expression with the tables replaced
+
+    Example:
+        >>> replace_table(
+            parse_one('SELECT "cte"."a" FROM "cte" AS "cte" WHERE "b" = \'cte\''),
+            {"cte": '"SPEQL_TEMP_TABLE_1"'},
+        ).sql()
+        'SELECT "SPEQL_TEMP_TABLE_1"."a" FROM "SPEQL_TEMP_TABLE_1" AS "SPEQL_TEMP_TABLE_1" WHERE "b" = \'cte\''
+    """
+    expression = expression.copy()
+
+    def get_name(table: exp.Table) -> Optional[str]:
+        """The replacement of a table, or None if it is kept."""
+        if table.args.get("db") is not None or table.name not in alias_to_name:
+            return None
+        return alias_to_name[table.name].strip('"')
+
+    """
+    A column qualifier refers to a source of its own scope, or of an enclosing
+    scope if the subquery is correlated. Resolve each qualifier before any
+    table is renamed, so that a source of the same name in a nested scope
+    (e.g. "s"."cte" AS "cte") keeps its qualifiers.
+    """
+    column_to_name = []
+    for scope in traverse_scope(expression):
+        for column in scope.columns:
+            if column.args.get("db") is not None or not column.table:
+                continue
+            outer = scope
+            while outer is not None and column.table not in outer.sources:
+                outer = outer.parent
+            if outer is None or not isinstance(outer.sources[column.table], exp.Table):
+                continue
+            table = outer.sources[column.table]
+            name = get_name(table)
+            if name is not None and table.alias in ("", table.name):
+                column_to_name.append((column, name))
+
+    for table in list(expression.find_all(exp.Table)):
+        name = get_name(table)
+        if name is None:
+            continue
+        if table.alias == table.name:
+            table.set("alias", exp.TableAlias(this=exp.to_identifier(name, quoted=True)))
+        table.set("this", exp.to_identifier(name, quoted=True))
+
+    for column, name in column_to_name:
+        column.set("table", exp.to_identifier(name, quoted=True))
+
+    return expression
+
+
+def is_plain_table_reference(expression: Expression, alias_to_name: Dict[str, str]) -> bool:
+    """
+    Return whether every mention of the tables to replace is a plain
+    reference, so that substituting their quoted names in the text gives the
+    same result as replace_table. That is the case unless a name is also
+    used for a column, an output alias, another source or a table of another
+    schema, or appears inside a string literal. One pass over the AST, no
+    scope analysis.
+    """
+    quoted_list = [f'"{alias}"' for alias in alias_to_name]
+    for node in expression.find_all(exp.Identifier, exp.Literal):
+        if isinstance(node, exp.Literal):
+            if node.is_string and any(quoted in node.this for quoted in quoted_list):
+                return False
+            continue
+        if node.name not in alias_to_name:
+            continue
+        if not node.args.get("quoted"):
+            return False
+        parent = node.parent
+        if isinstance(parent, exp.Column) and node.arg_key == "table":
+            continue
+        if isinstance(parent, exp.Table) and node.arg_key == "this":
+            if parent.args.get("db") is not None:
+                return False
+            continue
+        if (
+            isinstance(parent, exp.TableAlias)
+            and isinstance(parent.parent, exp.Table)
+            and parent.parent.name == node.name
+        ):
+            continue
+        return False
+    return True
+
+
+def replace_table_sql(expression: Expression, alias_to_name: Dict[str, str]) -> str:
+    """
+    Return the SQL of replace_table(expression, alias_to_name).
+
+    If every mention of the tables is a plain reference (see
+    is_plain_table_reference), the quoted names are substituted in the text,
+    which is faster than resolving scopes. Otherwise the tables are replaced
+    on the AST.
+
+    Args:
+        expression: sqlglot expression. It is not modified.
+        alias_to_name: Maps unquoted table names to quoted table names
+
+    Returns:
+        str: The SQL with the tables replaced, not formatted
+    """
+    if is_plain_table_reference(expression, alias_to_name):
+        sql = expression.sql()
+        # One pass for all names, unless a comment mentions one of them
+        pattern = re.compile(
+            rf'(?<!\.)"({"|".join(re.escape(alias) for alias in alias_to_name)})"'
+        )
+        if not any(
+            pattern.search(comment) for comment in re.findall(r"/\*.*?\*/", sql, re.DOTALL)
+        ):
+            return pattern.sub(lambda match: alias_to_name[match.group(1)], sql)
+    return replace_table(expression, alias_to_name).sql()
+
+
 def parse_preview(row: str) -> Any:
     """
     Parse preview row string into Python objects.
@@ -152,14 +287,13 @@ def get_optimize(sql: str) -> str:
     """
     Optimize SQL query using sqlglot and output formatted SQL.
     """
-    sql = sqlglot.transpile(
-        sql,
-        read=get_dialect_param()["endpoint"],
-        write=get_dialect_param()["endpoint"],
-    )[0]
+    """
+    optimize() copies the expression, so the shared AST is passed directly.
+    """
+    parsed = get_query(sql, get_dialect_param()["endpoint"]).parse
 
     from format import format
 
     return format(
-        optimize(sql, get_schema(), dialect=get_dialect_param()["endpoint"]).sql()
+        optimize(parsed, get_schema(), dialect=get_dialect_param()["endpoint"]).sql()
     )
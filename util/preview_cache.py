@@ -0,0 +1,128 @@
+# Copyright (c) 2025 Haoyu Li
+# Released under the MIT License.
+# See LICENSE file in the project root for details.
+
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Preview Cache Module
+====================
+
+This module caches the result of the final preview statement, so that an
+input which rewrites to the same statement against the same temporary
+tables, e.g. after an edit of formatting or comments only, returns its
+preview without a round trip to the data warehouse.
+
+Key Features:
+    - Keyed by the canonical fingerprint of the statement and the version
+      of each temporary table it reads (see TemporaryTablePool)
+    - Bounded by --cache-preview-size MB, least recently used first
+    - Entries dropped when a table they read is evicted or created again
+
+Note:
+    Only exact results are cached. A sampled preview is recomputed, so that
+    it may become exact once the warehouse has time for it.
+"""
+
+import sys
+import threading
+from pathlib import Path
+from typing import Any, Dict, Hashable, Iterable, Optional, Set
+
+# -----------------------------------------------------------------------------
+# Path Configuration
+# -----------------------------------------------------------------------------
+
+root_dir = str(Path(__file__).parent.parent)
+sys.path.extend(
+    [
+        root_dir,
+        str(Path(root_dir) / "src"),
+        str(Path(root_dir) / "util"),
+    ]
+)
+
+# -----------------------------------------------------------------------------
+# Local Imports
+# -----------------------------------------------------------------------------
+
+from param import get_cache_param, get_enable_param
+from cache import BoundedCache
+
+# -----------------------------------------------------------------------------
+# Global Variables
+# -----------------------------------------------------------------------------
+
+preview_cache = BoundedCache(
+    "preview", max_size=get_cache_param()["preview_size"]
+)
+
+# Maps a temporary table name to the keys of the previews that read it
+table_to_key: Dict[str, Set[Hashable]] = {}
+table_to_key_lock = threading.Lock()
+
+# -----------------------------------------------------------------------------
+# Preview Cache
+# -----------------------------------------------------------------------------
+
+
+def get_cached_preview(key: Hashable) -> Optional[Any]:
+    """
+    Return the cached preview of a statement.
+
+    Args:
+        key: (fingerprint, ((table name, version), ...)), see get_preview_key
+
+    Returns:
+        Optional[Any]: None on a miss, or if the cache is disabled
+    """
+    if not get_enable_param()["preview_cache"]:
+        return None
+    return preview_cache.get(key)
+
+
+def set_cached_preview(key: Hashable, table_list: Iterable[str], preview: Any) -> None:
+    """
+    Cache the exact preview of a statement.
+
+    Args:
+        key: (fingerprint, ((table name, version), ...)), see get_preview_key
+        table_list: Temporary tables the statement reads
+        preview: Formatted preview
+    """
+    if not get_enable_param()["preview_cache"]:
+        return
+    preview_cache[key] = preview
+    with table_to_key_lock:
+        for table_name in table_list:
+            # Forget the keys that the LRU has evicted in the meantime
+            table_to_key[table_name] = {
+                item for item in table_to_key.get(table_name, ()) if item in preview_cache
+            } | {key}
+
+
+def invalidate_preview(table_name: str) -> None:
+    """
+    Drop the cached previews that read a temporary table. Called when the
+    table is evicted, or when its name is given to a new table.
+
+    Args:
+        table_name: Quoted name of the temporary table
+    """
+    with table_to_key_lock:
+        key_set = table_to_key.pop(table_name, set())
+    for key in key_set:
+        if key in preview_cache:
+            try:
+                del preview_cache[key]
+            except KeyError:
+                # Evicted by the LRU concurrently
+                pass
+
+
+def reset_preview_cache() -> None:
+    """Drop every cached preview, e.g. when the temporary tables are reset."""
+    with table_to_key_lock:
+        table_to_key.clear()
+    preview_cache.clear()
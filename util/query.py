@@ -0,0 +1,285 @@
+# Copyright (c) 2025 Haoyu Li
+# Released under the MIT License.
+# See LICENSE file in the project root for details.
+
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Query module for SpeQL.
+=============
+
+This module keeps a single parsed representation for each SQL text so that
+debug, create, rewrite and preview share the same sqlglot AST, formatted text
+and extracted clauses instead of re-parsing the string at every stage.
+
+Key Features:
+    1. Parse a SQL text once per dialect and reuse the AST
+    2. Cache the transpiled text for each target dialect
+    3. Profile parse and transpile time per request
+    4. Canonical fingerprints used as keys of the SQL-keyed caches
+"""
+
+import sys
+import re
+import time
+import threading
+import bisect
+import hashlib
+from pathlib import Path
+from typing import Dict, Any, NewType
+from sqlglot import parse_one
+from sqlglot.dialects.dialect import Dialect
+from sqlglot.expressions import Expression
+
+# -----------------------------------------------------------------------------
+# Path Configuration
+# -----------------------------------------------------------------------------
+
+root_dir = str(Path(__file__).parent.parent)
+sys.path.extend([
+    root_dir,
+    str(Path(root_dir) / "src"),
+    str(Path(root_dir) / "util"),
+])
+
+# -----------------------------------------------------------------------------
+# Local Imports
+# -----------------------------------------------------------------------------
+
+from param import get_dialect_param
+from cache import BoundedCache, get_size
+
+# -----------------------------------------------------------------------------
+# Global Variables
+# -----------------------------------------------------------------------------
+
+"""
+A fingerprint is the hex digest of a canonical query text. It is short and
+fixed-length, so caches keyed by it use less memory than caches keyed by SQL.
+"""
+Fingerprint = NewType("Fingerprint", str)
+FINGERPRINT_SIZE = 16
+
+# Block and line comments, see Query.fingerprint()
+COMMENT_PATTERN = re.compile(r"/\*.*?\*/|--[^\n]*", re.DOTALL)
+
+"""
+Keyed by (text fingerprint, dialect), so the key stays small however long the
+query is. The size is estimated before the query is parsed; a sqlglot AST
+takes roughly ten times the memory of its text.
+"""
+query_dict = BoundedCache("query", sizeof=lambda key, query: 10 * get_size(query.sql))
+query_lock = threading.Lock()
+
+"""
+Profiling counters are thread-local because every request runs main_inner
+in its own thread, and the background thread must not pollute them.
+"""
+profile = threading.local()
+
+# -----------------------------------------------------------------------------
+# Profiling
+# -----------------------------------------------------------------------------
+
+def reset_profile() -> None:
+    """Reset the parse, transpile and rewrite counters of the current thread."""
+    profile.counter = {
+        "parse_call": 0,
+        "parse_count": 0,
+        "parse_time": 0.0,
+        "transpile_call": 0,
+        "transpile_count": 0,
+        "transpile_time": 0.0,
+        "rewrite_call": 0,
+        "rewrite_count": 0,
+        "rewrite_time": 0.0,
+    }
+
+
+def get_profile() -> Dict[str, Any]:
+    """
+    Return the parse, transpile and rewrite counters of the current thread.
+
+    Returns:
+        Dict[str, Any]: "*_call" is how many times a stage asked for the AST or
+        the transpiled text, "*_count" and "*_time" are the parses or
+        transpiles that actually ran and the seconds they took.
+    """
+    if not hasattr(profile, "counter"):
+        reset_profile()
+    return profile.counter.copy()
+
+
+def record_profile(stage: str, elapsed: float | None = None) -> None:
+    """
+    Record one call of a stage, and the elapsed time if the work actually ran.
+
+    Args:
+        stage: "parse", "transpile" or "rewrite"
+        elapsed: Seconds spent, or None if the cached result was reused
+    """
+    if not hasattr(profile, "counter"):
+        reset_profile()
+    profile.counter[f"{stage}_call"] += 1
+    if elapsed is not None:
+        profile.counter[f"{stage}_count"] += 1
+        profile.counter[f"{stage}_time"] += elapsed
+
+# -----------------------------------------------------------------------------
+# Query Object
+# -----------------------------------------------------------------------------
+
+class Query:
+    """
+    A SQL text together with everything derived from it.
+
+    The AST is shared by every caller and must be treated as read-only.
+    Callers that modify the tree (e.g. reset_limit) should use copy().
+
+    Example:
+        >>> query = get_query("SELECT A FROM T AS T")
+        >>> query.parse is get_query("SELECT A FROM T AS T").parse
+        True
+        >>> query.transpile("redshift")
+        'SELECT A FROM T AS T'
+    """
+
+    def __init__(self, sql: str, dialect: str, text_fingerprint: Fingerprint) -> None:
+        self.sql = sql
+        self.dialect = dialect
+        # Hash of the raw text, computed once, see get_text_fingerprint()
+        self.text_fingerprint = text_fingerprint
+        self._parse: Expression | None = None
+        self._transpile: Dict[str, str] = {}
+        self._fingerprint: Dict[bool, Fingerprint] = {}
+
+    @property
+    def parse(self) -> Expression:
+        """The sqlglot AST, parsed on first use."""
+        if self._parse is None:
+            start_time = time.perf_counter()
+            self._parse = parse_one(self.sql, read=self.dialect)
+            record_profile("parse", time.perf_counter() - start_time)
+        else:
+            record_profile("parse")
+        return self._parse
+
+    def copy(self) -> Expression:
+        """Return a private copy of the AST that the caller may modify."""
+        return self.parse.copy()
+
+    def transpile(self, dialect: str) -> str:
+        """
+        Generate the query in another dialect. Same as
+        sqlglot.transpile(sql, read=self.dialect, write=dialect)[0].
+        """
+        if dialect not in self._transpile:
+            parsed = self.parse
+            start_time = time.perf_counter()
+            self._transpile[dialect] = parsed.sql(dialect=dialect)
+            record_profile("transpile", time.perf_counter() - start_time)
+        else:
+            record_profile("transpile")
+        return self._transpile[dialect]
+
+    def fingerprint(self, comments: bool = True) -> Fingerprint:
+        """
+        Hash of the canonical text of the query.
+
+        The canonical text is generated from the AST, so whitespace, keyword
+        casing and the casing of unquoted identifiers do not change it. If the
+        query cannot be parsed (e.g. it is still being typed), the raw text is
+        hashed instead.
+
+        The generator may move a comment to a neighbouring token, e.g.
+        "a, /*C*/ b" becomes "a /* C */, b", but "a,\n/*C*/ b" becomes
+        "a, b /* C */". So comments are not generated. Instead, each comment of
+        the raw text is added with the number of tokens before it, which keeps
+        the position of the cursor identifier.
+
+        Args:
+            comments: Whether comments are part of the canonical text. Keep
+            them when the cached value embeds them, e.g. the cursor identifier.
+        """
+        if comments not in self._fingerprint:
+            try:
+                canonical = self.parse.sql(
+                    dialect=self.dialect, normalize=True, comments=False
+                )
+                if comments:
+                    token_list = Dialect.get_or_raise(self.dialect).tokenize(self.sql)
+                    start_list = [token.start for token in token_list]
+                    end_list = [token.end for token in token_list]
+                    for match in COMMENT_PATTERN.finditer(self.sql):
+                        index = bisect.bisect_left(end_list, match.start())
+                        if index < len(token_list) and start_list[index] <= match.start():
+                            # Inside a string literal or a quoted identifier
+                            continue
+                        canonical += f"\n{index}:{match.group()}"
+            except Exception:
+                self._fingerprint[comments] = self.text_fingerprint
+                return self.text_fingerprint
+            self._fingerprint[comments] = get_text_fingerprint(canonical)
+        return self._fingerprint[comments]
+
+    @property
+    def format(self) -> str:
+        """The formatted text. See format.format()."""
+        from format import format
+        return format(self.sql)
+
+    @property
+    def extract(self) -> Any:
+        """The extracted clauses. See extract.extract()."""
+        from extract import extract
+        return extract(self.sql)
+
+
+def get_query(sql: str, dialect: str | None = None) -> Query:
+    """
+    Return the shared query object of a SQL text.
+
+    Args:
+        sql: SQL text
+        dialect: Dialect to parse with. Defaults to the input dialect.
+
+    Returns:
+        Query: The same object for the same text and dialect
+    """
+    if dialect is None:
+        dialect = get_dialect_param()["input"]
+    text_fingerprint = get_text_fingerprint(sql)
+    key = (text_fingerprint, dialect)
+    with query_lock:
+        query = query_dict.get(key)
+        if query is None:
+            query = Query(sql, dialect, text_fingerprint)
+            query_dict[key] = query
+        return query
+
+# -----------------------------------------------------------------------------
+# Fingerprint
+# -----------------------------------------------------------------------------
+
+def get_text_fingerprint(text: str) -> Fingerprint:
+    """
+    Hash a text as it is, without parsing it. Used when the cached value
+    depends on the exact text, e.g. the output of format().
+    """
+    return Fingerprint(
+        hashlib.blake2b(text.encode("utf-8"), digest_size=FINGERPRINT_SIZE).hexdigest()
+    )
+
+
+def get_fingerprint(sql: str, comments: bool = True) -> Fingerprint:
+    """
+    Return the canonical fingerprint of a SQL query. See Query.fingerprint().
+
+    Example:
+        >>> get_fingerprint("select a from t") == get_fingerprint("SELECT  A\nFROM T")
+        True
+        >>> get_fingerprint("SELECT A FROM T /* x */", comments=False) == get_fingerprint("SELECT A FROM T")
+        True
+    """
+    return get_query(sql).fingerprint(comments)
@@ -13,6 +13,8 @@ import sys
 import re
 import traceback
 from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from sqlglot import exp, parse_one
 
 # -----------------------------------------------------------------------------
 # Path Configuration
@@ -32,7 +34,10 @@ sys.path.extend(
 # -----------------------------------------------------------------------------
 
 from extract import extract
+from query import get_query
 from param import get_dialect_param
+from sample_table import get_sample_table, is_large_table
+from db_api import get_python_list
 
 # -----------------------------------------------------------------------------
 # Global State
@@ -40,6 +45,16 @@ from param import get_dialect_param
 
 is_sample: bool = False
 
+"""
+Universe sampling keeps the rows whose join key hashes below the ratio times
+this number of buckets.
+"""
+UNIVERSE_BUCKET = 1000000
+
+# Suffix of the column holding the 95% confidence interval of an aggregate
+CI_SUFFIX = "_ci95"
+Z_95 = 1.96
+
 # -----------------------------------------------------------------------------
 # Sample State Management
 # -----------------------------------------------------------------------------
@@ -62,12 +77,302 @@ def get_sample() -> bool:
     return is_sample
 
 
+# -----------------------------------------------------------------------------
+# Universe Sampling
+# -----------------------------------------------------------------------------
+
+
+def get_universe_key(select: exp.Select) -> Optional[Dict[str, str]]:
+    """
+    Find the join key shared by the most large tables of a query.
+
+    The columns that the equality predicates of the JOIN ... ON and WHERE
+    clauses make equal form classes. The class that covers the most large
+    tables (see is_large_table) is the universe key, if it covers two.
+
+    Args:
+        select: The root SELECT of the query
+
+    Returns:
+        Optional[Dict[str, str]]: Alias of each large table to its column
+        in the key, or None if no key joins two large tables
+
+    Example:
+        >>> # ... FROM "store_sales" AS "ss" JOIN "store_returns" AS "sr"
+        >>> #     ON "ss"."ss_item_sk" = "sr"."sr_item_sk" ...
+        {'ss': 'ss_item_sk', 'sr': 'sr_item_sk'}
+    """
+    table_list = [select.args["from"].this] + [
+        join.this for join in select.args.get("joins") or []
+    ]
+    alias_to_table = {
+        table.alias_or_name: table.name
+        for table in table_list
+        if isinstance(table, exp.Table)
+    }
+
+    condition_list = [join.args.get("on") for join in select.args.get("joins") or []]
+    if select.args.get("where") is not None:
+        condition_list.append(select.args["where"].this)
+
+    # Union-find over (alias, column)
+    parent: Dict[Tuple[str, str], Tuple[str, str]] = {}
+
+    def find(node: Tuple[str, str]) -> Tuple[str, str]:
+        while parent.setdefault(node, node) != node:
+            node = parent[node]
+        return node
+
+    for condition in condition_list:
+        if condition is None:
+            continue
+        conjunct_list = (
+            condition.flatten() if isinstance(condition, exp.And) else [condition]
+        )
+        for conjunct in conjunct_list:
+            if not isinstance(conjunct, exp.EQ):
+                continue
+            left, right = conjunct.this, conjunct.expression
+            if (
+                isinstance(left, exp.Column)
+                and isinstance(right, exp.Column)
+                and left.table in alias_to_table
+                and right.table in alias_to_table
+                and left.table != right.table
+            ):
+                parent[find((left.table, left.name))] = find((right.table, right.name))
+
+    key_dict: Dict[Tuple[str, str], Dict[str, str]] = {}
+    for alias, column in sorted(parent):
+        if is_large_table(alias_to_table[alias]):
+            key_dict.setdefault(find((alias, column)), {}).setdefault(alias, column)
+
+    key_list: List[Dict[str, str]] = sorted(key_dict.values(), key=lambda key: -len(key))
+    if not key_list or len(key_list[0]) < 2:
+        return None
+    return key_list[0]
+
+
+def universe_sample_script(sql: str, sampling_ratio: float) -> Optional[str]:
+    """
+    Sample every large table of a join on the hash of the shared join key
+    (universe sampling). Rows that join keep matching in the sample, so a
+    join of two sampled tables keeps the sampling ratio instead of its
+    square.
+
+    Args:
+        sql: Original SQL query
+        sampling_ratio: Sampling ratio
+
+    Returns:
+        Optional[str]: The sampled query, or None if no join key is shared
+        by two large tables
+
+    Example:
+        >>> universe_sample_script(sql, 0.5)
+        # ... FROM (SELECT * FROM "store_sales" WHERE ABS(FNV_HASH("ss_item_sk"))
+        #     % 1000000 < 500000) AS "ss" JOIN (...) AS "sr" ...
+    """
+    try:
+        select = get_query(sql).copy()
+    except Exception:
+        return None
+    if not isinstance(select, exp.Select) or select.args.get("from") is None:
+        return None
+
+    universe_key = get_universe_key(select)
+    if universe_key is None:
+        return None
+
+    hash_function = (
+        "FNV_HASH" if get_dialect_param()["endpoint"] == "redshift" else "HASH"
+    )
+    table_list = [select.args["from"].this] + [
+        join.this for join in select.args.get("joins") or []
+    ]
+    for table in table_list:
+        if not isinstance(table, exp.Table) or table.alias_or_name not in universe_key:
+            continue
+        column = exp.column(universe_key[table.alias_or_name], quoted=True)
+        condition = exp.LT(
+            this=exp.Mod(
+                this=exp.Abs(
+                    this=exp.Anonymous(this=hash_function, expressions=[column])
+                ),
+                expression=exp.Literal.number(UNIVERSE_BUCKET),
+            ),
+            expression=exp.Literal.number(int(sampling_ratio * UNIVERSE_BUCKET)),
+        )
+        source = table.copy()
+        source.set("alias", None)
+        table.replace(
+            exp.Subquery(
+                this=exp.select("*").from_(source).where(condition),
+                alias=exp.TableAlias(
+                    this=exp.to_identifier(table.alias_or_name, quoted=True)
+                ),
+            )
+        )
+
+    return select.sql()
+
+
+# -----------------------------------------------------------------------------
+# Aggregate Scaling
+# -----------------------------------------------------------------------------
+
+
+def get_ci_expression(aggregate: exp.Expression, sampling_ratio: float) -> Optional[exp.Expression]:
+    """
+    Return the half-width of the 95% confidence interval of an aggregate
+    over a Bernoulli sample, from the Horvitz-Thompson variance estimator.
+
+    Example:
+        >>> # SUM(x) -> 1.96 * SQRT((1 - r) * SUM(x * x)) / r
+        >>> # COUNT(x) -> 1.96 * SQRT((1 - r) * COUNT(x)) / r
+        >>> # AVG(x) -> 1.96 * STDDEV_SAMP(x) / SQRT(COUNT(x))
+    """
+    if isinstance(aggregate.this, exp.Distinct):
+        return None
+    arg = aggregate.this.sql()
+    r = sampling_ratio
+    if isinstance(aggregate, exp.Sum):
+        square = f"CAST({arg} AS FLOAT) * CAST({arg} AS FLOAT)"
+        return parse_one(f"{Z_95} * SQRT({1 - r} * SUM({square})) / {r}")
+    if isinstance(aggregate, exp.Count):
+        return parse_one(f"{Z_95} * SQRT({1 - r} * COUNT({arg})) / {r}")
+    if isinstance(aggregate, exp.Avg):
+        return parse_one(
+            f"{Z_95} * STDDEV_SAMP(CAST({arg} AS FLOAT)) / SQRT(NULLIF(COUNT({arg}), 0))"
+        )
+    return None
+
+
+def scale_aggregate(sql: str, sampling_ratio: float) -> str:
+    """
+    Rewrite the aggregates of a sampled query so that they estimate the
+    aggregates of the whole data, and add a confidence interval column
+    (CI_SUFFIX) for each SUM, COUNT and AVG column. format_preview shows
+    the interval in the cell of the value.
+
+    SUM and COUNT, also inside HAVING or arithmetic, are scaled by the
+    inverse of the sampling ratio. AVG needs no scaling. COUNT(DISTINCT) and
+    window functions, e.g. SUM(x) OVER (...), are kept as is; an aggregate
+    inside a window, e.g. SUM(SUM(x)) OVER (), is scaled. Only the root
+    SELECT is rewritten.
+
+    Args:
+        sql: Sampled SQL query
+        sampling_ratio: Ratio the query was sampled with
+
+    Returns:
+        str: The rewritten query, or the query itself if it has no aggregate
+
+    Note:
+        For universe sampling the rows of a key are kept or dropped together,
+        so the interval is narrower than the true one for skewed keys.
+
+        A preview over sampled temporary tables is scaled by the ratio of
+        their rows (see get_sample_script). A temporary table that aggregates
+        a sample holds the raw sums of the sample, which a later query cannot
+        scale, so a preview over it is flagged sampled but has no ratio.
+
+    Example:
+        >>> scale_aggregate('SELECT SUM("x") AS "s" FROM ...', 0.25)
+        'SELECT (SUM("x") * 4.0) AS "s", 1.96 * SQRT(0.75 * SUM(...)) / 0.25 AS "s_ci95" FROM ...'
+    """
+    if sampling_ratio <= 0:
+        return sql
+
+    try:
+        select = get_query(sql).copy()
+    except Exception:
+        return sql
+    if not isinstance(select, exp.Select) or select.find(exp.Sum, exp.Count, exp.Avg) is None:
+        return sql
+
+    # The intervals go last, so that ORDER BY positions keep their meaning
+    ci_list = []
+    for expression in select.expressions:
+        aggregate = expression.this if isinstance(expression, exp.Alias) else expression
+        # A window function is not an aggregate of the group, see above
+        ci = (
+            get_ci_expression(aggregate, sampling_ratio)
+            if isinstance(aggregate, (exp.Sum, exp.Count, exp.Avg))
+            else None
+        )
+        if ci is not None:
+            ci_list.append(
+                exp.alias_(ci, f"{expression.alias_or_name}{CI_SUFFIX}", quoted=True)
+            )
+    select.set("expressions", [*select.expressions, *ci_list])
+
+    scale = exp.Literal.number(1 / sampling_ratio)
+    for clause in [*select.expressions, select.args.get("having")]:
+        if clause is None or clause.alias_or_name.endswith(CI_SUFFIX):
+            continue
+        for node in list(clause.find_all(exp.Sum, exp.Count)):
+            if not isinstance(node.this, exp.Distinct) and not isinstance(
+                node.parent, exp.Window
+            ):
+                node.replace(exp.Paren(this=exp.Mul(this=node.copy(), expression=scale.copy())))
+
+    return select.sql()
+
+
+def get_relative_error(value_list: List[Sequence[Any]], column_list: List[str]) -> Optional[float]:
+    """
+    Return the largest half-width of the confidence intervals of a sampled
+    result relative to its value (see scale_aggregate).
+
+    Args:
+        value_list: Values of each column of the result (see fetch_column)
+        column_list: Column names of the result
+
+    Returns:
+        Optional[float]: None if the result has no interval column
+
+    Example:
+        >>> get_relative_error([(1200,), (36,)], ["s", "s_ci95"])
+        0.03
+    """
+    index_dict = {column.lower(): i for i, column in enumerate(column_list)}
+    pair_list = [
+        (index_dict[column[: -len(CI_SUFFIX)]], i)
+        for column, i in index_dict.items()
+        if column.endswith(CI_SUFFIX) and column[: -len(CI_SUFFIX)] in index_dict
+    ]
+    if not pair_list:
+        return None
+
+    error = 0.0
+    # Only the interval columns and their values become Python objects
+    for value_index, ci_index in pair_list:
+        for value, ci in zip(
+            get_python_list(value_list[value_index]), get_python_list(value_list[ci_index])
+        ):
+            try:
+                value, ci = float(value), float(ci)
+            except (TypeError, ValueError):
+                continue
+            if value != 0:
+                error = max(error, abs(ci / value))
+    return error
+
+
 # -----------------------------------------------------------------------------
 # Query Sampling
 # -----------------------------------------------------------------------------
 
 
-def sample_script(sql: str, retry_time: int) -> str:
+def sample_script(sql: str, retry_time: int, scale: bool = False) -> str:
+    """Returns the sampled query of get_sample_script()."""
+    return get_sample_script(sql, retry_time, scale)[0]
+
+
+def get_sample_script(
+    sql: str, retry_time: int, scale: bool = False, table_ratio: Optional[float] = 1.0
+) -> Tuple[str, float]:
     """
     Modifies SQL query to sample data based on retry count.
     Now supports Redshift and Snowflake.
@@ -75,25 +380,60 @@ def sample_script(sql: str, retry_time: int) -> str:
     Args:
         sql: Original SQL query
         retry_time: Number of retry attempts
+        scale: Whether to scale the aggregates to the whole data and add
+            confidence intervals (see scale_aggregate). Only for previews,
+            temporary tables keep the sampled values.
+        table_ratio: Fraction of the rows held by the temporary tables the
+            query reads (see TemporaryTablePool.get_ratio). The aggregates
+            are scaled by it as well, also if the query itself is not
+            sampled. None if a table holds aggregates of a sample, which
+            cannot be scaled.
 
     Returns:
-        str: Modified SQL query with sampling if applicable,
-             original query otherwise
-    
+        Tuple[str, float]: Modified SQL query with sampling if applicable,
+             original query otherwise, and the sampling ratio applied
+
     Raises:
         Exception: If the database is not supported
 
     Note:
-        Sampling reduces data by factor of 2^retry_time
+        Sampling reduces data by factor of 2^retry_time, or more if a
+        prebuilt sample table is used (see sample_table)
+    """
+    sampled_query, sampling_ratio = get_sampled_query(sql, retry_time)
+    if not scale or table_ratio is None or sampling_ratio * table_ratio >= 1.0:
+        return sampled_query, sampling_ratio
+
+    from format import format
+
+    return (
+        format(scale_aggregate(sampled_query, sampling_ratio * table_ratio)),
+        sampling_ratio,
+    )
+
+
+def get_sampled_query(sql: str, retry_time: int) -> Tuple[str, float]:
+    """
+    Returns the sampled query of get_sample_script(), before its aggregates
+    are scaled, and the sampling ratio applied.
     """
     if retry_time == 0:
-        return sql
+        return sql, 1.0
+
+    from format import format
+
+    sampling_ratio = 1 / (2**retry_time)
+
+    # Joins of large tables are sampled consistently on their join key
+    universe_query = universe_sample_script(sql, sampling_ratio)
+    if universe_query is not None:
+        return format(universe_query), sampling_ratio
 
     try:
         from_clause = extract(sql)["from"]
     except Exception:
         traceback.print_exc()
-        return sql
+        return sql, 1.0
 
     # Verify single table reference pattern exists
     table_pattern = (
@@ -102,12 +442,22 @@ def sample_script(sql: str, retry_time: int) -> str:
     )
 
     if sql.lower().count(table_pattern.lower()) != 1:
-        return sql
+        return sql, 1.0
 
     # Apply sampling transformation
-    sampling_ratio = 1 / (2**retry_time)
-    
-    if get_dialect_param()["endpoint"] == "redshift":
+    sample_table = get_sample_table(from_clause[0]["name"], sampling_ratio)
+
+    if sample_table is not None:
+        # Read a prebuilt sample, which may be smaller than the ratio asked
+        sampling_ratio = sample_table[1]
+        sampled_query = re.sub(
+            table_pattern,
+            f"FROM {sample_table[0]} AS {from_clause[0]['alias']}",
+            sql,
+            flags=re.IGNORECASE,
+        )
+
+    elif get_dialect_param()["endpoint"] == "redshift":
         sampled_query = re.sub(
             table_pattern,
             f"FROM (SELECT * FROM {from_clause[0]['name']} "
@@ -118,10 +468,12 @@ def sample_script(sql: str, retry_time: int) -> str:
         )
         
     elif get_dialect_param()["endpoint"] == "snowflake":
+        # TABLESAMPLE takes whole percents, and 0 PERCENT returns no row
+        sampling_ratio = max(int(sampling_ratio * 100) / 100, 0.01)
         sampled_query = re.sub(
             table_pattern,
             f"FROM (SELECT * FROM {from_clause[0]['name']} "
-            f"TABLESAMPLE ({int(sampling_ratio * 100)} PERCENT) "
+            f"TABLESAMPLE ({round(sampling_ratio * 100)} PERCENT) "
             f"AS {from_clause[0]['alias']}",
             sql,
             flags=re.IGNORECASE,
@@ -130,5 +482,4 @@ def sample_script(sql: str, retry_time: int) -> str:
     else:
         raise Exception("Unsupported database")
 
-    from format import format
-    return format(sampled_query)
+    return format(sampled_query), sampling_ratio
@@ -0,0 +1,293 @@
+# Copyright (c) 2025 Haoyu Li
+# Released under the MIT License.
+# See LICENSE file in the project root for details.
+
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Sample Table Module
+===================
+
+This module builds and maintains persistent sample tables of the largest
+tables, so that sampled statements read a small table instead of scanning
+the whole fact table with WHERE RANDOM() < ratio (see sample_script).
+
+Key Features:
+    - 10%, 1% and 0.1% samples of each table of at least
+      --sample-table-min-size MB, each built from the next larger sample
+    - Rebuilt when the row count of a sample drifts from its base table
+    - Built on a connection of its own, only while the warehouse is idle,
+      and checked again every --sample-table-refresh-interval seconds
+    - Table-size catalog, which decides the tables that are large enough
+      to be sampled
+
+Note:
+    Sample tables are only built on Redshift. Snowflake's TABLESAMPLE
+    already skips micro-partitions.
+"""
+
+import sys
+import time
+import threading
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+# -----------------------------------------------------------------------------
+# Path Configuration
+# -----------------------------------------------------------------------------
+
+root_dir = str(Path(__file__).parent.parent)
+sys.path.extend(
+    [
+        root_dir,
+        str(Path(root_dir) / "src"),
+        str(Path(root_dir) / "util"),
+    ]
+)
+
+# -----------------------------------------------------------------------------
+# Local Imports
+# -----------------------------------------------------------------------------
+
+from param import (
+    get_db_param,
+    get_dialect_param,
+    get_load_param,
+    get_sample_table_param,
+    get_system_name,
+    get_test_param,
+)
+from db_api import new_db_cursor, get_cursor
+from concurrency import get_explain_cursor_lock
+from schema import get_schema
+from load import get_load
+from log import log
+
+# -----------------------------------------------------------------------------
+# Global Variables
+# -----------------------------------------------------------------------------
+
+# Sampling ratios of the sample tables, largest first
+SAMPLE_RATIO_LIST = [0.1, 0.01, 0.001]
+
+"""
+A sample is rebuilt when its row count is off from the ratio of its base
+table by more than this fraction, e.g. after the base table was loaded again.
+"""
+SAMPLE_DRIFT = 0.05
+
+# Maps a table name (upper case, not quoted) to its sample tables by ratio
+sample_table: Dict[str, Dict[float, str]] = {}
+sample_table_lock = threading.Lock()
+
+# Maps a table name (upper case, not quoted) to its size in MB
+table_size_catalog: Optional[Dict[str, float]] = None
+table_size_catalog_lock = threading.Lock()
+
+# Seconds before reading the table sizes again after a failure
+TABLE_SIZE_RETRY = 60.0
+table_size_retry_time = 0.0
+
+# -----------------------------------------------------------------------------
+# Sample Table Names
+# -----------------------------------------------------------------------------
+
+
+def get_sample_schema() -> str:
+    """Returns the schema of the sample tables."""
+    return f"{get_system_name().lower()}_sample"
+
+
+def get_sample_table_name(table_name: str, ratio: float) -> str:
+    """
+    Returns the name of the sample of a table, unqualified.
+
+    Example:
+        >>> get_sample_table_name("STORE_SALES", 0.01)
+        'store_sales_10'
+    """
+    return f"{table_name.lower()}_{round(ratio * 1000)}"
+
+
+def get_sample_table(table_name: str, sampling_ratio: float) -> Optional[Tuple[str, float]]:
+    """
+    Return the largest sample table of a table no larger than the requested
+    sampling ratio.
+
+    Args:
+        table_name: Table name, possibly quoted
+        sampling_ratio: Requested sampling ratio
+
+    Returns:
+        Optional[Tuple[str, float]]: Qualified name and ratio of the sample
+        table, or None if no sample table fits
+
+    Example:
+        >>> get_sample_table('"store_sales"', 0.25)
+        ('speql_sample."store_sales_100"', 0.1)
+    """
+    with sample_table_lock:
+        ratio_to_name = sample_table.get(table_name.replace('"', "").upper(), {})
+        ratio_list = [ratio for ratio in ratio_to_name if ratio <= sampling_ratio]
+        if not ratio_list:
+            return None
+        ratio = max(ratio_list)
+        return ratio_to_name[ratio], ratio
+
+
+def get_table_size_catalog() -> Dict[str, float]:
+    """
+    Return the size in MB of the tables of the search path. Read once, on
+    first use, from SVV_TABLE_INFO on Redshift or INFORMATION_SCHEMA.TABLES
+    on Snowflake.
+
+    Note:
+        If the read fails, e.g. on a transient connection error at startup,
+        no table is large until it is read again TABLE_SIZE_RETRY seconds
+        later.
+    """
+    global table_size_catalog, table_size_retry_time
+
+    with table_size_catalog_lock:
+        if table_size_catalog is not None:
+            return table_size_catalog
+        if time.time() < table_size_retry_time:
+            return {}
+
+        search_path = get_db_param()["search_path"]
+        if get_dialect_param()["endpoint"] == "redshift":
+            script = f"""
+SELECT "table", "size" FROM svv_table_info WHERE "schema" = '{search_path}'
+"""
+        else:
+            script = f"""
+SELECT table_name, bytes / 1048576 FROM information_schema.tables
+WHERE table_schema = UPPER('{search_path}')
+"""
+        try:
+            with get_explain_cursor_lock():
+                get_cursor()["explain"].execute(script)
+                row_list = get_cursor()["explain"].fetchall()
+            table_size_catalog = {row[0].upper(): float(row[1] or 0) for row in row_list}
+        except Exception as e:
+            log("error.txt", f"Cannot read table sizes: {e}")
+            table_size_retry_time = time.time() + TABLE_SIZE_RETRY
+            return {}
+        return table_size_catalog
+
+
+def is_large_table(table_name: str) -> bool:
+    """
+    Return whether a table has at least --sample-table-min-size MB.
+
+    Args:
+        table_name: Table name, possibly quoted
+    """
+    size = get_table_size_catalog().get(table_name.replace('"', "").upper(), 0.0)
+    return size >= get_sample_table_param()["min_size"]
+
+
+# -----------------------------------------------------------------------------
+# Sample Table Maintenance
+# -----------------------------------------------------------------------------
+
+
+def get_table_size(cursor) -> Dict[Tuple[str, str], Tuple[float, int]]:
+    """
+    Read the size in MB and the row count of the tables of the search path
+    and of the sample schema from SVV_TABLE_INFO.
+
+    Returns:
+        Dict[Tuple[str, str], Tuple[float, int]]: (schema, table) to (size, rows)
+    """
+    cursor.execute(
+        f"""
+SELECT "schema", "table", "size", tbl_rows FROM svv_table_info
+WHERE "schema" IN ('{get_db_param()["search_path"]}', '{get_sample_schema()}')
+"""
+    )
+    return {(row[0], row[1]): (row[2], row[3]) for row in cursor.fetchall()}
+
+
+def build_sample_table(cursor) -> None:
+    """
+    Build the missing or drifted samples of every table of at least
+    --sample-table-min-size MB. The 10% sample is taken from the table, and
+    each smaller sample from the previous one.
+    """
+    cursor.execute(f"CREATE SCHEMA IF NOT EXISTS {get_sample_schema()};")
+    table_size = get_table_size(cursor)
+    search_path = get_db_param()["search_path"]
+
+    for (schema_name, table_name), (size, rows) in table_size.items():
+        if (
+            schema_name != search_path
+            or table_name.upper() not in get_schema()
+            or size < get_sample_table_param()["min_size"]
+        ):
+            continue
+
+        source, source_ratio = table_name, 1.0
+        for ratio in SAMPLE_RATIO_LIST:
+            name = get_sample_table_name(table_name, ratio)
+            qualified_name = f'{get_sample_schema()}."{name}"'
+            expected = rows * ratio
+            sample_rows = table_size.get((get_sample_schema(), name), (0, None))[1]
+
+            if sample_rows is None or abs(sample_rows - expected) > SAMPLE_DRIFT * expected:
+                """
+                Previews may read the current sample while the new one is
+                built, so it is built under another name and swapped in
+                within one transaction.
+                """
+                building_name = f'{get_sample_schema()}."{name}_new"'
+                try:
+                    cursor.execute(f"DROP TABLE IF EXISTS {building_name};")
+                    cursor.execute(
+                        f"CREATE TABLE {building_name} AS SELECT * FROM {source} "
+                        f"WHERE RANDOM() < {ratio / source_ratio};"
+                    )
+                    cursor.execute("BEGIN;")
+                    try:
+                        cursor.execute(f"DROP TABLE IF EXISTS {qualified_name};")
+                        cursor.execute(f'ALTER TABLE {building_name} RENAME TO "{name}";')
+                        cursor.execute("COMMIT;")
+                    except Exception:
+                        cursor.execute("ROLLBACK;")
+                        raise
+                    log("sample_table.txt", f"Built {qualified_name} from {source}")
+                except Exception as e:
+                    log("error.txt", f"Cannot build {qualified_name}: {e}")
+                    break
+
+            with sample_table_lock:
+                sample_table.setdefault(table_name.upper(), {})[ratio] = qualified_name
+            source, source_ratio = qualified_name, ratio
+
+
+def maintain_sample_table() -> None:
+    """
+    Build the sample tables, then check them again every
+    --sample-table-refresh-interval seconds. Building waits until the
+    warehouse is idle (see load), so that it runs off-hours.
+
+    Example:
+        >>> threading.Thread(target=maintain_sample_table, daemon=True).start()
+    """
+    if get_dialect_param()["endpoint"] != "redshift":
+        return
+
+    cursor = new_db_cursor(test=get_test_param()["skip_create"])
+    # Samples of large tables take longer than a preview may
+    cursor.execute("set statement_timeout to 0;")
+
+    while True:
+        if get_load()["level"] != "idle":
+            time.sleep(get_load_param()["interval"])
+            continue
+        try:
+            build_sample_table(cursor)
+        except Exception as e:
+            log("error.txt", f"Cannot build sample tables: {e}")
+        time.sleep(get_sample_table_param()["refresh_interval"])
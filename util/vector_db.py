@@ -45,6 +45,8 @@ from param import (
 from llm_api import get_embedding
 from log import append_test_info
 from concurrency import get_load_vector_db_lock
+from query import get_fingerprint
+from cache import BoundedCache
 
 # -----------------------------------------------------------------------------
 # Global State
@@ -52,7 +54,7 @@ from concurrency import get_load_vector_db_lock
 
 dataset: Optional[List[str]] = None
 vector_database: Optional[Any] = None
-useful_historical_sql_dict: Dict[str, str] = {}
+useful_historical_sql_dict = BoundedCache("useful_historical_sql")
 
 # -----------------------------------------------------------------------------
 # Dataset Management
@@ -130,8 +132,10 @@ def get_useful_historical_sql(sql: str) -> str:
     sql = sql.replace(get_plugin_param()["cursor_identifier"], "")
 
     # Return cached result if available
-    if sql in useful_historical_sql_dict:
-        return useful_historical_sql_dict[sql]
+    sql_key = get_fingerprint(sql, comments=False)
+    cached_sql = useful_historical_sql_dict.get(sql_key)
+    if cached_sql is not None:
+        return cached_sql
 
     # Find most similar query
     embedding = get_embedding(sql)
@@ -139,7 +143,7 @@ def get_useful_historical_sql(sql: str) -> str:
     _, index = vector_database.search(embedding, 1)
 
     useful_historical_sql = dataset[index[0][0]]
-    useful_historical_sql_dict[sql] = useful_historical_sql
+    useful_historical_sql_dict[sql_key] = useful_historical_sql
 
     if get_test_param()["output_useful_historical_sql"]:
         append_test_info("useful_historical_sql", useful_historical_sql)